@@ -1,12 +1,15 @@
-import json
-import subprocess
 from datetime import timedelta
 
+import docker
+import requests
+
 from fastapi import (
     Depends,
     FastAPI,
     Form,
     HTTPException,
+    Request,
+    Response,
     status,
     Body,
 )
@@ -16,13 +19,24 @@ from routers.v2 import router as v2_router
 from auth import (
     create_access_token,
     get_current_user,
+    get_metrics_user,
     ACCESS_TOKEN_EXPIRE_MINUTES,
     ADMIN_USER,
     ADMIN_PASSWORD,
 )
 
 # IMPORTANT: we import the snapshot loop
-from services.snapshot import start_snapshot_loop
+from services.snapshot import get_running_containers, resolve_container, start_snapshot_loop
+from services.stats_collector import get_latest_stats
+from services.docker_client import client as docker_client, run_docker_io
+from services.docker_service_v3 import (
+    _classify_state,
+    _collect_stats,
+    _uptime_seconds,
+)
+from services.metrics import format_cpu, format_mem, format_net
+from services.perf import PerfMiddleware, start_loop_lag_monitor
+from services.prometheus import CONTENT_TYPE as METRICS_CONTENT_TYPE, get_metrics_body
 
 # --- FastAPI App Initialization ---
 app = FastAPI(title="Docker Monitor")
@@ -34,88 +48,103 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# per-route latency histograms for /api/v2/debug/perf
+app.add_middleware(PerfMiddleware)
 
 # startup event: start the background refresh loop
 @app.on_event("startup")
 async def _on_startup():
     # start the loop that keeps the stack snapshot in memory
     await start_snapshot_loop()
+    start_loop_lag_monitor()
 
 # Register /api/v2 routes
 app.include_router(v2_router)
 
 
 # --- Docker Service Logic (v1 legacy) ---
-def get_docker_statuses():
+def _v1_port(container) -> str:
     """
-    v1 logic legacy (dashboard viejo). Usa docker CLI via subprocess.
+    First published port as "0.0.0.0:8080" (what `docker ps` showed before "->").
     """
-    try:
-        ps_cmd = [
-            "docker", "ps",
-            "--format", "{{json .}}"
-        ]
-        ps_result = subprocess.run(ps_cmd, capture_output=True, text=True, check=True)
+    port_map = container.attrs.get("NetworkSettings", {}).get("Ports") or {}
+    for bindings in port_map.values():
+        for b in bindings or []:
+            return f"{b.get('HostIp', '')}:{b.get('HostPort', '')}"
+    return "N/A"
 
-        output_lines = ps_result.stdout.strip().split('\n')
-        if not output_lines or not output_lines[0]:
-            return []  # No containers running
 
-        running_containers_ps = [json.loads(line) for line in output_lines]
+def _v1_running_for(container) -> str:
+    """
+    `docker ps` RunningFor ("2 hours ago", counted from Created), the uptime
+    text the old CLI-based /api/status returned (same rounding as the CLI).
+    """
+    created = container.attrs.get("Created")
+    if not created:
+        return "N/A"
+    secs = _uptime_seconds(created)
+    if secs < 1:
+        return "Less than a second ago"
+    if secs < 60:
+        text = "1 second" if secs == 1 else f"{secs} seconds"
+    elif secs < 3600:
+        mins = secs // 60
+        text = "About a minute" if mins == 1 else f"{mins} minutes"
+    else:
+        hours = int(secs / 3600 + 0.5)
+        if hours == 1:
+            text = "About an hour"
+        elif hours < 48:
+            text = f"{hours} hours"
+        elif hours < 24 * 7 * 2:
+            text = f"{hours // 24} days"
+        elif hours < 24 * 30 * 2:
+            text = f"{hours // 24 // 7} weeks"
+        elif hours < 24 * 365 * 2:
+            text = f"{hours // 24 // 30} months"
+        else:
+            text = f"{secs // 3600 // 24 // 365} years"
+    return text + " ago"
+
+
+def _v1_status(container, m) -> dict:
+    return {
+        "id": container.short_id,
+        "name": container.name,
+        "status": _classify_state(container),
+        "uptime": _v1_running_for(container),
+        "port": _v1_port(container),
+        "ram_usage": format_mem(m),
+        "cpu_usage": format_cpu(m),
+        "net_usage": format_net(m),
+    }
+
+
+def get_snapshot_statuses():
+    """
+    v1 /api/status from the in-memory registry + live stats collector (the
+    same data the v2 API uses): no daemon calls, so the cost doesn't depend
+    on how many dashboards poll. None until the registry is seeded.
+    """
+    running = get_running_containers()
+    if running is None:
+        return None
+    return [_v1_status(c, get_latest_stats(c.id)) for c in running]
 
-        stats_cmd = [
-            "docker", "stats", "--no-stream",
-            "--format", "{{json .}}"
-        ]
-        stats_result = subprocess.run(stats_cmd, capture_output=True, text=True, check=True)
-
-        stats_lines = stats_result.stdout.strip().split('\n')
-        running_containers_stats = {}
-        if stats_lines and stats_lines[0]:
-            for line in stats_lines:
-                stat = json.loads(line)
-                running_containers_stats[stat["ID"]] = stat
-
-        status_list = []
-        for container_ps in running_containers_ps:
-            container_id = container_ps.get("ID")
-            stats = running_containers_stats.get(container_id, {})
-
-            health = container_ps.get("State", "stopped")
-            if "unhealthy" in health:
-                status_val = "unhealthy"
-            elif "running" in health or "healthy" in health:
-                status_val = "running"
-            else:
-                status_val = "stopped"
-
-            net_io = stats.get("NetIO", "N/A")
-            if "/" in net_io:
-                parts = net_io.split("/")
-                net_usage_val = f"{parts[0].strip()} / {parts[1].strip()}"
-            else:
-                net_usage_val = net_io
-
-            ports_val = container_ps.get("Ports", "")
-            if "->" in ports_val:
-                ports_val = ports_val.split("->")[0]
-            else:
-                ports_val = "N/A"
-
-            status_list.append({
-                "id": container_id,
-                "name": container_ps.get("Names", "N/A"),
-                "status": status_val,
-                "uptime": container_ps.get("RunningFor", "N/A"),
-                "port": ports_val,
-                "ram_usage": stats.get("MemUsage", "N/A"),
-                "cpu_usage": stats.get("CPUPerc", "N/A"),
-                "net_usage": net_usage_val,
-            })
-        return status_list
-
-    except (FileNotFoundError, subprocess.CalledProcessError):
-        # fallback mock
+
+def get_docker_statuses():
+    """
+    v1 logic legacy (dashboard viejo). Running containers + one-shot stats,
+    through the shared Docker SDK client. Only used before the snapshot
+    registry is seeded.
+    """
+    try:
+        running = docker_client.containers.list()
+        stats_map = _collect_stats(running)
+        return [_v1_status(c, stats_map.get(c.id)) for c in running]
+
+    except (docker.errors.DockerException, requests.RequestException):
+        # daemon unreachable (or timing out): fallback mock
         return [
             {"id": "mock1", "name": "Evolution API", "status": "running", "uptime": "6h", "port": "8080",
              "ram_usage": "128MiB / 512MiB", "cpu_usage": "5.12%", "net_usage": "10MB / 5MB"},
@@ -128,47 +157,53 @@ def get_docker_statuses():
         ]
 
 
+async def _get_container(container_id: str):
+    try:
+        return await resolve_container(container_id)
+    except docker.errors.NotFound:
+        raise HTTPException(status_code=404, detail=f"Container {container_id} not found")
+
+
 # --- API Endpoints v1 (legacy) ---
 
 @app.post("/api/containers/{container_id}/start")
 async def start_container(container_id: str, user: str = Depends(get_current_user)):
+    container = await _get_container(container_id)
     try:
-        subprocess.run(["docker", "start", container_id], check=True)
+        await run_docker_io(container.start)
         return {"message": f"Container {container_id} started successfully."}
-    except subprocess.CalledProcessError as e:
+    except docker.errors.APIError as e:
         raise HTTPException(status_code=500, detail=f"Failed to start container {container_id}: {e}")
 
 
 @app.post("/api/containers/{container_id}/restart")
 async def restart_container(container_id: str, user: str = Depends(get_current_user)):
+    container = await _get_container(container_id)
     try:
-        subprocess.run(["docker", "restart", container_id], check=True)
+        await run_docker_io(container.restart)
         return {"message": f"Container {container_id} restarted successfully."}
-    except subprocess.CalledProcessError as e:
+    except docker.errors.APIError as e:
         raise HTTPException(status_code=500, detail=f"Failed to restart container {container_id}: {e}")
 
 
 @app.post("/api/containers/{container_id}/stop")
 async def stop_container(container_id: str, user: str = Depends(get_current_user)):
+    container = await _get_container(container_id)
     try:
-        subprocess.run(["docker", "stop", container_id], check=True)
+        await run_docker_io(container.stop)
         return {"message": f"Container {container_id} stopped successfully."}
-    except subprocess.CalledProcessError as e:
+    except docker.errors.APIError as e:
         raise HTTPException(status_code=500, detail=f"Failed to stop container {container_id}: {e}")
 
 
 @app.get("/api/containers/{container_id}/logs")
 async def get_container_logs(container_id: str, lines: int = 100, user: str = Depends(get_current_user)):
+    container = await _get_container(container_id)
     try:
-        result = subprocess.run(
-            ["docker", "logs", "--tail", str(lines), container_id],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return {"logs": result.stdout}
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"Failed to get logs for container {container_id}: {e.stderr}")
+        raw = await run_docker_io(container.logs, tail=lines)
+        return {"logs": raw.decode("utf-8", errors="replace")}
+    except docker.errors.APIError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get logs for container {container_id}: {e}")
 
 
 @app.post("/api/containers/{container_id}/exec")
@@ -178,30 +213,26 @@ async def exec_container_command(
     user: str = Depends(get_current_user)
 ):
     """
-    Run a shell command inside a container using `docker exec`.
+    Run a shell command inside a container (one-shot exec through the SDK).
     Expects JSON body: { "command": "<string>" }
+    The v2 frontend uses the interactive session at /api/v2/containers/{id}/exec.
     """
     command = payload.get("command")
     if not command:
         raise HTTPException(status_code=400, detail="Missing 'command' in request body")
 
+    container = await _get_container(container_id)
     try:
-        result = subprocess.run(
-            ["docker", "exec", container_id, "sh", "-c", command],
-            capture_output=True,
-            text=True,
-            check=False
-        )
-        return {
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "returncode": result.returncode,
-        }
-    except FileNotFoundError:
-        raise HTTPException(
-            status_code=500,
-            detail="Docker CLI not available in backend container"
-        )
+        result = await run_docker_io(container.exec_run, ["sh", "-c", command], demux=True)
+    except docker.errors.APIError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to exec in container {container_id}: {e}")
+
+    stdout, stderr = result.output or (None, None)
+    return {
+        "stdout": (stdout or b"").decode("utf-8", errors="replace"),
+        "stderr": (stderr or b"").decode("utf-8", errors="replace"),
+        "returncode": result.exit_code,
+    }
 
 
 @app.post("/api/login")
@@ -225,7 +256,29 @@ async def get_status(user: str = Depends(get_current_user)):
     """
     Legacy /api/status para Dashboard.js viejo.
     """
-    return get_docker_statuses()
+    statuses = get_snapshot_statuses()
+    if statuses is None:
+        statuses = await run_docker_io(get_docker_statuses)
+    return statuses
+
+
+@app.get("/metrics")
+async def prometheus_metrics(request: Request, user: str = Depends(get_metrics_user)):
+    """
+    Prometheus exposition: per-container and per-stack gauges plus the
+    backend's own collector numbers. Rendered once per snapshot refresh
+    cycle and served from cache. Scrape with `bearer_token: $METRICS_TOKEN`.
+    """
+    encoding = "gzip" if "gzip" in request.headers.get("accept-encoding", "") else "identity"
+    headers = {"Cache-Control": "no-cache"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+        headers["Vary"] = "Accept-Encoding"
+    return Response(
+        content=get_metrics_body(encoding),
+        media_type=METRICS_CONTENT_TYPE,
+        headers=headers,
+    )
 
 
 @app.get("/healthz")
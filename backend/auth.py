@@ -1,9 +1,16 @@
+import hashlib
+import hmac
 import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from fastapi import HTTPException, Header, status
 from jose import JWTError, jwt
 from dotenv import load_dotenv
 
+from services.perf import timed
+
 # Load environment variables (SECRET_KEY, ADMIN_USER, etc.)
 load_dotenv()
 
@@ -12,6 +19,24 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 ADMIN_USER = os.getenv("ADMIN_USER")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
+# Static bearer token for Prometheus scrapes of /metrics (JWTs expire too
+# fast for a scrape config). Unset -> /metrics only accepts a normal JWT.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or None
+
+# Verified-token cache: polling clients send the same token on every
+# request, so the HMAC check + JSON decode is done once per token instead
+# of once per request. Keyed by a hash of the signing key and the token (the
+# raw token is never stored), so rotating SECRET_KEY drops every entry; an
+# entry never outlives the token's own `exp` and is re-checked against
+# ADMIN_USER on every hit.
+TOKEN_CACHE_MAX_ENTRIES = 1024
+TOKEN_CACHE_TTL_SEC = 300
+
+# token hash -> (username, expires_at epoch)
+_token_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+_token_cache_hits = 0
+_token_cache_misses = 0
 
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
@@ -28,6 +53,82 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     return encoded_jwt
 
 
+def _token_key(token: str) -> bytes:
+    return hashlib.blake2b(f"{SECRET_KEY}\0{token}".encode(), digest_size=16).digest()
+
+
+def _cached_username(key: bytes, now: float) -> str | None:
+    global _token_cache_hits, _token_cache_misses
+    with _token_cache_lock:
+        entry = _token_cache.get(key)
+        if entry is not None and entry[1] > now:
+            _token_cache.move_to_end(key)
+            _token_cache_hits += 1
+            return entry[0]
+        if entry is not None:
+            del _token_cache[key]
+        _token_cache_misses += 1
+        return None
+
+
+def _cache_username(key: bytes, username: str, payload: dict, now: float):
+    expires_at = now + TOKEN_CACHE_TTL_SEC
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        expires_at = min(expires_at, exp)
+    with _token_cache_lock:
+        _token_cache[key] = (username, expires_at)
+        _token_cache.move_to_end(key)
+        while len(_token_cache) > TOKEN_CACHE_MAX_ENTRIES:
+            _token_cache.popitem(last=False)
+
+
+def get_token_cache_stats() -> dict:
+    """
+    Size and hit rate of the verified-token cache.
+    """
+    with _token_cache_lock:
+        lookups = _token_cache_hits + _token_cache_misses
+        return {
+            "size": len(_token_cache),
+            "max_entries": TOKEN_CACHE_MAX_ENTRIES,
+            "hits": _token_cache_hits,
+            "misses": _token_cache_misses,
+            "hit_rate": round(_token_cache_hits / lookups, 4) if lookups else None,
+        }
+
+
+def verify_token(token: str) -> str:
+    """
+    Verifies a raw JWT and returns its username.
+    Raises HTTPException if the token is invalid.
+    Used directly by endpoints that can't send an Authorization header (WebSockets).
+    Valid tokens are cached (see TOKEN_CACHE_*); invalid ones are not.
+    """
+    now = time.time()
+    key = _token_key(token)
+    username = _cached_username(key, now)
+    if username is not None and username == ADMIN_USER:
+        return username
+
+    try:
+        with timed("auth.jwt_decode"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token",
+        )
+    username: str = payload.get("sub")
+    if username is None or username != ADMIN_USER:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token",
+        )
+    _cache_username(key, username, payload, now)
+    return username
+
+
 async def get_current_user(authorization: str | None = Header(default=None)):
     """
     Dependency to get the current user from the access token in the Authorization header.
@@ -40,21 +141,26 @@ async def get_current_user(authorization: str | None = Header(default=None)):
         )
     try:
         token_type, token = authorization.split()
-        if token_type.lower() != "bearer":
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token type",
-            )
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None or username != ADMIN_USER:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token",
-            )
-        return username
-    except (ValueError, JWTError):
+    except ValueError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token",
         )
+    if token_type.lower() != "bearer":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token type",
+        )
+    return verify_token(token)
+
+
+async def get_metrics_user(authorization: str | None = Header(default=None)):
+    """
+    Dependency for /metrics: accepts the static METRICS_TOKEN as a bearer
+    token, or anything get_current_user accepts.
+    """
+    if METRICS_TOKEN and authorization:
+        token_type, _, token = authorization.partition(" ")
+        if token_type.lower() == "bearer" and hmac.compare_digest(token.strip().encode(), METRICS_TOKEN.encode()):
+            return "metrics"
+    return await get_current_user(authorization)
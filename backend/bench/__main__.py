@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+# --------------------------------------------------------------------
+# Runner: corre los escenarios, imprime la tabla y compara con el baseline
+# --------------------------------------------------------------------
+#
+#   python -m bench                          todo, contra bench/baseline.json
+#   python -m bench --only size100,auth      algunos escenarios
+#   python -m bench --check                  exit 1 si algo empeoró
+#   python -m bench --save-baseline          guarda lo medido como baseline
+#
+# (desde backend/). Cada escenario corre en su propio proceso (bench.worker).
+#
+# Qué cuenta como regresión:
+#   *ms                más de --tolerance por encima del baseline (y > 1 ms:
+#                      debajo de eso es ruido del scheduler). Los p95 se
+#                      muestran pero no cuentan, con 10-50 vueltas son ruido
+#   calls / builds /   cualquier aumento (> 0.5): son deterministas, un
+#   drift / missing    request de más al daemon es un bug, no ruido
+#   *kib / *mib        más de --tolerance por encima (y > 64 KiB / 8 MiB)
+# El baseline es de UNA máquina: los tiempos sólo se comparan bien contra
+# un baseline guardado en el mismo hardware; las llamadas en cualquiera.
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+SCENARIOS: Dict[str, Dict] = {
+    "size10": {"kind": "size", "containers": 10, "stacks": 3, "iterations": 50, "cold_iterations": 5},
+    "size100": {"kind": "size", "containers": 100, "stacks": 15, "iterations": 30, "cold_iterations": 3},
+    "size1000": {"kind": "size", "containers": 1000, "stacks": 150, "iterations": 10, "cold_iterations": 2},
+    "serialize": {"kind": "serialize", "containers": 500, "stacks": 80, "iterations": 30},
+    "auth": {"kind": "auth", "iterations": 2000},
+    "cgroup": {"kind": "cgroup", "containers": 1000, "iterations": 10},
+    "multihost": {"kind": "multihost", "containers_per_host": 100, "stacks_per_host": 15, "slow_inspect_latency": 0.02},
+    "churn": {"kind": "churn", "containers": 100, "stacks": 15, "hung": 3, "churn_per_sec": 20},
+}
+
+SCENARIO_TIMEOUT_SEC = 600
+
+_COUNT_METRICS = ("calls", "builds", "drift", "missing")
+
+
+def _metric_kind(metric: str) -> str:
+    if metric in _COUNT_METRICS:
+        return "count"
+    if metric.startswith("p95"):
+        return "info"
+    if metric.endswith("ms"):
+        return "time"
+    if metric.endswith("kib"):
+        return "kib"
+    if metric.endswith("mib"):
+        return "mib"
+    return "info"
+
+
+def _verdict(metric: str, current: float, base: float, tolerance: float) -> str:
+    """
+    "regression", "improvement" u "" (dentro del ruido / no comparable).
+    """
+    kind = _metric_kind(metric)
+    if kind == "count":
+        if current > base + 0.5:
+            return "regression"
+        return "improvement" if current < base - 0.5 else ""
+    floor = {"time": 1.0, "kib": 64, "mib": 8}.get(kind)
+    if floor is None:
+        return ""
+    if current > base * (1 + tolerance) and current - base > floor:
+        return "regression"
+    if current < base / (1 + tolerance) and base - current > floor:
+        return "improvement"
+    return ""
+
+
+def run_scenario(name: str, spec: Dict) -> Dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    # que un DOCKER_HOSTS del entorno (o del .env) no pise al fake
+    env["DOCKER_HOSTS"] = ""
+    proc = subprocess.run(
+        [sys.executable, "-m", "bench.worker", json.dumps(spec)],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=SCENARIO_TIMEOUT_SEC,
+    )
+    lines = [line for line in proc.stdout.splitlines() if line.strip()]
+    if proc.returncode != 0 or not lines:
+        sys.stderr.write(proc.stderr[-4000:])
+        raise RuntimeError(f"scenario {name} failed (exit {proc.returncode})")
+    return json.loads(lines[-1])
+
+
+def compare(
+    current: Dict[str, Dict],
+    baseline: Dict[str, Dict],
+    tolerance: float,
+) -> Tuple[List[Tuple], List[str]]:
+    """
+    -> (filas de la tabla, regresiones como texto)
+    """
+    rows = []
+    regressions = []
+    for scenario, cases in current.items():
+        for case, metrics in cases.items():
+            for metric, value in metrics.items():
+                key = f"{scenario}/{case}.{metric}"
+                base = baseline.get(scenario, {}).get(case, {}).get(metric)
+                verdict = ""
+                delta = ""
+                if isinstance(base, (int, float)) and isinstance(value, (int, float)):
+                    verdict = _verdict(metric, value, base, tolerance)
+                    if base:
+                        delta = f"{(value - base) / base * 100:+.0f}%"
+                    if verdict == "regression":
+                        regressions.append(f"{key}: {value} (baseline {base})")
+                rows.append((key, value, "-" if base is None else base, delta, verdict))
+    return rows, regressions
+
+
+def _print_table(rows: List[Tuple]):
+    width = max((len(r[0]) for r in rows), default=10)
+    print(f"{'metric':<{width}}  {'current':>12}  {'baseline':>12}  {'delta':>7}")
+    for key, value, base, delta, verdict in rows:
+        flag = {"regression": "  << REGRESSION", "improvement": "  (better)"}.get(verdict, "")
+        print(f"{key:<{width}}  {value:>12}  {base:>12}  {delta:>7}{flag}")
+
+
+def _load_baseline(path: str) -> Dict:
+    if not os.path.exists(path):
+        return {"meta": {}, "results": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m bench",
+        description="Benchmarks of the snapshot and detail pipeline against a fake Docker daemon.",
+    )
+    parser.add_argument("--only", help="comma-separated scenarios (" + ",".join(SCENARIOS) + ")")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="relative slack for times/memory (1.0 = up to 2x)")
+    parser.add_argument("--check", action="store_true", help="exit 1 on any regression")
+    parser.add_argument("--json", help="also write the raw results here")
+    parser.add_argument("--stats-latency", type=float, default=None, help="seconds per one-shot stats() in the size scenarios")
+    parser.add_argument("--inspect-latency", type=float, default=None, help="seconds per inspect in the size scenarios")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.only.split(",")] if args.only else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    current: Dict[str, Dict] = {}
+    for name in names:
+        spec = dict(SCENARIOS[name])
+        if spec["kind"] == "size":
+            if args.stats_latency is not None:
+                spec["stats_latency"] = args.stats_latency
+            if args.inspect_latency is not None:
+                spec["inspect_latency"] = args.inspect_latency
+        start = time.perf_counter()
+        print(f"-- {name} ...", file=sys.stderr, flush=True)
+        current[name] = run_scenario(name, spec)
+        print(f"   done in {time.perf_counter() - start:.1f}s", file=sys.stderr, flush=True)
+
+    stored = _load_baseline(args.baseline)
+    rows, regressions = compare(current, stored["results"], args.tolerance)
+    _print_table(rows)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        stored["results"].update(current)
+        stored["meta"] = {
+            "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        }
+        with open(args.baseline, "w") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nbaseline saved to {args.baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) vs baseline:")
+        for line in regressions:
+            print("  " + line)
+    return 1 if regressions and args.check else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,645 @@
+import datetime
+import itertools
+import json
+import os
+import random
+import re
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+# --------------------------------------------------------------------
+# Docker Engine API de mentira sobre un unix socket
+# --------------------------------------------------------------------
+#
+# Habla el mismo HTTP que dockerd (lo que usa el backend vía docker-py):
+#   GET  /_ping, /version, /info
+#   GET  /containers/json               (all=0|1)
+#   GET  /containers/{id}/json          (inspect; acepta id, prefijo o nombre)
+#   GET  /containers/{id}/stats         (stream=0 -> un sample tras stats_latency;
+#                                        stream=1 -> un sample cada stream_period, chunked)
+#   GET  /containers/{id}/logs          (frames multiplexados; con follow queda abierto)
+#   POST /containers/{id}/start|stop|restart
+#   POST /containers/{id}/exec, /exec/{id}/start (hijack: TTY que hace eco
+#        de lo que recibe, "exit\n" lo termina), /exec/{id}/resize
+#   GET  /exec/{id}/json
+#   GET  /events                        (chunked, un JSON por evento)
+# así que el backend corre sin cambios con DOCKER_HOST=engine.url y pasa por
+# el cliente real (pool, timeouts, decode, hooks de services.perf).
+#
+# Escenarios:
+#   n_containers / n_stacks   contenedor i -> stack "stack{i % n_stacks}";
+#                             i % 4 == 3 parado, i == 5 unhealthy
+#   inspect_latency           segundos por inspect (el list no-sparse de
+#                             docker-py hace uno por contenedor)
+#   stats_latency             segundos de stats(stream=False) (dockerd ~1s)
+#   hung                      ids que no contestan stats (y tampoco inspect
+#                             si hang_inspect) hasta hang_sec
+#   churn_per_sec             start/stop/destroy+create al azar, con eventos
+#   cut_stats_streams(ids)    corta los streams de stats abiertos de esos
+#                             contenedores aunque sigan running (como un
+#                             dockerd que se reinicia)
+#
+# `calls` cuenta requests por "MÉTODO /ruta/{id}" (sin versión de API).
+
+API_VERSION = "1.44"
+
+_PATH_RE = re.compile(r"^(?:/v[0-9.]+)?(/.*)$")
+_CONTAINER_RE = re.compile(r"^/containers/([^/]+)/(json|stats|logs|start|stop|restart|exec)$")
+_EXEC_RE = re.compile(r"^/exec/([^/]+)/(start|json|resize)$")
+
+
+def _docker_ts(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%S.%f000Z"
+    )
+
+
+class _Container:
+    """
+    Estado de un contenedor del fake (lo que el inspect devuelve).
+    """
+
+    def __init__(self, engine_no: int, index: int, n_stacks: int, now: float):
+        # ids únicos entre daemons fake, como los reales
+        self.id = f"{index:08x}{engine_no:04x}".ljust(64, "c")
+        self.stack = f"stack{index % n_stacks}"
+        self.name = f"{self.stack}-svc{index}-1"
+        self.running = index % 4 != 3
+        self.unhealthy = index == 5
+        self.started_at = now - 3600 - index
+        self.pid = 1000 + index
+        # contadores acumulados que avanzan en cada sample
+        self.cpu_total = 0
+        self.net = 0
+        self.samples = 0
+
+    def summary(self) -> Dict:
+        return {
+            "Id": self.id,
+            "Names": ["/" + self.name],
+            "Image": "bench/app:latest",
+            "State": "running" if self.running else "exited",
+            "Status": "Up 1 hour" if self.running else "Exited (0)",
+            "Labels": self.labels(),
+        }
+
+    def labels(self) -> Dict[str, str]:
+        return {
+            "com.docker.compose.project": self.stack,
+            "com.docker.compose.service": self.name.split("-")[1],
+        }
+
+    def inspect(self) -> Dict:
+        state = {
+            "Status": "running" if self.running else "exited",
+            "Running": self.running,
+            "Pid": self.pid if self.running else 0,
+            "StartedAt": _docker_ts(self.started_at),
+            "FinishedAt": "0001-01-01T00:00:00Z",
+        }
+        if self.unhealthy:
+            state["Health"] = {"Status": "unhealthy", "FailingStreak": 3, "Log": []}
+        return {
+            "Id": self.id,
+            "Name": "/" + self.name,
+            "Created": _docker_ts(self.started_at - 60),
+            "State": state,
+            "Image": "sha256:" + "0" * 64,
+            "Config": {
+                "Image": "bench/app:latest",
+                "Labels": self.labels(),
+                "Tty": False,
+                "Env": ["PATH=/usr/local/bin:/usr/bin"],
+            },
+            "HostConfig": {"NetworkMode": self.stack + "_default"},
+            "NetworkSettings": {
+                "Ports": {
+                    "80/tcp": [{"HostIp": "0.0.0.0", "HostPort": str(20000 + self.pid % 40000)}],
+                    "443/tcp": None,
+                },
+            },
+        }
+
+    def stats(self) -> Dict:
+        """
+        Un sample con el formato de /containers/{id}/stats (cgroup v2).
+        """
+        prev_cpu = self.cpu_total
+        self.samples += 1
+        self.cpu_total += 20_000_000 + (self.pid % 7) * 5_000_000
+        self.net += 4096
+        system = 1_000_000_000_000 + self.samples * 2_000_000_000
+        return {
+            "read": _docker_ts(time.time()),
+            "preread": _docker_ts(time.time() - 1),
+            "pids_stats": {"current": 4},
+            "blkio_stats": {
+                "io_service_bytes_recursive": [
+                    {"major": 8, "minor": 0, "op": "read", "value": 1 << 20},
+                    {"major": 8, "minor": 0, "op": "write", "value": self.samples * 512},
+                ],
+            },
+            "cpu_stats": {
+                "cpu_usage": {"total_usage": self.cpu_total, "usage_in_kernelmode": 0, "usage_in_usermode": 0},
+                "system_cpu_usage": system,
+                "online_cpus": 4,
+                "throttling_data": {"periods": 0, "throttled_periods": 0, "throttled_time": 0},
+            },
+            "precpu_stats": {
+                "cpu_usage": {"total_usage": prev_cpu, "usage_in_kernelmode": 0, "usage_in_usermode": 0},
+                "system_cpu_usage": system - 2_000_000_000,
+                "online_cpus": 4,
+                "throttling_data": {"periods": 0, "throttled_periods": 0, "throttled_time": 0},
+            },
+            "memory_stats": {
+                "usage": (64 << 20) + (self.pid % 13) * (1 << 20),
+                "stats": {"inactive_file": 1 << 20, "active_file": 2 << 20, "anon": 60 << 20},
+                "limit": 8 << 30,
+            },
+            "name": "/" + self.name,
+            "id": self.id,
+            "networks": {
+                "eth0": {"rx_bytes": self.net * 2, "rx_packets": self.samples, "rx_errors": 0, "rx_dropped": 0,
+                         "tx_bytes": self.net, "tx_packets": self.samples, "tx_errors": 0, "tx_dropped": 0},
+            },
+        }
+
+
+_ENGINE_SEQ = itertools.count()
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    block_on_close = False
+    # dockerd escucha con el backlog del sistema; con el default (5) los
+    # cientos de streams de stats que abre el seed se rechazarían
+    request_queue_size = 4096
+
+    def handle_error(self, request, client_address):
+        # clientes que cortan streams o timeouts: ruido esperado
+        if not isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            super().handle_error(request, client_address)
+
+
+class FakeEngine:
+    """
+    Un daemon fake escuchando en `url` (unix://). start() / stop().
+    """
+
+    def __init__(
+        self,
+        n_containers: int = 10,
+        n_stacks: int = 3,
+        inspect_latency: float = 0.0,
+        stats_latency: float = 0.0,
+        stream_period: float = 1.0,
+        hung: int = 0,
+        hang_sec: float = 60.0,
+        hang_inspect: bool = False,
+        churn_per_sec: float = 0.0,
+        seed: int = 1,
+        socket_path: Optional[str] = None,
+    ):
+        self.inspect_latency = inspect_latency
+        self.stats_latency = stats_latency
+        self.stream_period = stream_period
+        self.hang_sec = hang_sec
+        self.hang_inspect = hang_inspect
+        self.churn_per_sec = churn_per_sec
+
+        self._rand = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stop_churn = threading.Event()
+        self._next_index = n_containers
+        self._engine_no = next(_ENGINE_SEQ)
+        self._n_stacks = max(1, n_stacks)
+        now = time.time()
+        self.containers: Dict[str, _Container] = {}
+        for i in range(n_containers):
+            c = _Container(self._engine_no, i, self._n_stacks, now)
+            self.containers[c.id] = c
+        # los "colgados" son running (si no, nadie les pide stats)
+        running = [cid for cid, c in self.containers.items() if c.running]
+        self.hung = set(running[len(running) - hung:]) if hung else set()
+
+        self.calls: Counter = Counter()
+        # id -> momento del último corte: cierra los streams de stats
+        # abiertos antes de esa marca
+        self._stats_cut_at: Dict[str, float] = {}
+        # exec_id -> {"container", "running", "exit_code"}
+        self.execs: Dict[str, Dict] = {}
+        self._subscribers: List = []
+        # como dockerd: /events?since= repite lo ocurrido desde ese momento
+        self._history: deque = deque(maxlen=10000)
+
+        if socket_path is None:
+            self._tmpdir = tempfile.mkdtemp(prefix="fake-docker-")
+            socket_path = os.path.join(self._tmpdir, "docker.sock")
+        self.socket_path = socket_path
+        self.url = "unix://" + socket_path
+        self._server: Optional[_UnixHTTPServer] = None
+
+    # ------------------------------------------------------------------
+    # ciclo de vida
+    # ------------------------------------------------------------------
+
+    def start(self) -> "FakeEngine":
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = _UnixHTTPServer(self.socket_path, _make_handler(self))
+        threading.Thread(
+            target=self._server.serve_forever,
+            name="fake-docker",
+            daemon=True,
+        ).start()
+        if self.churn_per_sec > 0:
+            threading.Thread(target=self._churn, name="fake-docker-churn", daemon=True).start()
+        return self
+
+    def stop_churn(self):
+        self._stop_churn.set()
+
+    def stop(self):
+        self._stop.set()
+        self._stop_churn.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def total_calls(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def calls_snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.calls)
+
+    # ------------------------------------------------------------------
+    # estado
+    # ------------------------------------------------------------------
+
+    def find(self, ref: str) -> Optional[_Container]:
+        with self._lock:
+            c = self.containers.get(ref)
+            if c is not None:
+                return c
+            for c in self.containers.values():
+                if c.id.startswith(ref) or c.name == ref:
+                    return c
+        return None
+
+    def emit(self, container: _Container, action: str):
+        now = time.time()
+        event = {
+            "status": action,
+            "id": container.id,
+            "from": "bench/app:latest",
+            "Type": "container",
+            "Action": action,
+            "Actor": {"ID": container.id, "Attributes": {"name": container.name, **container.labels()}},
+            "scope": "local",
+            "time": int(now),
+            "timeNano": int(now * 1e9),
+        }
+        with self._lock:
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            q.append(event)
+
+    def cut_stats_streams(self, ids):
+        now = time.monotonic()
+        with self._lock:
+            for cid in ids:
+                self._stats_cut_at[cid] = now
+
+    def _stats_cut(self, container: _Container, opened: float) -> bool:
+        with self._lock:
+            return self._stats_cut_at.get(container.id, 0.0) >= opened
+
+    def set_running(self, container: _Container, running: bool):
+        if container.running == running:
+            return
+        container.running = running
+        if running:
+            container.started_at = time.time()
+            self.emit(container, "start")
+        else:
+            self.emit(container, "die")
+            self.emit(container, "stop")
+
+    def _churn(self):
+        """
+        Cambios al azar a churn_per_sec: 3 de cada 4 un start/stop, el resto
+        un destroy + create de un contenedor nuevo en un stack existente.
+        """
+        while not self._stop_churn.wait(1 / self.churn_per_sec):
+            with self._lock:
+                candidates = [c for cid, c in self.containers.items() if cid not in self.hung]
+            if not candidates:
+                continue
+            victim = self._rand.choice(candidates)
+            if self._rand.random() < 0.75:
+                self.set_running(victim, not victim.running)
+                continue
+            with self._lock:
+                self.containers.pop(victim.id, None)
+                new = _Container(self._engine_no, self._next_index, self._n_stacks, time.time())
+                self._next_index += 1
+                self.containers[new.id] = new
+            self.emit(victim, "destroy")
+            self.emit(new, "create")
+            self.emit(new, "start")
+
+
+def _make_handler(engine: FakeEngine):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def address_string(self):
+            return "unix"
+
+        # -------------------------------------------------------------
+        # respuestas
+        # -------------------------------------------------------------
+
+        def _send_json(self, data, status: int = 200):
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Api-Version", API_VERSION)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_empty(self, status: int = 204):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def _not_found(self, what: str):
+            self._send_json({"message": f"No such container: {what}"}, 404)
+
+        def _start_chunked(self, content_type: str):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+        def _chunk(self, data: bytes) -> bool:
+            try:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+                return True
+            except OSError:
+                return False
+
+        def _end_chunked(self):
+            try:
+                self.wfile.write(b"0\r\n\r\n")
+            except OSError:
+                pass
+
+        # -------------------------------------------------------------
+        # ruteo
+        # -------------------------------------------------------------
+
+        def _route(self, method: str):
+            parts = urlsplit(self.path)
+            path = _PATH_RE.match(parts.path).group(1)
+            query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+
+            match = _CONTAINER_RE.match(path)
+            exec_match = _EXEC_RE.match(path)
+            if match:
+                key = f"{method} /containers/{{id}}/{match.group(2)}"
+            elif exec_match:
+                key = f"{method} /exec/{{id}}/{exec_match.group(2)}"
+            else:
+                key = f"{method} {path}"
+            with engine._lock:
+                engine.calls[key] += 1
+
+            if exec_match:
+                exec_ = engine.execs.get(exec_match.group(1))
+                if exec_ is None:
+                    return self._send_json({"message": f"No such exec instance: {exec_match.group(1)}"}, 404)
+                return getattr(self, f"_{method.lower()}_exec_{exec_match.group(2)}")(exec_match.group(1), exec_)
+
+            if match:
+                container = engine.find(match.group(1))
+                if container is None:
+                    return self._not_found(match.group(1))
+                return getattr(self, f"_{method.lower()}_{match.group(2)}")(container, query)
+            if method == "GET" and path == "/_ping":
+                body = b"OK"
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Api-Version", API_VERSION)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                return self.wfile.write(body)
+            if method == "GET" and path == "/version":
+                return self._send_json({
+                    "Version": "26.1.0-fake",
+                    "ApiVersion": API_VERSION,
+                    "MinAPIVersion": "1.24",
+                    "Os": "linux",
+                    "Arch": "amd64",
+                })
+            if method == "GET" and path == "/info":
+                with engine._lock:
+                    total = len(engine.containers)
+                    running = sum(c.running for c in engine.containers.values())
+                return self._send_json({
+                    "Containers": total,
+                    "ContainersRunning": running,
+                    "MemTotal": 8 << 30,
+                    "NCPU": 4,
+                })
+            if method == "GET" and path == "/containers/json":
+                include_all = query.get("all") in ("1", "true", "True")
+                with engine._lock:
+                    listed = [
+                        c.summary() for c in engine.containers.values()
+                        if include_all or c.running
+                    ]
+                return self._send_json(listed)
+            if method == "GET" and path == "/events":
+                return self._events(query.get("since"))
+            self._send_json({"message": f"page not found: {method} {path}"}, 404)
+
+        def do_GET(self):
+            self._route("GET")
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            self._route("POST")
+
+        # -------------------------------------------------------------
+        # endpoints por contenedor
+        # -------------------------------------------------------------
+
+        def _hang(self, container) -> bool:
+            """
+            Un contenedor colgado no contesta: se espera hang_sec y se corta
+            la conexión sin respuesta (el cliente ve su propio timeout antes).
+            """
+            if container.id not in engine.hung:
+                return False
+            engine._stop.wait(engine.hang_sec)
+            self.close_connection = True
+            return True
+
+        def _get_json(self, container, query):
+            if engine.hang_inspect and self._hang(container):
+                return
+            if engine.inspect_latency:
+                time.sleep(engine.inspect_latency)
+            self._send_json(container.inspect())
+
+        def _get_stats(self, container, query):
+            if self._hang(container):
+                return
+            if query.get("stream") in ("0", "false", "False"):
+                if engine.stats_latency:
+                    time.sleep(engine.stats_latency)
+                return self._send_json(container.stats())
+
+            opened = time.monotonic()
+            self._start_chunked("application/json")
+            while container.running and not engine._stop.is_set():
+                if engine._stats_cut(container, opened):
+                    break
+                if not self._chunk(json.dumps(container.stats()).encode() + b"\n"):
+                    return
+                time.sleep(engine.stream_period)
+            self._end_chunked()
+
+        def _get_logs(self, container, query):
+            tail = query.get("tail", "all")
+            count = 20 if tail == "all" else min(int(tail), 20)
+            timestamps = query.get("timestamps") in ("1", "true", "True")
+            now = time.time()
+            frames = []
+            for i in range(count):
+                line = f"line {i} {'ERROR' if i % 5 == 0 else 'INFO'} bench\n".encode()
+                if timestamps:
+                    line = _docker_ts(now - count + i).encode() + b" " + line
+                frames.append(struct.pack(">BxxxL", 1, len(line)) + line)
+            body = b"".join(frames)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/vnd.docker.multiplexed-stream")
+            if query.get("follow") not in ("1", "true", "True"):
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                return self.wfile.write(body)
+
+            # follow: sin líneas nuevas, abierto hasta que el contenedor pare
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            self.wfile.write(body)
+            self.wfile.flush()
+            while container.running and not engine._stop.wait(0.2):
+                pass
+
+        def _post_start(self, container, query):
+            engine.set_running(container, True)
+            self._send_empty()
+
+        def _post_stop(self, container, query):
+            engine.set_running(container, False)
+            self._send_empty()
+
+        def _post_restart(self, container, query):
+            engine.set_running(container, False)
+            engine.set_running(container, True)
+            self._send_empty()
+
+        # -------------------------------------------------------------
+        # exec
+        # -------------------------------------------------------------
+
+        def _post_exec(self, container, query):
+            exec_id = os.urandom(32).hex()
+            engine.execs[exec_id] = {"container": container, "running": False, "exit_code": None}
+            self._send_json({"Id": exec_id}, 201)
+
+        def _post_exec_start(self, exec_id, exec_):
+            """
+            Como dockerd con Upgrade: tcp: 101 y el socket pasa a ser el
+            TTY. Sin salida propia: sólo el eco de lo que manda el cliente.
+            """
+            self.send_response(101, "UPGRADED")
+            self.send_header("Content-Type", "application/vnd.docker.raw-stream")
+            self.send_header("Connection", "Upgrade")
+            self.send_header("Upgrade", "tcp")
+            self.end_headers()
+            self.wfile.flush()
+            self.close_connection = True
+            exec_["running"] = True
+            try:
+                while not engine._stop.is_set():
+                    data = self.connection.recv(4096)
+                    if not data:
+                        break
+                    self.connection.sendall(data)
+                    if b"exit\n" in data:
+                        exec_["exit_code"] = 0
+                        break
+            except OSError:
+                pass
+            finally:
+                exec_["running"] = False
+
+        def _get_exec_json(self, exec_id, exec_):
+            self._send_json({
+                "ID": exec_id,
+                "Running": exec_["running"],
+                "ExitCode": exec_["exit_code"],
+                "ContainerID": exec_["container"].id,
+            })
+
+        def _post_exec_resize(self, exec_id, exec_):
+            self._send_empty(201)
+
+        # -------------------------------------------------------------
+        # events
+        # -------------------------------------------------------------
+
+        def _events(self, since: Optional[str]):
+            queue: List[Dict] = []
+            with engine._lock:
+                if since:
+                    queue.extend(e for e in engine._history if e["time"] >= float(since))
+                engine._subscribers.append(queue)
+            self._start_chunked("application/json")
+            try:
+                while not engine._stop.is_set():
+                    while queue:
+                        if not self._chunk(json.dumps(queue.pop(0)).encode() + b"\n"):
+                            return
+                    time.sleep(0.05)
+                self._end_chunked()
+            finally:
+                with engine._lock:
+                    engine._subscribers.remove(queue)
+
+    return Handler
@@ -0,0 +1,600 @@
+import asyncio
+import inspect
+import json
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from bench.fake_engine import FakeEngine
+
+# --------------------------------------------------------------------
+# Un escenario del benchmark, en su propio proceso
+# --------------------------------------------------------------------
+#
+# python -m bench.worker '<spec json>' -> imprime {"case": {métricas}} en
+# la última línea de stdout. Cada escenario corre en un proceso nuevo
+# porque el backend arma sus clientes Docker (y el registro, los streams,
+# los caches) a nivel de módulo: el fake tiene que estar escuchando y el
+# entorno apuntándolo ANTES del primer import de services.*.
+#
+# Métricas por caso:
+#   ms / p95_ms   wall time por iteración (promedio / percentil 95)
+#   calls         requests al daemon fake por iteración
+#   peak_kib      pico de memoria asignada en una iteración (tracemalloc,
+#                 medida aparte para no inflar los tiempos)
+
+Results = Dict[str, Dict[str, float]]
+
+
+def _set_app_env(extra: Optional[Dict[str, str]] = None):
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    os.environ.setdefault("ADMIN_USER", "admin")
+    os.environ.setdefault("ADMIN_PASSWORD", "admin")
+    os.environ.update(extra or {})
+
+
+async def measure(
+    fn: Callable,
+    iterations: int,
+    engines: Optional[List[FakeEngine]] = None,
+    setup: Optional[Callable] = None,
+    memory: bool = True,
+) -> Dict[str, float]:
+    """
+    Corre fn() (sync o async) `iterations` veces. `setup` corre antes de
+    cada iteración, fuera del tiempo medido.
+    """
+    engines = engines or []
+
+    async def once():
+        if setup is not None:
+            setup()
+        result = fn()
+        if inspect.isawaitable(result):
+            await result
+
+    await once()  # warmup: imports perezosos, pools, caches de Pydantic
+
+    calls_before = sum(e.total_calls() for e in engines)
+    times = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        if inspect.isawaitable(result):
+            await result
+        times.append(time.perf_counter() - start)
+    calls = sum(e.total_calls() for e in engines) - calls_before
+
+    out = {
+        "ms": round(statistics.fmean(times) * 1000, 4),
+        "p95_ms": round(sorted(times)[max(0, int(len(times) * 0.95) - 1)] * 1000, 4),
+        "calls": round(calls / iterations, 2),
+    }
+    if memory:
+        tracemalloc.start()
+        await once()
+        out["peak_kib"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+    return out
+
+
+def _wait_until(predicate: Callable[[], bool], timeout: float, step: float = 0.05) -> float:
+    """
+    Espera a que predicate() sea True; devuelve los segundos que tardó
+    (o timeout si no llegó).
+    """
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if predicate():
+            break
+        time.sleep(step)
+    return time.perf_counter() - start
+
+
+def _wait_quiet(engines: List[FakeEngine], quiet: float = 0.5, timeout: float = 30) -> float:
+    """
+    Espera a que los daemons fake dejen de recibir requests (seed, apertura
+    de streams y del watcher de eventos) para que no se cuenten en un caso.
+    """
+    start = time.perf_counter()
+    last = -1
+    while time.perf_counter() - start < timeout:
+        now = sum(e.total_calls() for e in engines)
+        if now == last:
+            break
+        last = now
+        time.sleep(quiet)
+    return time.perf_counter() - start
+
+
+def _process_metrics() -> Dict[str, float]:
+    # ru_maxrss está en KiB en Linux
+    return {"max_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+
+# --------------------------------------------------------------------
+# Rutas HTTP (TestClient contra la app entera, con el loop de snapshot)
+# --------------------------------------------------------------------
+
+def _http_cases(client, engines: List[FakeEngine], iterations: int, routes: Dict[str, Dict]) -> Results:
+    """
+    routes: caso -> {"path", "headers" (dict o callable por iteración),
+    "status" (los aceptados, default (200,))}.
+    """
+    results: Results = {}
+    for case, req in routes.items():
+        headers = req.get("headers", {})
+        path = req["path"]
+        expect = req.get("status", (200,))
+
+        def call():
+            r = client.get(path, headers=headers() if callable(headers) else headers)
+            if r.status_code not in expect:
+                raise RuntimeError(f"{path}: {r.status_code} (expected {expect})")
+
+        results[case] = asyncio.run(measure(call, iterations, engines))
+    return results
+
+
+def _auth_headers() -> Dict[str, str]:
+    from auth import create_access_token
+
+    return {"Authorization": "Bearer " + create_access_token({"sub": os.environ["ADMIN_USER"]})}
+
+
+def _perf_timer_ms(name: str) -> Optional[float]:
+    from services.perf import get_perf
+
+    timer = get_perf()["timers"].get(name)
+    return timer["avg_ms"] if timer else None
+
+
+# --------------------------------------------------------------------
+# Escenario "size": N contenedores en M stacks, un host
+# --------------------------------------------------------------------
+
+def run_size(spec: Dict) -> Results:
+    engine = FakeEngine(
+        spec["containers"],
+        spec["stacks"],
+        inspect_latency=spec.get("inspect_latency", 0.0),
+        stats_latency=spec.get("stats_latency", 0.0),
+        stream_period=spec.get("stream_period", 1.0),
+    ).start()
+    _set_app_env({"DOCKER_HOST": engine.url})
+
+    from services import snapshot
+    from services.docker_client import DEFAULT_HOST
+    from services.docker_service_v3 import (
+        _build_stack_detail,
+        _build_stack_summaries,
+        _stack_name_for_container,
+    )
+    from services.stats_collector import get_latest_stats, get_stack_aggregate
+
+    iterations = spec.get("iterations", 20)
+    cold_iterations = spec.get("cold_iterations", 3)
+    stack_id = "stack0"
+    results: Results = {}
+
+    async def direct():
+        # ---- en frío: sin registro, todo contra el daemon ----
+        results["summaries.cold"] = await measure(_build_stack_summaries, cold_iterations, [engine])
+        results["detail.cold"] = await measure(
+            lambda: _build_stack_detail(stack_id), cold_iterations, [engine]
+        )
+
+        # ---- seed del registro + streams de stats ----
+        start = time.perf_counter()
+        snapshot._reconcile_host(DEFAULT_HOST)
+        results["registry.seed"] = {"ms": round((time.perf_counter() - start) * 1000, 3)}
+        running = [c for c in snapshot._snapshot_containers() if c.attrs["State"]["Running"]]
+        waited = _wait_until(lambda: all(get_latest_stats(c.id) for c in running), timeout=30)
+        results["stats.first_sample_all"] = {"ms": round(waited * 1000, 1)}
+        _wait_quiet([engine])
+
+        # ---- desde memoria ----
+        results["summaries.snapshot"] = await measure(
+            lambda: _build_stack_summaries(
+                aggregate_lookup=get_stack_aggregate,
+                groups=snapshot._stack_groups(),
+            ),
+            iterations,
+            [engine],
+        )
+        results["detail.snapshot"] = await measure(
+            lambda: _build_stack_detail(
+                stack_id,
+                snapshot.get_stack_containers(stack_id),
+                stats_lookup=get_latest_stats,
+            ),
+            iterations,
+            [engine],
+        )
+
+        # índice por stack contra un recorrido del registro
+        lookups = 1000
+        results["index.stack_lookup_x1000"] = await measure(
+            lambda: [snapshot.get_stack_containers(stack_id) for _ in range(lookups)],
+            iterations,
+            memory=False,
+        )
+        results["index.scan_x1000"] = await measure(
+            lambda: [
+                [c for c in snapshot._snapshot_containers() if _stack_name_for_container(c) == stack_id]
+                for _ in range(lookups)
+            ],
+            max(1, iterations // 4),
+            memory=False,
+        )
+
+        # ---- get_detail_snapshot: cache fresco / miss / N concurrentes ----
+        def evict():
+            snapshot._STACKS_DETAIL.pop(stack_id, None)
+            snapshot._STACKS_DETAIL_TS.pop(stack_id, None)
+
+        results["get_detail_snapshot.fresh"] = await measure(
+            lambda: snapshot.get_detail_snapshot(stack_id), iterations, [engine]
+        )
+        results["get_detail_snapshot.miss"] = await measure(
+            lambda: snapshot.get_detail_snapshot(stack_id), iterations, [engine], setup=evict
+        )
+
+        from services.perf import get_perf
+
+        concurrent = 50
+        builds_before = get_perf()["counters"].get("cache.detail.build", 0)
+        results["get_detail_snapshot.concurrent50"] = await measure(
+            lambda: asyncio.gather(*(snapshot.get_detail_snapshot(stack_id) for _ in range(concurrent))),
+            iterations,
+            [engine],
+            setup=evict,
+        )
+        builds = get_perf()["counters"].get("cache.detail.build", 0) - builds_before
+        # warmup + iteraciones + la de memoria: una build por ronda si hay single-flight
+        results["get_detail_snapshot.concurrent50"]["builds"] = round(builds / (iterations + 2), 2)
+
+    asyncio.run(direct())
+
+    # ---- rutas HTTP ----
+    from fastapi.testclient import TestClient
+
+    from app import app
+
+    headers = _auth_headers()
+    with TestClient(app) as client:
+        _wait_until(lambda: snapshot.get_refresh_generation() > 0, timeout=30)
+        _wait_quiet([engine])
+        routes = {
+            "http.stacks": {"path": "/api/v2/stacks", "headers": headers},
+            # el ETag vigente justo antes de cada request: si el loop publica
+            # una generación nueva en el medio, la respuesta es un 200
+            "http.stacks_304": {
+                "path": "/api/v2/stacks",
+                "headers": lambda: {
+                    **headers,
+                    "Accept-Encoding": "identity",
+                    "If-None-Match": snapshot.get_summary_etag(),
+                },
+                "status": (304, 200),
+            },
+            "http.stack_detail": {"path": f"/api/v2/stacks/{stack_id}", "headers": headers},
+            "http.stack_detail_gzip": {
+                "path": f"/api/v2/stacks/{stack_id}",
+                "headers": {**headers, "Accept-Encoding": "gzip"},
+            },
+            "http.stack_details_all": {"path": "/api/v2/stack-details", "headers": headers},
+            "http.v1_status": {"path": "/api/status", "headers": headers},
+            "http.metrics": {"path": "/metrics", "headers": headers},
+        }
+        results.update(_http_cases(client, [engine], iterations, routes))
+        cycle = _perf_timer_ms("loop.cycle")
+        if cycle is not None:
+            results["snapshot_loop.cycle"] = {"ms": cycle}
+
+    results["process"] = _process_metrics()
+    engine.stop()
+    return results
+
+
+# --------------------------------------------------------------------
+# Escenario "serialize": respuesta validada por Pydantic contra bytes
+# pre-serializados, para /api/v2/stacks y /stacks/{id}
+# --------------------------------------------------------------------
+
+def run_serialize(spec: Dict) -> Results:
+    engine = FakeEngine(
+        spec["containers"],
+        spec["stacks"],
+        stream_period=spec.get("stream_period", 1.0),
+    ).start()
+    _set_app_env({"DOCKER_HOST": engine.url})
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from fastapi.testclient import TestClient
+
+    from app import app
+    from models.v2 import StackDetailResponse, StackListResponse
+    from services import snapshot
+
+    iterations = spec.get("iterations", 30)
+    stack_id = "stack0"
+    results: Results = {}
+
+    def validated(model, data) -> bytes:
+        # lo que hacía FastAPI con response_model en cada request
+        return JSONResponse(jsonable_encoder(model.model_validate(data))).body
+
+    def drop_summary_body():
+        snapshot._STACKS_SUMMARY_BODY.clear()
+
+    def drop_detail_body():
+        snapshot._STACKS_DETAIL_BODY[stack_id] = {}
+
+    headers = _auth_headers()
+    with TestClient(app) as client:
+        _wait_until(lambda: snapshot.get_refresh_generation() > 0, timeout=30)
+        client.get(f"/api/v2/stacks/{stack_id}", headers=headers).raise_for_status()
+        _wait_quiet([engine])
+
+        summary = {"stacks": snapshot.get_summary_snapshot()}
+        detail = snapshot._STACKS_DETAIL[stack_id]
+
+        async def direct():
+            results["summary.validated"] = await measure(
+                lambda: validated(StackListResponse, summary), iterations
+            )
+            # una vez por generación: el primer request después de publicarla
+            results["summary.preserialized_build"] = await measure(
+                snapshot.get_summary_body, iterations, setup=drop_summary_body
+            )
+            results["summary.preserialized"] = await measure(snapshot.get_summary_body, iterations)
+            results["detail.validated"] = await measure(
+                lambda: validated(StackDetailResponse, detail), iterations
+            )
+            results["detail.preserialized_build"] = await measure(
+                lambda: snapshot.get_detail_body(stack_id), iterations, setup=drop_detail_body
+            )
+            results["detail.preserialized"] = await measure(
+                lambda: snapshot.get_detail_body(stack_id), iterations
+            )
+
+        asyncio.run(direct())
+
+        results.update(_http_cases(client, [engine], iterations, {
+            "http.stacks": {"path": "/api/v2/stacks", "headers": headers},
+            "http.stack_detail": {"path": f"/api/v2/stacks/{stack_id}", "headers": headers},
+        }))
+
+    results["process"] = _process_metrics()
+    engine.stop()
+    return results
+
+
+# --------------------------------------------------------------------
+# Escenario "auth": costo de verificar un JWT, con y sin el cache de tokens
+# --------------------------------------------------------------------
+
+def run_auth(spec: Dict) -> Results:
+    _set_app_env()
+    import auth
+
+    iterations = spec.get("iterations", 2000)
+    token = _auth_headers()["Authorization"].split(" ", 1)[1]
+
+    def uncached():
+        with auth._token_cache_lock:
+            auth._token_cache.clear()
+        auth.verify_token(token)
+
+    results: Results = {}
+    results["verify_token.uncached"] = asyncio.run(measure(uncached, iterations, memory=False))
+    results["verify_token.cached"] = asyncio.run(
+        measure(lambda: auth.verify_token(token), iterations, memory=False)
+    )
+    results["get_current_user.cached"] = asyncio.run(
+        measure(lambda: auth.get_current_user("Bearer " + token), iterations, memory=False)
+    )
+    return results
+
+
+# --------------------------------------------------------------------
+# Escenario "cgroup": barrido de un árbol cgroup v2 fake contra decodificar samples de Docker
+# --------------------------------------------------------------------
+
+def _write(path: str, text: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def run_cgroup(spec: Dict) -> Results:
+    from services.cgroup_stats import find_cgroup_dir, read_sample
+    from services.metrics import metrics_from_stats
+
+    n = spec.get("containers", 1000)
+    iterations = spec.get("iterations", 10)
+    root = tempfile.mkdtemp(prefix="fake-cgroup-")
+    cgroup_root = os.path.join(root, "cgroup")
+    proc_root = os.path.join(root, "proc")
+    _write(os.path.join(proc_root, "meminfo"), "MemTotal:       8000000 kB\n")
+
+    engine = FakeEngine(n, max(1, n // 7))
+    containers = list(engine.containers.values())
+    for c in containers:
+        base = os.path.join(cgroup_root, "system.slice", f"docker-{c.id}.scope")
+        _write(os.path.join(base, "cpu.stat"), f"usage_usec {c.pid * 1000}\nuser_usec 1\nsystem_usec 1\n")
+        _write(os.path.join(base, "memory.current"), f"{64 << 20}\n")
+        _write(os.path.join(base, "memory.max"), "max\n")
+        _write(os.path.join(base, "io.stat"), "8:0 rbytes=1048576 wbytes=4096 rios=10 wios=2\n")
+        _write(
+            os.path.join(proc_root, str(c.pid), "net", "dev"),
+            "Inter-|   Receive\n face |bytes\n"
+            "    lo: 100 1 0 0 0 0 0 0 100 1 0 0 0 0 0 0\n"
+            "  eth0: 8192 4 0 0 0 0 0 0 4096 2 0 0 0 0 0 0\n",
+        )
+
+    dirs = {c.id: find_cgroup_dir(c.id, cgroup_root) for c in containers}
+    prev = {c.id: None for c in containers}
+
+    def sweep():
+        for c in containers:
+            _, prev[c.id] = read_sample(dirs[c.id], c.pid, prev[c.id], proc_root)
+
+    # lo que cuesta del lado del cliente el camino del stream de Docker:
+    # decodificar el JSON de cada sample + metrics_from_stats
+    bodies = [json.dumps(c.stats()).encode() for c in containers]
+
+    def decode_docker():
+        for body in bodies:
+            metrics_from_stats(json.loads(body))
+
+    results: Results = {}
+    results[f"find_cgroup_dir.x{n}"] = asyncio.run(
+        measure(lambda: [find_cgroup_dir(c.id, cgroup_root) for c in containers], iterations, memory=False)
+    )
+    results[f"cgroup_sweep.x{n}"] = asyncio.run(measure(sweep, iterations))
+    results[f"docker_sample_decode.x{n}"] = asyncio.run(measure(decode_docker, iterations))
+    shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+# --------------------------------------------------------------------
+# Escenario "multihost": varios daemons, uno lento y uno caído; lo que cuesta federarlos
+# --------------------------------------------------------------------
+
+def run_multihost(spec: Dict) -> Results:
+    per_host = spec.get("containers_per_host", 100)
+    stacks = spec.get("stacks_per_host", 15)
+    slow_latency = spec.get("slow_inspect_latency", 0.02)
+    engines = {
+        "a": FakeEngine(per_host, stacks).start(),
+        "b": FakeEngine(per_host, stacks).start(),
+        "slow": FakeEngine(per_host, stacks, inspect_latency=slow_latency).start(),
+    }
+    down = os.path.join(tempfile.mkdtemp(prefix="fake-docker-down-"), "docker.sock")
+    hosts = [f"{name}={e.url}" for name, e in engines.items()] + [f"down=unix://{down}"]
+    _set_app_env({"DOCKER_HOSTS": ",".join(hosts), "DOCKER_TIMEOUT_SEC": "10"})
+
+    from services import snapshot
+    from services.docker_service_v3 import _build_stack_summaries
+
+    fakes = list(engines.values())
+    results: Results = {}
+    results["summaries.cold_all_hosts"] = asyncio.run(
+        measure(_build_stack_summaries, spec.get("cold_iterations", 2), fakes, memory=False)
+    )
+
+    from fastapi.testclient import TestClient
+
+    from app import app
+
+    headers = _auth_headers()
+    start = time.perf_counter()
+    with TestClient(app) as client:
+        first = _wait_until(lambda: snapshot.get_refresh_generation() > 0, timeout=30)
+        results["first_summary"] = {"ms": round(first * 1000, 1)}
+        total = per_host * len(engines)
+        every = _wait_until(lambda: len(snapshot._snapshot_containers()) >= total, timeout=60)
+        results["all_hosts_seeded"] = {"ms": round((time.perf_counter() - start) * 1000, 1)}
+        if every >= 60:
+            results["all_hosts_seeded"]["missing"] = total - len(snapshot._snapshot_containers())
+        _wait_quiet(fakes)
+        results.update(_http_cases(client, fakes, spec.get("iterations", 20), {
+            "http.stacks": {"path": "/api/v2/stacks", "headers": headers},
+            "http.hosts": {"path": "/api/v2/hosts", "headers": headers},
+            "http.stack_detail_slow_host": {"path": "/api/v2/stacks/slow:stack0", "headers": headers},
+        }))
+
+    results["process"] = _process_metrics()
+    for e in fakes:
+        e.stop()
+    return results
+
+
+# --------------------------------------------------------------------
+# Escenario "churn": eventos constantes y contenedores colgados
+# --------------------------------------------------------------------
+
+def run_churn(spec: Dict) -> Results:
+    engine = FakeEngine(
+        spec.get("containers", 100),
+        spec.get("stacks", 15),
+        hung=spec.get("hung", 3),
+        hang_sec=spec.get("hang_sec", 30),
+        churn_per_sec=spec.get("churn_per_sec", 20),
+        stream_period=spec.get("stream_period", 1.0),
+    ).start()
+    _set_app_env({"DOCKER_HOST": engine.url, "DOCKER_TIMEOUT_SEC": "5"})
+
+    from services import snapshot
+    from services.perf import get_perf
+
+    hung_stack = next(c.stack for c in engine.containers.values() if c.id in engine.hung)
+    results: Results = {}
+
+    from fastapi.testclient import TestClient
+
+    from app import app
+
+    headers = _auth_headers()
+    with TestClient(app) as client:
+        _wait_until(lambda: snapshot.get_stack_containers(hung_stack), timeout=30)
+        events_before = get_perf()["counters"].get("docker.events", 0)
+        # sin contar llamadas: las del churn (un inspect por evento) son de fondo
+        results.update(_http_cases(client, [], spec.get("iterations", 50), {
+            "http.stacks": {"path": "/api/v2/stacks", "headers": headers},
+            "http.stack_detail_hung": {"path": f"/api/v2/stacks/{hung_stack}", "headers": headers},
+            "http.stack_details_all": {"path": "/api/v2/stack-details", "headers": headers},
+        }))
+        time.sleep(spec.get("churn_sec", 3))
+        events = get_perf()["counters"].get("docker.events", 0) - events_before
+        results["events"] = {"applied": events}
+
+        # se frena el churn y se mira que el registro converja al daemon
+        engine.stop_churn()
+
+        def drift() -> int:
+            with engine._lock:
+                truth = {cid: c.running for cid, c in engine.containers.items()}
+            mine = {c.id: c.attrs["State"]["Running"] for c in snapshot._snapshot_containers()}
+            return sum(1 for cid in truth.keys() | mine.keys() if truth.get(cid) != mine.get(cid))
+
+        converge = _wait_until(lambda: drift() == 0, timeout=10)
+        results["registry"] = {"converge_ms": round(converge * 1000, 1), "drift": drift()}
+
+    results["process"] = _process_metrics()
+    engine.stop()
+    return results
+
+
+SCENARIOS = {
+    "size": run_size,
+    "serialize": run_serialize,
+    "auth": run_auth,
+    "cgroup": run_cgroup,
+    "multihost": run_multihost,
+    "churn": run_churn,
+}
+
+
+def main():
+    spec = json.loads(sys.argv[1])
+    results = SCENARIOS[spec["kind"]](spec)
+    sys.stdout.write("\n" + json.dumps(results) + "\n")
+    sys.stdout.flush()
+    # threads de streams / events / fake: no se espera a que terminen
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,21 @@
 from pydantic import BaseModel
-from typing import List, Literal, Dict
+from typing import List, Literal, Dict, Optional
 
 
 class StackSummary(BaseModel):
-    stack_id: str
+    stack_id: str         # "host:stack" when several Docker hosts are configured
     display_name: str
+    host: Optional[str] = None
     containers_count: int
     status: Literal["healthy", "degraded", "stopped"]
     longest_uptime: str
     cpu_avg: str
     ram_total_used: str
     ram_host_total: str
+    # numeric versions of the fields above (for sorting / charts)
+    cpu_avg_percent: Optional[float] = None
+    ram_used_bytes: Optional[int] = None
+    ram_host_bytes: Optional[int] = None
 
 
 class StackListResponse(BaseModel):
@@ -27,6 +32,12 @@ class ContainerInfo(BaseModel):
     net: str              # "3.83MB / 4.22MB"
     ports: List[str]
     actions: Dict[str, bool]  # { "can_logs": true, ... }
+    # numeric versions of cpu / ram / net (None when there is no sample)
+    cpu_percent: Optional[float] = None
+    mem_used_bytes: Optional[int] = None
+    mem_limit_bytes: Optional[int] = None
+    net_rx_bytes: Optional[int] = None
+    net_tx_bytes: Optional[int] = None
 
 
 class StackDetailSummary(BaseModel):
@@ -34,10 +45,47 @@ class StackDetailSummary(BaseModel):
     cpu_avg: str
     ram_total_used: str
     ram_host_total: str
+    cpu_avg_percent: Optional[float] = None
+    ram_used_bytes: Optional[int] = None
+    ram_host_bytes: Optional[int] = None
 
 
 class StackDetailResponse(BaseModel):
     stack_id: str
     display_name: str
+    host: Optional[str] = None
     summary: StackDetailSummary
     containers: List[ContainerInfo]
+
+
+class StackDetailListResponse(BaseModel):
+    stacks: List[StackDetailResponse]
+
+
+class ContainerMetricsHistoryResponse(BaseModel):
+    container_id: str
+    range: int                # seconds covered
+    step: int                 # seconds between points
+    ts: List[float]           # bucket start (epoch seconds)
+    cpu_percent: List[Optional[float]]
+    mem_used_bytes: List[Optional[float]]
+    net_rx_rate: List[Optional[float]]     # bytes/s
+    net_tx_rate: List[Optional[float]]     # bytes/s
+
+
+class HostStatus(BaseModel):
+    host: str
+    default: bool
+    ok: Optional[bool] = None        # None until the first contact
+    error: Optional[str] = None
+    last_ok: Optional[float] = None  # epoch of the last successful listing
+    latency_ms: Optional[float] = None
+
+
+class HostListResponse(BaseModel):
+    hosts: List[HostStatus]
+
+
+class BulkActionRequest(BaseModel):
+    container_ids: List[str]   # full or short ids, or names
+    ordered: bool = False      # follow compose depends_on (start deps first, stop them last)
@@ -1,15 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import json
+import re
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+import docker
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    WebSocket,
+    status,
+)
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from models.v2 import (
     StackListResponse,
     StackDetailResponse,
+    StackDetailListResponse,
+    ContainerMetricsHistoryResponse,
+    BulkActionRequest,
+    HostListResponse,
 )
-from auth import get_current_user
+from auth import get_current_user, get_token_cache_stats, verify_token
 
 # Read from the in-memory snapshot
 from services.snapshot import (
-    get_summary_snapshot,
+    available_encodings,
+    get_summary_etag,
+    get_summary_body,
     get_detail_snapshot,
+    get_detail_variant,
+    get_details_snapshot,
+    get_stack_container_ids,
+    get_stack_containers,
+    resolve_container,
+)
+from services.actions import ACTIONS, stream_action
+from services.docker_client import get_hosts_health
+from services.exec_session import serve_exec
+from services.log_index import LogQuery, resolve_log_container_id, search_logs
+from services.logs import iter_log_ndjson, open_log_stream, parse_docker_ts
+from services.perf import (
+    PERF_PROFILER_ENABLED,
+    PERF_PROFILER_INTERVAL_MS,
+    PERF_PROFILER_MAX_SEC,
+    get_perf,
+    reset_perf,
+    sample_profile,
 )
+from services.scheduler import get_schedule
+from services.stream import serve_stream
+from services.timeseries import query_series, resolve_series_id
 
 router = APIRouter(
     prefix="/api/v2",
@@ -18,29 +62,566 @@ router = APIRouter(
 )
 
 
+def _etag_matches(request: Request, etag: Optional[str]) -> bool:
+    """
+    True if the client's If-None-Match already names this ETag.
+    """
+    if not etag:
+        return False
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return etag in candidates
+
+
+_ETAG_SUFFIX = {"gzip": "-gz", "br": "-br"}
+
+
+def _variant_etag(etag: Optional[str], encoding: str) -> Optional[str]:
+    """
+    Strong ETag of one encoded representation: the identity, gzip and br
+    bodies differ byte-wise, so each one gets its own tag ("<gen>-gz").
+    """
+    if not etag or encoding not in _ETAG_SUFFIX:
+        return etag
+    return etag[:-1] + _ETAG_SUFFIX[encoding] + '"'
+
+
+def _set_etag(response: Response, etag: Optional[str]):
+    if etag:
+        response.headers["ETag"] = etag
+        # always revalidate: the browser sends If-None-Match and gets a cheap 304
+        response.headers["Cache-Control"] = "private, no-cache"
+
+
+def _not_modified(etag: str) -> Response:
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    response.headers["Vary"] = "Accept-Encoding"
+    _set_etag(response, etag)
+    return response
+
+
+def _pick_encoding(request: Request) -> str:
+    """
+    Best Content-Encoding we have a pre-encoded body for (br > gzip > identity).
+    """
+    accept = request.headers.get("accept-encoding", "")
+    accepted = {
+        part.split(";")[0].strip().lower()
+        for part in accept.split(",")
+        if part.strip() and not part.strip().endswith(";q=0")
+    }
+    for encoding in available_encodings():
+        if encoding == "identity" or encoding in accepted:
+            return encoding
+    return "identity"
+
+
+def _snapshot_response(body: bytes, encoding: str, etag: Optional[str]) -> Response:
+    """
+    Serves pre-serialized snapshot bytes as-is (no Pydantic, no JSON encoding).
+    """
+    response = Response(content=body, media_type="application/json")
+    response.headers["Vary"] = "Accept-Encoding"
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    _set_etag(response, etag)
+    return response
+
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def _parse_duration(value: str, name: str) -> int:
+    """
+    "90" / "90s" / "15m" / "6h" / "7d" -> seconds.
+    """
+    m = re.fullmatch(r"\s*(\d+)\s*([smhd]?)\s*", value or "")
+    if not m:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid {name} '{value}' (use e.g. 90s, 15m, 6h, 7d)",
+        )
+    return int(m.group(1)) * _DURATION_UNITS[m.group(2) or "s"]
+
+
 @router.get("/stacks", response_model=StackListResponse)
-async def list_stacks(user: str = Depends(get_current_user)):
+async def list_stacks(
+    request: Request,
+    user: str = Depends(get_current_user),
+):
     """
-    Returns all stacks with lightweight aggregated info.
+    Returns all stacks with lightweight aggregated info, including live
+    CPU/RAM aggregates per stack.
     Does NOT block by calling the Docker daemon at this moment.
-    Reads the pre-calculated snapshot refreshed in the background every ~2s.
+    Reads the pre-calculated snapshot refreshed in the background (every
+    ~2s while someone is watching, slower when idle).
+    Sends an ETag per snapshot generation and encoding and answers 304 to a
+    matching If-None-Match without re-validating or re-encoding anything.
+    The body is serialized (and gzip/br compressed) once per generation
+    by the snapshot layer and served as raw bytes.
     """
-    stacks = get_summary_snapshot()
-    return {"stacks": stacks}
+    encoding = _pick_encoding(request)
+    etag = _variant_etag(get_summary_etag(), encoding)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+
+    return _snapshot_response(get_summary_body(encoding), encoding, etag)
 
 
 @router.get("/stacks/{stack_id}", response_model=StackDetailResponse)
-async def get_stack(stack_id: str, user: str = Depends(get_current_user)):
+async def get_stack(
+    stack_id: str,
+    request: Request,
+    user: str = Depends(get_current_user),
+):
     """
     Returns detailed info of a stack.
     Uses internal memory cache (get_detail_snapshot).
-    If not cached yet, it calculates it once using the optimized version
-    (stats in parallel only for running containers) and then saves it.
+    If not cached yet, it builds it from the in-memory container registry
+    and the live stats collector (no daemon round-trip) and then saves it.
+    Supports ETag / If-None-Match and pre-serialized bodies like /stacks.
     """
-    stack_detail = get_detail_snapshot(stack_id)
-    if stack_detail is None:
+    encoding = _pick_encoding(request)
+    variant = None
+    if await get_detail_snapshot(stack_id) is not None:
+        # ETag and body read together: the stack may be refreshed or emptied
+        # right after the build, and then this is a 404, not an empty 200
+        variant = get_detail_variant(stack_id, encoding)
+    if variant is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Stack '{stack_id}' not found",
         )
-    return stack_detail
+
+    etag = _variant_etag(variant[0], encoding)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+
+    return _snapshot_response(variant[1], encoding, etag)
+
+
+@router.get("/hosts", response_model=HostListResponse)
+async def list_hosts(user: str = Depends(get_current_user)):
+    """
+    Configured Docker hosts (DOCKER_HOSTS) and their health: whether the
+    last listing / events stream worked, its error and listing latency.
+    With several hosts, stack ids are "host:stack".
+    """
+    return {"hosts": get_hosts_health()}
+
+
+@router.get("/stack-details", response_model=StackDetailListResponse)
+async def list_stack_details(
+    stacks: Optional[str] = Query(
+        default=None,
+        description="Comma-separated stack ids (e.g. ?stacks=a,b,c). All stacks if omitted.",
+    ),
+    user: str = Depends(get_current_user),
+):
+    """
+    Returns the detail of every stack (or of the ?stacks= subset) in one call.
+    Built from a single pass over the container registry and the live stats,
+    so the dashboard doesn't need one /stacks/{id} request per stack.
+    Unknown stack ids are skipped.
+    """
+    stack_ids = None
+    if stacks:
+        stack_ids = [s.strip() for s in stacks.split(",") if s.strip()]
+
+    details = await get_details_snapshot(stack_ids)
+    return {"stacks": details}
+
+
+@router.websocket("/stream")
+async def stream_stacks(websocket: WebSocket, token: str = Query(...)):
+    """
+    Server push of the stacks view.
+    Browsers can't set an Authorization header on a WebSocket, so the JWT
+    comes as ?token=. Sends one {"type": "snapshot"} with every stack summary
+    and container, then {"type": "delta"} messages with only the changed /
+    removed stacks and containers whenever the snapshot changes.
+    """
+    try:
+        verify_token(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    await serve_stream(websocket)
+
+
+@router.websocket("/containers/{container_id}/exec")
+async def exec_session(
+    websocket: WebSocket,
+    container_id: str,
+    token: str = Query(...),
+    cmd: str = Query(default="sh"),
+    cols: Optional[int] = Query(default=None),
+    rows: Optional[int] = Query(default=None),
+):
+    """
+    Interactive shell in a container: one TTY exec for the whole session
+    (instead of one `docker exec` process per command).
+    Client frames: {"type": "input", "data"} and {"type": "resize", "cols", "rows"}.
+    Server frames: {"type": "output", "data"}, {"type": "exit", "code"}, {"type": "error", "message"}.
+    The token travels as ?token= because browsers can't set headers on a WebSocket.
+    """
+    try:
+        verify_token(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    await serve_exec(websocket, container_id, cmd, cols, rows)
+
+
+@router.get(
+    "/containers/{container_id}/metrics",
+    response_model=ContainerMetricsHistoryResponse,
+)
+async def get_container_metrics(
+    container_id: str,
+    range: str = Query(default="15m", description="How far back, e.g. 15m, 6h, 7d"),
+    step: str = Query(default="0", description="Point spacing, e.g. 2s, 30s, 5m (0 = native)"),
+    user: str = Depends(get_current_user),
+):
+    """
+    CPU / RAM / network history of a container from the in-memory ring
+    buffers (2s for 15m, 30s for 6h, 5m for 7d). Picks the finest
+    resolution that covers the range and averages down to `step`.
+    Accepts the short container id the other endpoints return.
+    """
+    range_sec = _parse_duration(range, "range")
+    step_sec = _parse_duration(step, "step")
+    if range_sec <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="range must be greater than 0",
+        )
+
+    series_id = resolve_series_id(container_id)
+    history = (
+        query_series(series_id, range_sec, step_sec, time.time())
+        if series_id
+        else None
+    )
+    if history is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No metrics for container '{container_id}'",
+        )
+    return history
+
+
+@router.get("/containers/{container_id}/logs/stream")
+async def stream_container_logs(
+    container_id: str,
+    tail: int = Query(default=100, description="Lines of history first (-1 = all)"),
+    since: Optional[str] = Query(default=None, description="Resume cursor from a previous line"),
+    follow: bool = Query(default=True),
+    user: str = Depends(get_current_user),
+):
+    """
+    Streams a container's logs as NDJSON ({"ts", "cursor", "line"} per line)
+    through the Docker SDK instead of forking `docker logs`.
+    With follow=true the response stays open and new lines are pushed as
+    they arrive; the reader thread blocks when the client falls behind.
+    Pass the last `cursor` as ?since= to resume without repeating lines.
+    """
+    since_ns = None
+    if since:
+        if not since.isdigit():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="since must be a cursor returned by this endpoint",
+            )
+        since_ns = int(since)
+
+    try:
+        container = await resolve_container(container_id)
+        stream = await open_log_stream(container, tail, since_ns, follow)
+    except docker.errors.NotFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Container '{container_id}' not found",
+        )
+    except docker.errors.APIError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get logs for container {container_id}: {e}",
+        )
+
+    return StreamingResponse(
+        iter_log_ndjson(stream, since_ns),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ------------------ log search ------------------
+
+_SEARCH_BATCH_LINES = 200
+
+
+def _parse_time_bound(value: Optional[str], name: str, now: float) -> Optional[int]:
+    """
+    "15m" (that long ago) or an RFC3339 timestamp -> epoch nanoseconds.
+    """
+    if not value:
+        return None
+    if re.fullmatch(r"\s*\d+\s*[smhd]?\s*", value):
+        return int((now - _parse_duration(value, name)) * 1_000_000_000)
+    ts_ns = parse_docker_ts(value.strip())
+    if ts_ns is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid {name} '{value}' (use e.g. 15m or 2024-05-01T10:00:00Z)",
+        )
+    return ts_ns
+
+
+def _ndjson_batches(items: Iterator[dict]) -> Iterator[bytes]:
+    batch = []
+    for item in items:
+        batch.append(json.dumps(item))
+        if len(batch) >= _SEARCH_BATCH_LINES:
+            yield ("\n".join(batch) + "\n").encode()
+            batch = []
+    if batch:
+        yield ("\n".join(batch) + "\n").encode()
+
+
+def _search_response(
+    container_ids: List[str],
+    q: Optional[str],
+    regex: bool,
+    case_sensitive: bool,
+    levels: Optional[str],
+    since: Optional[str],
+    until: Optional[str],
+    cursor: Optional[str],
+    limit: int,
+) -> StreamingResponse:
+    now = time.time()
+    try:
+        query = LogQuery(
+            q=q,
+            regex=regex,
+            case_sensitive=case_sensitive,
+            levels=levels.split(",") if levels else None,
+            since_ns=_parse_time_bound(since, "since", now),
+            until_ns=_parse_time_bound(until, "until", now),
+            cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    # sync generator: Starlette runs it in the threadpool, off the event loop
+    return StreamingResponse(
+        _ndjson_batches(search_logs(container_ids, query, limit)),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.get("/containers/{container_id}/logs/search")
+async def search_container_logs(
+    container_id: str,
+    q: Optional[str] = Query(default=None, description="Text to look for"),
+    regex: bool = Query(default=False, description="Treat q as a regular expression"),
+    case_sensitive: bool = Query(default=False),
+    levels: Optional[str] = Query(default=None, description="e.g. error,warn"),
+    since: Optional[str] = Query(default=None, description="15m or RFC3339"),
+    until: Optional[str] = Query(default=None, description="15m or RFC3339"),
+    cursor: Optional[str] = Query(default=None, description="next_cursor of the previous page"),
+    limit: int = Query(default=200, ge=1, le=5000),
+    user: str = Depends(get_current_user),
+):
+    """
+    Searches the server-side log index of one container, newest first.
+    NDJSON: one {"container_id", "ts", "cursor", "level", "line"} per match,
+    then a final {"next_cursor"} (null on the last page).
+    """
+    log_id = resolve_log_container_id(container_id)
+    if log_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No indexed logs for container '{container_id}'",
+        )
+    return _search_response(
+        [log_id], q, regex, case_sensitive, levels, since, until, cursor, limit
+    )
+
+
+@router.get("/stacks/{stack_id}/logs/search")
+async def search_stack_logs(
+    stack_id: str,
+    q: Optional[str] = Query(default=None, description="Text to look for"),
+    regex: bool = Query(default=False, description="Treat q as a regular expression"),
+    case_sensitive: bool = Query(default=False),
+    levels: Optional[str] = Query(default=None, description="e.g. error,warn"),
+    since: Optional[str] = Query(default=None, description="15m or RFC3339"),
+    until: Optional[str] = Query(default=None, description="15m or RFC3339"),
+    cursor: Optional[str] = Query(default=None, description="next_cursor of the previous page"),
+    limit: int = Query(default=200, ge=1, le=5000),
+    user: str = Depends(get_current_user),
+):
+    """
+    Same as the container search, across every container of the stack
+    ("grep the whole stack"); matches are interleaved by timestamp.
+    """
+    container_ids = get_stack_container_ids(stack_id)
+    if not container_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Stack '{stack_id}' not found",
+        )
+    return _search_response(
+        container_ids, q, regex, case_sensitive, levels, since, until, cursor, limit
+    )
+
+
+# ------------------ lifecycle actions ------------------
+
+def _check_action(action: str):
+    if action not in ACTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown action '{action}' (use {', '.join(ACTIONS)})",
+        )
+
+
+async def _ndjson_events(events: AsyncIterator[Dict]) -> AsyncIterator[bytes]:
+    async for event in events:
+        yield (json.dumps(event) + "\n").encode()
+
+
+def _action_response(containers: List, action: str, ordered: bool) -> StreamingResponse:
+    return StreamingResponse(
+        _ndjson_events(stream_action(containers, action, ordered)),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/stacks/{stack_id}/actions/{action}")
+async def stack_action(
+    stack_id: str,
+    action: str,
+    ordered: bool = Query(default=True, description="Follow compose depends_on"),
+    user: str = Depends(get_current_user),
+):
+    """
+    start / stop / restart every container of a stack, several at a time.
+    Streams NDJSON progress: a "plan", then "started" / "done" per
+    container, then a "summary".
+    """
+    _check_action(action)
+    containers = get_stack_containers(stack_id)
+    if not containers:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Stack '{stack_id}' not found",
+        )
+    return _action_response(containers, action, ordered)
+
+
+@router.post("/containers/actions/{action}")
+async def bulk_container_action(
+    action: str,
+    body: BulkActionRequest,
+    user: str = Depends(get_current_user),
+):
+    """
+    start / stop / restart a list of containers (any stacks) in one request,
+    with the same NDJSON progress stream as the stack endpoint.
+    """
+    _check_action(action)
+    containers = []
+    seen = set()
+    for ref in body.container_ids:
+        try:
+            container = await resolve_container(ref)
+        except docker.errors.NotFound:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Container '{ref}' not found",
+            )
+        if container.id not in seen:
+            seen.add(container.id)
+            containers.append(container)
+
+    if not containers:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="container_ids is empty",
+        )
+    return _action_response(containers, action, body.ordered)
+
+
+# ------------------ debug ------------------
+
+@router.get("/debug/auth-cache")
+async def debug_auth_cache(user: str = Depends(get_current_user)):
+    """
+    Verified-token cache: size, hits, misses and hit rate.
+    """
+    return get_token_cache_stats()
+
+
+@router.get("/debug/schedule")
+async def debug_schedule(user: str = Depends(get_current_user)):
+    """
+    Effective refresh intervals right now: summary cadence, detail TTL,
+    reconcile interval, the load stretch factor and the watched stacks.
+    """
+    return get_schedule()
+
+
+@router.get("/debug/perf")
+async def debug_perf(
+    reset: bool = Query(default=False, description="Clear every timer and counter after reading"),
+    user: str = Depends(get_current_user),
+):
+    """
+    Timing histograms (count, sum, max, bucket-bound p50/p95/p99 in ms) per
+    pipeline phase, route, daemon API call and event-loop lag, plus counters
+    (daemon calls, bytes read, cache fresh/stale/miss, responses per status).
+    """
+    perf = get_perf()
+    perf["auth_cache"] = get_token_cache_stats()
+    if reset:
+        reset_perf()
+    return perf
+
+
+@router.post("/debug/perf/profile", response_class=PlainTextResponse)
+async def debug_perf_profile(
+    seconds: float = Query(default=10, gt=0, le=PERF_PROFILER_MAX_SEC),
+    interval_ms: float = Query(default=PERF_PROFILER_INTERVAL_MS, ge=1, le=1000),
+    user: str = Depends(get_current_user),
+):
+    """
+    Samples every thread's stack for `seconds` and returns them in collapsed
+    format ("thread;module:function;... count" per line), ready for
+    flamegraph.pl or speedscope. Opt-in: needs PERF_PROFILER_ENABLED=1.
+    One profile at a time.
+    """
+    if not PERF_PROFILER_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profiler disabled (set PERF_PROFILER_ENABLED=1)",
+        )
+    dump = await asyncio.to_thread(sample_profile, seconds, interval_ms)
+    if dump is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A profile is already running",
+        )
+    return PlainTextResponse(dump)
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Dict, List
+
+import docker
+
+from services.docker_client import run_docker_io
+from services.snapshot import refresh_containers
+
+log = logging.getLogger(__name__)
+
+# --------------------------------------------------------------------
+# Acciones start/stop/restart sobre varios contenedores
+# --------------------------------------------------------------------
+#
+# Se ejecutan en paralelo (acotado por ACTION_CONCURRENCY) y cada
+# contenedor reporta su progreso como un evento. Con `ordered` se respeta
+# el depends_on de compose: start/restart arrancan primero las
+# dependencias, stop las para al final.
+#
+# Eventos (NDJSON):
+#   {"type": "plan", "action", "levels": [[nombre, ...], ...]}
+#   {"type": "started", "container_id", "name"}
+#   {"type": "done", "container_id", "name", "ok", "error", "elapsed_ms"}
+#   {"type": "summary", "action", "ok", "failed", "elapsed_ms"}
+
+ACTIONS = ("start", "stop", "restart")
+ACTION_CONCURRENCY = 4      # < DOCKER_IO_WORKERS: un stop lento no acapara el executor
+
+_PROJECT_LABEL = "com.docker.compose.project"
+_SERVICE_LABEL = "com.docker.compose.service"
+_DEPENDS_ON_LABEL = "com.docker.compose.depends_on"
+
+_END = object()
+
+# tareas en curso: la acción termina aunque el cliente se desconecte
+_RUNNING: set = set()
+
+
+def _labels(container) -> Dict[str, str]:
+    return container.attrs.get("Config", {}).get("Labels", {}) or {}
+
+
+def _depends_on(container) -> List[str]:
+    """
+    "db:service_healthy:false,redis:service_started:false" -> ["db", "redis"]
+    """
+    raw = _labels(container).get(_DEPENDS_ON_LABEL) or ""
+    return [part.split(":")[0].strip() for part in raw.split(",") if part.strip()]
+
+
+def plan_levels(containers: List, action: str, ordered: bool) -> List[List]:
+    """
+    Agrupa los contenedores en niveles: todos los de un nivel corren en
+    paralelo y un nivel empieza cuando termina el anterior.
+    Sin `ordered` (o sin depends_on) es un solo nivel. Sólo cuentan las
+    dependencias que están dentro del mismo pedido; un ciclo se resuelve
+    mandando lo que quede al último nivel.
+    """
+    if not ordered or len(containers) < 2:
+        return [list(containers)] if containers else []
+
+    by_service: Dict[tuple, List] = {}
+    for c in containers:
+        labels = _labels(c)
+        key = (labels.get(_PROJECT_LABEL), labels.get(_SERVICE_LABEL))
+        by_service.setdefault(key, []).append(c)
+
+    deps: Dict[str, set] = {}
+    for c in containers:
+        project = _labels(c).get(_PROJECT_LABEL)
+        deps[c.id] = {
+            dep.id
+            for service in _depends_on(c)
+            for dep in by_service.get((project, service), [])
+            if dep.id != c.id
+        }
+
+    levels: List[List] = []
+    pending = list(containers)
+    done: set = set()
+    while pending:
+        level = [c for c in pending if deps[c.id] <= done]
+        if not level:
+            level = pending  # ciclo
+        levels.append(level)
+        done.update(c.id for c in level)
+        pending = [c for c in pending if c.id not in done]
+
+    if action == "stop":
+        levels.reverse()
+    return levels
+
+
+async def _run_one(container, action: str, sem: asyncio.Semaphore, emit) -> bool:
+    async with sem:
+        emit({"type": "started", "container_id": container.short_id, "name": container.name})
+        start = time.monotonic()
+        error = None
+        try:
+            await run_docker_io(getattr(container, action))
+        except docker.errors.APIError as e:
+            error = str(e.explanation or e)
+        except Exception as e:
+            error = str(e)
+        emit({
+            "type": "done",
+            "container_id": container.short_id,
+            "name": container.name,
+            "ok": error is None,
+            "error": error,
+            "elapsed_ms": round((time.monotonic() - start) * 1000),
+        })
+        return error is None
+
+
+async def _run_action(containers: List, action: str, ordered: bool, emit):
+    start = time.monotonic()
+    levels = plan_levels(containers, action, ordered)
+    emit({
+        "type": "plan",
+        "action": action,
+        "levels": [[c.name for c in level] for level in levels],
+    })
+
+    sem = asyncio.Semaphore(ACTION_CONCURRENCY)
+    ok = failed = 0
+    try:
+        for level in levels:
+            results = await asyncio.gather(*(_run_one(c, action, sem, emit) for c in level))
+            ok += sum(results)
+            failed += len(results) - sum(results)
+    finally:
+        # el registro se entera ya, sin esperar al evento de Docker
+        try:
+            await run_docker_io(refresh_containers, [c.id for c in containers])
+        except Exception as e:
+            log.warning("refresh after %s failed: %s", action, e)
+
+    emit({
+        "type": "summary",
+        "action": action,
+        "ok": ok,
+        "failed": failed,
+        "elapsed_ms": round((time.monotonic() - start) * 1000),
+    })
+
+
+async def stream_action(containers: List, action: str, ordered: bool) -> AsyncIterator[Dict]:
+    """
+    Lanza la acción sobre `containers` y va devolviendo los eventos de
+    progreso. La acción corre en su propia tarea: si el cliente corta el
+    stream, igual termina (y refresca el registro).
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def runner():
+        try:
+            await _run_action(containers, action, ordered, queue.put_nowait)
+        finally:
+            queue.put_nowait(_END)
+
+    task = asyncio.create_task(runner())
+    _RUNNING.add(task)
+    task.add_done_callback(_RUNNING.discard)
+
+    while True:
+        event = await queue.get()
+        if event is _END:
+            return
+        yield event
@@ -0,0 +1,212 @@
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import docker
+
+from services.perf import instrument_docker_client
+
+log = logging.getLogger(__name__)
+
+# --------------------------------------------------------------------------------------
+# Cliente Docker compartido (SDK sobre el unix socket, con pool de conexiones)
+# --------------------------------------------------------------------------------------
+#
+# Todo el backend habla con el daemon por este único cliente: nada de
+# `docker` CLI por subprocess. Las llamadas bloqueantes que salen del event
+# loop pasan por run_docker_io (executor acotado), así ninguna corutina
+# espera al daemon en el loop.
+#
+# Con DOCKER_HOSTS el panel federa varios daemons: un cliente (y un pool) por
+# host. Cada contenedor sabe de qué host viene por su `.client` (host_of), y
+# los stack_id pasan a ser "host:stack" (namespaced) para no mezclar stacks
+# homónimos de hosts distintos. Sin DOCKER_HOSTS hay un solo host ("local")
+# y los stack_id quedan como siempre.
+#
+# Config por entorno:
+#   DOCKER_HOST          el de siempre (unix:///var/run/docker.sock por defecto)
+#   DOCKER_HOSTS         "nombre=url,nombre=url" (unix://, tcp://); pisa DOCKER_HOST
+#   DOCKER_TLS_DIR       con DOCKER_HOSTS: <dir>/<nombre>/{ca,cert,key}.pem para los tcp:// con TLS
+#   DOCKER_POOL_SIZE     conexiones HTTP reutilizables contra cada daemon
+#   DOCKER_TIMEOUT_SEC   timeout de cada request, por host (los streams de logs/events no lo usan)
+#   DOCKER_IO_WORKERS    threads del executor de docker-io
+
+DOCKER_HOSTS = os.getenv("DOCKER_HOSTS", "").strip()
+DOCKER_TLS_DIR = os.getenv("DOCKER_TLS_DIR") or None
+DOCKER_POOL_SIZE = int(os.getenv("DOCKER_POOL_SIZE", "32"))
+DOCKER_TIMEOUT_SEC = int(os.getenv("DOCKER_TIMEOUT_SEC", "30"))
+DOCKER_IO_WORKERS = int(os.getenv("DOCKER_IO_WORKERS", "8"))
+
+LOCAL_HOST = "local"
+# API de un host que no contestó /version al arrancar (Docker 20.10+); el
+# cliente queda armado y el host se marca caído en su primer reconcile
+FALLBACK_API_VERSION = "1.41"
+
+
+def _parse_hosts(raw: str) -> List[Tuple[str, str]]:
+    """
+    "a=unix:///var/run/docker.sock, b=tcp://10.0.0.5:2376" -> [(nombre, url)].
+    Sin "nombre=" se usa el host de la url (o "local" para unix://).
+    """
+    hosts: List[Tuple[str, str]] = []
+    for entry in raw.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, sep, url = entry.partition("=")
+        if not sep:
+            url = entry
+            name = urlparse(url).hostname or LOCAL_HOST
+        name, url = name.strip(), url.strip()
+        if ":" in name or any(name == n for n, _ in hosts):
+            raise ValueError(f"DOCKER_HOSTS: invalid or repeated host name '{name}'")
+        hosts.append((name, url))
+    return hosts
+
+
+def _make_client(name: str, url: str):
+    tls = None
+    if DOCKER_TLS_DIR and url.startswith(("tcp://", "https://")):
+        cert_dir = os.path.join(DOCKER_TLS_DIR, name)
+        if os.path.isdir(cert_dir):
+            tls = docker.tls.TLSConfig(
+                client_cert=(os.path.join(cert_dir, "cert.pem"), os.path.join(cert_dir, "key.pem")),
+                ca_cert=os.path.join(cert_dir, "ca.pem"),
+                verify=True,
+            )
+    kwargs = dict(base_url=url, tls=tls, timeout=DOCKER_TIMEOUT_SEC, max_pool_size=DOCKER_POOL_SIZE)
+    try:
+        return docker.DockerClient(**kwargs)
+    except docker.errors.DockerException as e:
+        # negociar la versión pide /version: un host caído no puede tirar el panel entero
+        log.warning("docker host %s unreachable at startup (%s); using API %s", name, e, FALLBACK_API_VERSION)
+        return docker.DockerClient(version=FALLBACK_API_VERSION, **kwargs)
+
+
+# nombre -> cliente, en el orden de DOCKER_HOSTS (el primero es el default)
+HOSTS: Dict[str, object] = {}
+if DOCKER_HOSTS:
+    for _name, _url in _parse_hosts(DOCKER_HOSTS):
+        HOSTS[_name] = _make_client(_name, _url)
+else:
+    HOSTS[LOCAL_HOST] = docker.from_env(
+        timeout=DOCKER_TIMEOUT_SEC,
+        max_pool_size=DOCKER_POOL_SIZE,
+    )
+
+# cada request al daemon queda contada en services.perf (por método + ruta)
+for _host_client in HOSTS.values():
+    instrument_docker_client(_host_client)
+
+DEFAULT_HOST = next(iter(HOSTS))
+MULTI_HOST = len(HOSTS) > 1
+
+# cliente del host default: lo que no es por contenedor (v1 legacy, fallbacks)
+client = HOSTS[DEFAULT_HOST]
+
+_CLIENT_HOST: Dict[int, str] = {id(c): name for name, c in HOSTS.items()}
+
+
+def host_of(container) -> str:
+    """
+    Nombre del host del que salió un contenedor (por su cliente).
+    """
+    return _CLIENT_HOST.get(id(getattr(container, "client", None)), DEFAULT_HOST)
+
+
+def namespaced(host: str, name: str) -> str:
+    """
+    stack_id visible: "host:stack" si hay varios hosts, el nombre pelado si no.
+    """
+    return f"{host}:{name}" if MULTI_HOST else name
+
+
+# --------------------------------------------------------------------------------------
+# Salud por host
+# --------------------------------------------------------------------------------------
+
+# nombre -> {"ok", "error", "last_ok", "latency_ms"}; ok=None hasta el primer contacto
+_HOST_HEALTH: Dict[str, Dict] = {
+    name: {"ok": None, "error": None, "last_ok": None, "latency_ms": None}
+    for name in HOSTS
+}
+
+
+def mark_host(name: str, ok: bool, error: Optional[str] = None, latency: Optional[float] = None):
+    health = _HOST_HEALTH[name]
+    health["ok"] = ok
+    health["error"] = None if ok else error
+    if ok:
+        health["last_ok"] = time.time()
+        if latency is not None:
+            health["latency_ms"] = round(latency * 1000, 1)
+
+
+def host_healthy(name: str) -> bool:
+    return _HOST_HEALTH[name]["ok"] is not False
+
+
+def get_hosts_health() -> List[Dict]:
+    return [
+        {"host": name, "default": name == DEFAULT_HOST, **health}
+        for name, health in _HOST_HEALTH.items()
+    ]
+
+
+def find_on_hosts(container_ref: str):
+    """
+    containers.get() en cada host hasta encontrarlo (bloqueante). Un host
+    caído se saltea. Levanta docker.errors.NotFound si no está en ninguno.
+    Es el fallback para refs que no están en el registro del snapshot.
+    """
+    for name, host_client in HOSTS.items():
+        try:
+            return host_client.containers.get(container_ref)
+        except docker.errors.NotFound:
+            continue
+        except Exception as e:
+            mark_host(name, False, str(e))
+    raise docker.errors.NotFound(f"No such container: {container_ref}")
+
+# Executor acotado para TODO el I/O bloqueante contra el daemon que se dispara
+# desde el event loop (snapshot, routers). Así un build lento no frena
+# /healthz, login, logs, etc.
+_docker_io_executor = ThreadPoolExecutor(
+    max_workers=DOCKER_IO_WORKERS,
+    thread_name_prefix="docker-io",
+)
+
+
+async def run_docker_io(fn, *args, **kwargs):
+    """
+    Run a blocking Docker call on the bounded docker-io executor and await it,
+    so coroutines never block the event loop on the daemon.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _docker_io_executor,
+        functools.partial(fn, *args, **kwargs),
+    )
+
+
+def put_from_thread(queue: asyncio.Queue, loop, item, stop: threading.Event) -> bool:
+    """
+    Blocking put into an asyncio.Queue from a reader thread. When the queue
+    is full the THREAD waits (not the event loop): that is the backpressure
+    towards the daemon. Returns False if `stop` was set while waiting.
+    """
+    fut = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+    while True:
+        try:
+            fut.result(timeout=1)
+            return True
+        except TimeoutError:
+            if stop.is_set():
+                fut.cancel()
+                return False
@@ -1,8 +1,9 @@
-import docker
 from datetime import datetime, timezone
 from typing import Dict, List, Tuple
 import re
 
+from services.docker_client import client
+
 
 def _split_mem(mem_usage: str) -> Tuple[str, str]:
     """
@@ -169,7 +170,6 @@ def collect_v2_data():
     - all_stacks_summary: list of stacks summaries for /api/v2/stacks
     - stacks_detail_map: dict[stack_id] -> detailed stack view for /api/v2/stacks/{id}
     """
-    client = docker.from_env()
 
     stacks: Dict[str, Dict] = {}
 
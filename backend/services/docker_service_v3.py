@@ -1,24 +1,25 @@
-import docker
+import logging
 import re
-import time
 from datetime import datetime, timezone
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# --------------------------------------------------------------------------------------
-# Global Docker client + cache config
-# --------------------------------------------------------------------------------------
-
-_client = docker.from_env()
+from services.docker_client import HOSTS, MULTI_HOST, host_of, namespaced
+from services.metrics import (
+    ContainerMetrics,
+    format_cpu,
+    format_mem,
+    format_net,
+    metrics_from_stats,
+)
+from services.perf import timed
 
-STACK_SUMMARY_TTL_SEC = 2
-STACK_DETAIL_TTL_SEC = 2
+log = logging.getLogger(__name__)
 
-_cache_summaries: Optional[List[Dict]] = None
-_cache_summaries_ts: float = 0.0
-
-_cache_details: Dict[str, Dict] = {}
-_cache_details_ts: Dict[str, float] = {}
+# --------------------------------------------------------------------------------------
+# Config (el cliente Docker compartido vive en services.docker_client; los
+# caches de summary/detalle, en services.snapshot)
+# --------------------------------------------------------------------------------------
 
 _MAX_WORKERS = 4  # max parallel stats calls
 
@@ -29,21 +30,18 @@ _MAX_WORKERS = 4  # max parallel stats calls
 
 def _iter_all_containers():
     """
-    Return all containers (running + stopped).
+    Return all containers (running + stopped) of every host. A host that
+    fails is skipped (its stacks just don't show up in this listing).
     """
-    return _client.containers.list(all=True)
-
-
-def _split_mem(mem_usage: str) -> Tuple[str, str]:
-    """
-    "41.27MiB / 5.783GiB" -> ("41.27MiB", "5.783GiB")
-    """
-    parts = [p.strip() for p in mem_usage.split("/")]
-    if len(parts) == 2:
-        return parts[0], parts[1]
-    if len(parts) == 1:
-        return parts[0], "N/A"
-    return ("N/A", "N/A")
+    containers: List = []
+    for name, host_client in HOSTS.items():
+        try:
+            with timed("docker.list"):
+                # ignore_removed: uno borrado entre el listado y su inspect no tira todo
+                containers.extend(host_client.containers.list(all=True, ignore_removed=True))
+        except Exception as e:
+            log.warning("listing containers of host %s failed: %s", name, e)
+    return containers
 
 
 def _uptime_from_started_at(started_at: str) -> str:
@@ -102,16 +100,22 @@ def _stack_name_for_container(container) -> str:
     1. com.docker.compose.project label si existe
     2. si no, prefijo antes del primer '-' del nombre
     3. si no, el nombre completo
+    Con varios hosts va prefijado con el host ("host:stack").
     """
     labels = container.attrs.get("Config", {}).get("Labels", {}) or {}
-    compose_project = labels.get("com.docker.compose.project")
-    if compose_project:
-        return compose_project
+    stack = labels.get("com.docker.compose.project")
+    if not stack:
+        stack = getattr(container, "name", "") or ""
+        if "-" in stack:
+            stack = stack.split("-")[0]
+    return namespaced(host_of(container), stack)
+
 
-    name = getattr(container, "name", "") or ""
-    if "-" in name:
-        return name.split("-")[0]
-    return name
+def _display_name(stack_id: str) -> str:
+    """
+    "host:stack" -> "stack" (el host ya va en su propio campo).
+    """
+    return stack_id.partition(":")[2] if MULTI_HOST else stack_id
 
 
 def _format_ports(container) -> List[str]:
@@ -138,137 +142,29 @@ def _format_ports(container) -> List[str]:
 # Stats (caro). Lo aislamos y lo hacemos paralelo solo para contenedores running.
 # --------------------------------------------------------------------------------------
 
-def _get_stats_for_container(container) -> Dict[str, str]:
+def _get_stats_for_container(container) -> ContainerMetrics:
     """
     Usa container.stats(stream=False).
-    Calcula CPU %, RAM usada/limite y Net I/O total.
+    Calcula CPU, RAM usada/limite y Net I/O total (numéricos).
     Puede levantar excepciones si el contenedor está en un estado raro.
     """
-    stats = container.stats(stream=False)
-
-    # CPU %
-    try:
-        cpu_total = stats["cpu_stats"]["cpu_usage"]["total_usage"]
-        cpu_prev_total = stats["precpu_stats"]["cpu_usage"]["total_usage"]
-
-        system_total = stats["cpu_stats"].get("system_cpu_usage")
-        system_prev_total = stats["precpu_stats"].get("system_cpu_usage")
-
-        cpu_delta = cpu_total - cpu_prev_total
-        system_delta = (
-            (system_total - system_prev_total)
-            if (system_total is not None and system_prev_total is not None)
-            else 0
-        )
-
-        cpu_count = (
-            stats["cpu_stats"].get("online_cpus")  # new docker
-            or len(
-                stats["cpu_stats"]["cpu_usage"].get("percpu_usage", [])
-            )                                       # old docker
-            or 1
-        )
-
-        perc = 0.0
-        if system_delta > 0 and cpu_delta > 0 and cpu_count > 0:
-            # official Docker formula:
-            # CPU% = (cpu_delta / system_delta) * cpu_count * 100
-            perc = (cpu_delta / system_delta) * cpu_count * 100.0
-
-        cpu_perc = f"{perc:.2f}%"
-        print("CPU %:", cpu_perc)
-    except Exception as e:
-        print("Error calculando CPU %: ", e)
-        cpu_perc = "N/A"
-
-    # Mem "xx / yy"
-    try:
-        mem_usage = stats["memory_stats"]["usage"]
-        mem_limit = stats["memory_stats"]["limit"]
-
-        def _fmt_bytes(n: float) -> str:
-            gib = n / (1024 ** 3)
-            mib = n / (1024 ** 2)
-            if gib >= 1:
-                return f"{gib:.3f}GiB"
-            return f"{mib:.2f}MiB"
-
-        mem_usage_h = _fmt_bytes(mem_usage)
-        mem_limit_h = _fmt_bytes(mem_limit)
-        mem_usage_str = f"{mem_usage_h} / {mem_limit_h}"
-    except Exception:
-        mem_usage_str = "N/A"
-
-    # Net "rx / tx"
-    try:
-        networks = stats.get("networks", {})
-        rx_total = 0
-        tx_total = 0
-        for _, data in networks.items():
-            rx_total += data.get("rx_bytes", 0)
-            tx_total += data.get("tx_bytes", 0)
-
-        def _fmt_net(n: float) -> str:
-            mb = n / (1024 ** 2)
-            if mb >= 1:
-                return f"{mb:.2f}MB"
-            kb = n / 1024
-            return f"{kb:.2f}kB"
-
-        net_io_str = f"{_fmt_net(rx_total)} / {_fmt_net(tx_total)}"
-    except Exception:
-        net_io_str = "N/A"
-
-    return {
-        "cpu": cpu_perc,
-        "mem": mem_usage_str,
-        "net": net_io_str,
-    }
+    return metrics_from_stats(container.stats(stream=False))
 
 
-def _safe_stats(container) -> Dict[str, str]:
+def _safe_stats(container) -> Optional[ContainerMetrics]:
     """
     Wrapper que nunca rompe.
     """
     try:
         return _get_stats_for_container(container)
     except Exception:
-        return {"cpu": "N/A", "mem": "N/A", "net": "N/A"}
+        return None
 
 
 # --------------------------------------------------------------------------------------
-# Conversión de memoria a bytes / formatos humanos
+# Formatos humanos
 # --------------------------------------------------------------------------------------
 
-def _parse_mem_to_bytes(s: str) -> Optional[int]:
-    """
-    "41.27MiB" -> bytes
-    "5.783GiB" -> bytes
-    """
-    m = re.match(r"([0-9.]+)(MiB|GiB)", s)
-    if not m:
-        return None
-    val = float(m.group(1))
-    unit = m.group(2)
-    if unit == "GiB":
-        return int(val * (1024 ** 3))
-    if unit == "MiB":
-        return int(val * (1024 ** 2))
-    return None
-
-
-def _mem_bytes_from_stat_string(mem_str: str) -> Tuple[Optional[int], Optional[int]]:
-    """
-    Dado "41.27MiB / 5.783GiB" -> (used_bytes, limit_bytes)
-    """
-    if mem_str == "N/A":
-        return (None, None)
-    used_str, limit_str = _split_mem(mem_str)
-    used_bytes = _parse_mem_to_bytes(used_str)
-    limit_bytes = _parse_mem_to_bytes(limit_str)
-    return used_bytes, limit_bytes
-
-
 def _fmt_seconds(sec: int) -> str:
     """
     7322 -> "2h" o "12m"
@@ -293,42 +189,77 @@ def _fmt_bytes_to_human(n: int) -> str:
     return f"{mib:.0f}MiB"
 
 
+def _stack_totals(cpu_avg: Optional[float], ram_used: int, ram_host: int) -> Dict:
+    """
+    Agregados de un stack (numéricos) -> campos del summary, en string y en
+    número. cpu_avg es fracción de un core (None si no hay samples).
+    """
+    return {
+        "cpu_avg": f"{cpu_avg * 100:.2f}%" if cpu_avg is not None else "0.00%",
+        "ram_total_used": _fmt_bytes_to_human(ram_used),
+        "ram_host_total": _fmt_bytes_to_human(ram_host) if ram_host else "N/A",
+        "cpu_avg_percent": round(cpu_avg * 100, 4) if cpu_avg is not None else None,
+        "ram_used_bytes": ram_used,
+        "ram_host_bytes": ram_host or None,
+    }
+
+
 # --------------------------------------------------------------------------------------
 # Summary: rápido, sin stats
 # --------------------------------------------------------------------------------------
 
-def _build_stack_summaries() -> List[Dict]:
+def _group_by_stack(containers: Iterable) -> Dict[str, List]:
+    """
+    stack_id -> contenedores, en orden de aparición.
+    """
+    groups: Dict[str, List] = {}
+    for c in containers:
+        groups.setdefault(_stack_name_for_container(c), []).append(c)
+    return groups
+
+
+def _build_stack_summaries(
+    containers: Optional[Iterable] = None,
+    aggregate_lookup: Optional[Callable[[str], Tuple[Optional[float], int, int]]] = None,
+    groups: Optional[Dict[str, List]] = None,
+) -> List[Dict]:
     """
     Para /api/v2/stacks.
     Rápido:
     - NO llama container.stats()
     - Calcula count, longest_uptime, status ("healthy"/"degraded"/"stopped")
-    - cpu_avg / ram_* -> "N/A"
+    - cpu_avg / ram_* -> de `aggregate_lookup` (stack_id -> (cpu_avg, ram_used,
+      ram_host) ya calculados, ej. el collector de stats) o "N/A" si no se pasa.
+    Si se pasa `containers` (ej. el snapshot en memoria) no se lista el daemon;
+    si se pasa `groups` (stack_id -> contenedores, ej. el índice del snapshot)
+    ni siquiera se agrupa.
     """
-    stacks: Dict[str, Dict] = {}
+    if groups is None:
+        if containers is None:
+            containers = _iter_all_containers()
+        with timed("summary.group"):
+            groups = _group_by_stack(containers)
 
-    for c in _iter_all_containers():
-        stack_id = _stack_name_for_container(c)
-        state_class = _classify_state(c)
+    with timed("summary.assemble"):
+        return _assemble_stack_summaries(groups, aggregate_lookup)
 
-        started_at = c.attrs.get("State", {}).get("StartedAt", "")
-        uptime_sec = _uptime_seconds(started_at)
-
-        if stack_id not in stacks:
-            stacks[stack_id] = {
-                "count": 0,
-                "longest_uptime": 0,
-                "health_flags": [],
-            }
-
-        stacks[stack_id]["count"] += 1
-        stacks[stack_id]["health_flags"].append(state_class)
-        if uptime_sec > stacks[stack_id]["longest_uptime"]:
-            stacks[stack_id]["longest_uptime"] = uptime_sec
 
+def _assemble_stack_summaries(
+    groups: Dict[str, List],
+    aggregate_lookup: Optional[Callable[[str], Tuple[Optional[float], int, int]]],
+) -> List[Dict]:
+    """
+    Un dict de StackSummary por grupo no vacío (estado, uptime, agregados).
+    """
     summaries: List[Dict] = []
-    for stack_id, data in stacks.items():
-        health_flags = data["health_flags"]
+    for stack_id, members in groups.items():
+        if not members:
+            continue
+        health_flags = [_classify_state(c) for c in members]
+        longest_uptime = max(0, max(
+            _uptime_seconds(c.attrs.get("State", {}).get("StartedAt", ""))
+            for c in members
+        ))
         if all(s == "stopped" for s in health_flags):
             status_val = "stopped"
         elif any(s == "unhealthy" for s in health_flags):
@@ -336,15 +267,19 @@ def _build_stack_summaries() -> List[Dict]:
         else:
             status_val = "healthy"
 
+        if aggregate_lookup is not None:
+            totals = _stack_totals(*aggregate_lookup(stack_id))
+        else:
+            totals = {"cpu_avg": "N/A", "ram_total_used": "N/A", "ram_host_total": "N/A"}
+
         summaries.append({
             "stack_id": stack_id,
-            "display_name": stack_id,
-            "containers_count": data["count"],
+            "display_name": _display_name(stack_id),
+            "host": host_of(members[0]),
+            "containers_count": len(members),
             "status": status_val,
-            "longest_uptime": _fmt_seconds(data["longest_uptime"]),
-            "cpu_avg": "N/A",
-            "ram_total_used": "N/A",
-            "ram_host_total": "N/A",
+            "longest_uptime": _fmt_seconds(longest_uptime),
+            **totals,
         })
 
     return summaries
@@ -354,54 +289,122 @@ def _build_stack_summaries() -> List[Dict]:
 # Detail: paralelo para stats sólo en contenedores running
 # --------------------------------------------------------------------------------------
 
-def _build_stack_detail(stack_id: str) -> Optional[Dict]:
+def _collect_stats(
+    containers: List,
+    stats_lookup: Optional[Callable[[str], Optional[ContainerMetrics]]] = None,
+) -> Dict[str, ContainerMetrics]:
     """
-    Para /api/v2/stacks/{stack_id}.
-    - Reúne contenedores del stack.
-    - Corre stats() SOLO en los que están "running", en paralelo (ThreadPoolExecutor).
-    - Para los que no están "running", rellena "N/A".
+    container_id -> ContainerMetrics para un grupo de contenedores.
+    - Si se pasa `stats_lookup` (container_id -> métricas, ej. el collector
+      de streams), salen de ahí y no se toca el daemon
+      (incluye los running "unhealthy", que en memoria no cuestan nada).
+    - Si no, corre stats() SOLO en los que están "running", en paralelo (ThreadPoolExecutor).
+    - Los que no están "running" (o fallaron) no aparecen -> "N/A" al formatear.
     """
-    # 1. Filtrar contenedores que pertenecen al stack
-    containers_all: List = []
-    for c in _iter_all_containers():
-        if _stack_name_for_container(c) == stack_id:
-            containers_all.append(c)
-
-    if not containers_all:
-        return None  # stack no existe
+    stats_map: Dict[str, ContainerMetrics] = {}
 
-    # 2. Dividir entre running y no-running
-    running_containers = []
-    nonrunning_map: Dict[str, Dict[str, str]] = {}
+    if stats_lookup is not None:
+        for c in containers:
+            m = stats_lookup(c.id)
+            if m is not None:
+                stats_map[c.id] = m
+        return stats_map
 
-    for c in containers_all:
-        state_class = _classify_state(c)
-        if state_class == "running":
-            running_containers.append(c)
-        else:
-            # no llamamos stats() para estos
-            nonrunning_map[c.id] = {"cpu": "N/A", "mem": "N/A", "net": "N/A"}
+    # no llamamos stats() para los no-running
+    running_containers = [c for c in containers if _classify_state(c) == "running"]
 
-    # 3. Pedir stats() en paralelo solo para running
-    stats_map: Dict[str, Dict[str, str]] = {}
     if running_containers:
         with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as ex:
             futures = {ex.submit(_safe_stats, c): c for c in running_containers}
             for fut in as_completed(futures):
                 c = futures[fut]
-                stats_map[c.id] = fut.result()
+                m = fut.result()
+                if m is not None:
+                    stats_map[c.id] = m
 
-    # Agregar los no-running al stats_map
-    for cid, st in nonrunning_map.items():
-        stats_map[cid] = st
+    return stats_map
 
-    # 4. Armar respuesta final y agregar agregados
+
+def _build_stack_detail(
+    stack_id: str,
+    containers: Optional[Iterable] = None,
+    stats_lookup: Optional[Callable[[str], Optional[ContainerMetrics]]] = None,
+) -> Optional[Dict]:
+    """
+    Para /api/v2/stacks/{stack_id}.
+    - Reúne contenedores del stack (del snapshot si se pasa `containers`;
+      con el índice del snapshot ya son sólo los del stack).
+    - Stats vía _collect_stats (collector si hay `stats_lookup`, si no stats() paralelo).
+    """
+    if containers is None:
+        containers = _iter_all_containers()
+
+    # Filtrar contenedores que pertenecen al stack
+    with timed("detail.group"):
+        containers_all: List = [
+            c for c in containers if _stack_name_for_container(c) == stack_id
+        ]
+
+    if not containers_all:
+        return None  # stack no existe
+
+    with timed("detail.collect_stats"):
+        stats_map = _collect_stats(containers_all, stats_lookup)
+    with timed("detail.assemble"):
+        return _assemble_stack_detail(stack_id, containers_all, stats_map)
+
+
+def _build_stack_details(
+    stack_ids: Optional[Iterable[str]] = None,
+    containers: Optional[Iterable] = None,
+    stats_lookup: Optional[Callable[[str], Optional[ContainerMetrics]]] = None,
+    groups: Optional[Dict[str, List]] = None,
+) -> List[Dict]:
+    """
+    Para /api/v2/stack-details.
+    Detalle de varios stacks (todos si `stack_ids` es None) a partir de UN
+    solo listado y UNA sola pasada de stats, en vez de un listado por stack.
+    Los stack_ids pedidos que no existen simplemente no aparecen.
+    Con `groups` (stack_id -> contenedores ya agrupados) no se agrupa.
+    """
+    if groups is None:
+        if containers is None:
+            containers = _iter_all_containers()
+        with timed("detail.group"):
+            groups = _group_by_stack(containers)
+
+    if stack_ids is not None:
+        groups = {
+            stack_id: groups[stack_id]
+            for stack_id in dict.fromkeys(stack_ids)
+            if groups.get(stack_id)
+        }
+
+    selected = [c for group in groups.values() for c in group]
+    with timed("detail.collect_stats"):
+        stats_map = _collect_stats(selected, stats_lookup)
+
+    with timed("detail.assemble"):
+        return [
+            _assemble_stack_detail(stack_id, group, stats_map)
+            for stack_id, group in groups.items()
+        ]
+
+
+def _assemble_stack_detail(
+    stack_id: str,
+    containers_all: List,
+    stats_map: Dict[str, ContainerMetrics],
+) -> Dict:
+    """
+    Arma el dict de StackDetailResponse (contenedores + agregados) con las
+    métricas ya resueltas. Los agregados se hacen sobre los números crudos;
+    los strings se arman recién acá, para la respuesta.
+    """
     containers_data: List[Dict] = []
     cpu_vals: List[float] = []
     ram_used_total_bytes = 0
     ram_host_total_bytes = 0
-    longest_uptime_s = 0
-    health_flags: List[str] = []
 
     for c in containers_all:
         cid = c.id
@@ -409,111 +412,57 @@ def _build_stack_detail(stack_id: str) -> Optional[Dict]:
         state_class = _classify_state(c)
         started_at = c.attrs.get("State", {}).get("StartedAt", "")
         uptime_h = _uptime_from_started_at(started_at)
-        uptime_s = _uptime_seconds(started_at)
         ports_list = _format_ports(c)
 
-        st = stats_map.get(cid, {"cpu": "N/A", "mem": "N/A", "net": "N/A"})
+        m = stats_map.get(cid)
 
         containers_data.append({
             "id": c.short_id,
             "name": c.name,
             "state": state_class,
             "uptime": uptime_h,
-            "cpu": st["cpu"],
-            "ram": st["mem"],
-            "net": st["net"],
+            "cpu": format_cpu(m),
+            "ram": format_mem(m),
+            "net": format_net(m),
             "ports": ports_list,
             "actions": {
                 "can_logs": True,
                 "can_shell": True,
                 "can_restart": True,
             },
+            "cpu_percent": (
+                round(m.cpu_percent, 4)
+                if m is not None and m.cpu is not None
+                else None
+            ),
+            "mem_used_bytes": m.mem_used if m is not None else None,
+            "mem_limit_bytes": m.mem_limit if m is not None else None,
+            "net_rx_bytes": m.net_rx if m is not None else None,
+            "net_tx_bytes": m.net_tx if m is not None else None,
         })
 
         # agregados
-        health_flags.append(state_class)
-        if uptime_s > longest_uptime_s:
-            longest_uptime_s = uptime_s
-
-        if st["cpu"].endswith("%"):
-            try:
-                cpu_vals.append(float(st["cpu"].replace("%", "")))
-            except Exception:
-                pass
-
-        used_b, limit_b = _mem_bytes_from_stat_string(st["mem"])
-        if used_b is not None:
-            ram_used_total_bytes += used_b
-        if limit_b is not None and limit_b > ram_host_total_bytes:
-            ram_host_total_bytes = limit_b
+        if m is None:
+            continue
+        if m.cpu is not None:
+            cpu_vals.append(m.cpu)
+        if m.mem_used is not None:
+            ram_used_total_bytes += m.mem_used
+        if m.mem_limit is not None and m.mem_limit > ram_host_total_bytes:
+            ram_host_total_bytes = m.mem_limit
 
     # CPU promedio
-    if cpu_vals:
-        cpu_avg_val = sum(cpu_vals) / len(cpu_vals)
-        cpu_avg_str = f"{cpu_avg_val:.2f}%"
-    else:
-        cpu_avg_str = "0.00%"
+    cpu_avg = sum(cpu_vals) / len(cpu_vals) if cpu_vals else None
 
     detail = {
         "stack_id": stack_id,
-        "display_name": stack_id,
+        "display_name": _display_name(stack_id),
+        "host": host_of(containers_all[0]) if containers_all else None,
         "summary": {
             "containers_count": len(containers_data),
-            "cpu_avg": cpu_avg_str,
-            "ram_total_used": _fmt_bytes_to_human(ram_used_total_bytes),
-            "ram_host_total": (
-                _fmt_bytes_to_human(ram_host_total_bytes)
-                if ram_host_total_bytes
-                else "N/A"
-            ),
+            **_stack_totals(cpu_avg, ram_used_total_bytes, ram_host_total_bytes),
         },
         "containers": containers_data,
     }
 
     return detail
-
-
-# --------------------------------------------------------------------------------------
-# Caché (TTL corto)
-# --------------------------------------------------------------------------------------
-
-def get_stack_summaries_cached() -> List[Dict]:
-    """
-    Cache de summaries con TTL corto.
-    """
-    global _cache_summaries, _cache_summaries_ts
-    now = time.time()
-    if (
-        _cache_summaries is not None
-        and (now - _cache_summaries_ts) < STACK_SUMMARY_TTL_SEC
-    ):
-        return _cache_summaries
-
-    data = _build_stack_summaries()
-    _cache_summaries = data
-    _cache_summaries_ts = now
-    return data
-
-
-def get_stack_detail_cached(stack_id: str) -> Optional[Dict]:
-    """
-    Cache de detalle por stack con TTL corto.
-    """
-    global _cache_details, _cache_details_ts
-    now = time.time()
-
-    ts = _cache_details_ts.get(stack_id, 0)
-    if (
-        stack_id in _cache_details
-        and (now - ts) < STACK_DETAIL_TTL_SEC
-    ):
-        return _cache_details[stack_id]
-
-    data = _build_stack_detail(stack_id)
-
-    # si no existe el stack, no cachear None
-    if data is not None:
-        _cache_details[stack_id] = data
-        _cache_details_ts[stack_id] = now
-
-    return data
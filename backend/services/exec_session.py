@@ -0,0 +1,246 @@
+import asyncio
+import codecs
+import json
+import logging
+import socket
+import threading
+import time
+from typing import Optional
+
+import docker
+from fastapi import WebSocket, WebSocketDisconnect
+
+from services.docker_client import put_from_thread, run_docker_io
+from services.snapshot import resolve_container
+
+log = logging.getLogger(__name__)
+
+# --------------------------------------------------------------------
+# Sesiones exec interactivas por WebSocket
+# --------------------------------------------------------------------
+#
+# Una sesión = UN exec con TTY (exec_create + exec_start(socket=True)) que
+# vive mientras el WebSocket esté abierto: el shell conserva cwd, variables,
+# procesos en foreground, etc. La salida se empuja a medida que llega.
+#
+# Protocolo (frames de texto JSON):
+#   cliente -> {"type": "input", "data": "ls\n"}
+#              {"type": "resize", "cols": 120, "rows": 40}
+#   server  -> {"type": "output", "data": "..."}
+#              {"type": "exit", "code": 0}
+#              {"type": "error", "message": "..."}
+
+EXEC_IDLE_TIMEOUT_SEC = 15 * 60   # sin input ni output por este tiempo -> se cierra
+EXEC_MAX_SESSIONS = 32
+EXEC_READ_CHUNK = 16 * 1024
+_EXEC_QUEUE_MAX_CHUNKS = 64       # backpressure: el lector deja de leer el socket
+
+_END = object()
+
+_SESSIONS: int = 0
+
+
+def _raw_socket(sock):
+    """
+    exec_start(socket=True) devuelve un SocketIO sobre unix socket (o el
+    socket mismo en tcp/tls): queremos el socket para recv/sendall.
+    """
+    return getattr(sock, "_sock", sock)
+
+
+def _pump_output(raw, queue: asyncio.Queue, loop, stop: threading.Event):
+    """
+    Thread: lee la salida del TTY y la pasa a la cola del event loop.
+    """
+    try:
+        while not stop.is_set():
+            data = raw.recv(EXEC_READ_CHUNK)
+            if not data or not put_from_thread(queue, loop, data, stop):
+                break
+    except OSError as e:
+        if not stop.is_set():
+            log.debug("exec socket closed: %s", e)
+    put_from_thread(queue, loop, _END, stop)
+
+
+class _Session:
+    def __init__(self, websocket: WebSocket, api, exec_id: str, sock):
+        self.websocket = websocket
+        self.api = api              # APIClient del host del contenedor
+        self.exec_id = exec_id
+        self.sock = sock
+        self.raw = _raw_socket(sock)
+        # el socket hereda el timeout de lectura del cliente (DOCKER_TIMEOUT_SEC):
+        # un shell callado no es un error, el único límite es watch_idle
+        self.raw.settimeout(None)
+        self.last_activity = time.monotonic()
+
+    async def send_output(self, queue: asyncio.Queue) -> bool:
+        """
+        Cola -> WebSocket. Devuelve True si el proceso terminó (EOF).
+        Junta lo que ya esté en la cola en un solo frame.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            chunks = [await queue.get()]
+            while not queue.empty():
+                chunks.append(queue.get_nowait())
+
+            ended = chunks[-1] is _END
+            if ended:
+                chunks.pop()
+            text = decoder.decode(b"".join(chunks), final=ended)
+            if text:
+                self.last_activity = time.monotonic()
+                await self.websocket.send_json({"type": "output", "data": text})
+            if ended:
+                return True
+
+    async def read_input(self):
+        """
+        WebSocket -> stdin del TTY / resize.
+        """
+        while True:
+            try:
+                msg = json.loads(await self.websocket.receive_text())
+            except ValueError:
+                continue  # frame que no es JSON: se ignora
+            if not isinstance(msg, dict):
+                continue
+            kind = msg.get("type")
+            if kind == "input" and isinstance(msg.get("data"), str):
+                self.last_activity = time.monotonic()
+                await run_docker_io(self.raw.sendall, msg["data"].encode("utf-8"))
+            elif kind == "resize":
+                await self.resize(msg.get("cols"), msg.get("rows"))
+
+    async def resize(self, cols, rows):
+        if not isinstance(cols, int) or not isinstance(rows, int):
+            return
+        if cols <= 0 or rows <= 0:
+            return
+        try:
+            await run_docker_io(self.api.exec_resize, self.exec_id, height=rows, width=cols)
+        except docker.errors.APIError as e:
+            log.debug("exec resize failed: %s", e)
+
+    async def watch_idle(self):
+        while True:
+            idle = time.monotonic() - self.last_activity
+            if idle >= EXEC_IDLE_TIMEOUT_SEC:
+                return
+            await asyncio.sleep(EXEC_IDLE_TIMEOUT_SEC - idle)
+
+    async def exit_code(self) -> Optional[int]:
+        try:
+            info = await run_docker_io(self.api.exec_inspect, self.exec_id)
+        except docker.errors.APIError:
+            return None
+        return info.get("ExitCode")
+
+    def close(self):
+        # shutdown antes de close: despierta al thread bloqueado en recv()
+        try:
+            self.raw.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        for s in (self.raw, self.sock):
+            try:
+                s.close()
+            except Exception:
+                pass
+
+
+async def _send_error(websocket: WebSocket, message: str, code: int = 1011):
+    try:
+        await websocket.send_json({"type": "error", "message": message})
+        await websocket.close(code=code)
+    except Exception:
+        pass
+
+
+async def serve_exec(
+    websocket: WebSocket,
+    container_id: str,
+    cmd: str,
+    cols: Optional[int] = None,
+    rows: Optional[int] = None,
+):
+    """
+    Abre un exec con TTY en el contenedor y lo conecta al WebSocket (ya
+    aceptado) hasta que el proceso termine, el cliente se desconecte o la
+    sesión pase EXEC_IDLE_TIMEOUT_SEC sin actividad.
+    """
+    global _SESSIONS
+
+    if _SESSIONS >= EXEC_MAX_SESSIONS:
+        await _send_error(websocket, "Too many exec sessions open", code=1013)
+        return
+
+    _SESSIONS += 1
+    session = None
+    tasks = []
+    try:
+        try:
+            container = await resolve_container(container_id)
+            api = container.client.api
+            created = await run_docker_io(
+                api.exec_create,
+                container.id,
+                cmd,
+                stdin=True,
+                tty=True,
+                environment={"TERM": "xterm"},
+            )
+            sock = await run_docker_io(
+                api.exec_start, created["Id"], tty=True, socket=True
+            )
+        except docker.errors.NotFound:
+            await _send_error(websocket, f"Container '{container_id}' not found")
+            return
+        except docker.errors.APIError as e:
+            await _send_error(websocket, f"Failed to start exec: {e.explanation or e}")
+            return
+
+        session = _Session(websocket, api, created["Id"], sock)
+        await session.resize(cols, rows)
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=_EXEC_QUEUE_MAX_CHUNKS)
+        stop = threading.Event()
+        threading.Thread(
+            target=_pump_output,
+            args=(session.raw, queue, loop, stop),
+            name=f"exec-{container_id[:12]}",
+            daemon=True,
+        ).start()
+
+        output = asyncio.create_task(session.send_output(queue))
+        reader = asyncio.create_task(session.read_input())
+        idle = asyncio.create_task(session.watch_idle())
+        tasks = [output, reader, idle]
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        stop.set()
+
+        if output in done and not output.exception():
+            code = await session.exit_code()
+            await websocket.send_json({"type": "exit", "code": code})
+            await websocket.close()
+        elif idle in done:
+            await _send_error(websocket, "Session closed after being idle", code=1000)
+        else:
+            for task in done:
+                exc = task.exception()
+                if exc is not None and not isinstance(exc, WebSocketDisconnect):
+                    log.warning("exec session closed: %s", exc)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        log.warning("exec session closed: %s", e)
+    finally:
+        for task in tasks:
+            task.cancel()
+        if session is not None:
+            # cerrar el socket corta el TTY: el shell recibe SIGHUP
+            session.close()
+        _SESSIONS -= 1
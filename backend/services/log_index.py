@@ -0,0 +1,676 @@
+import bisect
+import heapq
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from services.logs import iter_log_lines, split_log_line
+
+log = logging.getLogger(__name__)
+
+# --------------------------------------------------------------------
+# Índice de logs en memoria (búsqueda del lado del servidor)
+# --------------------------------------------------------------------
+#
+# Un thread por contenedor running sigue sus logs (follow) y los acumula en
+# bloques de ~LOG_INDEX_BLOCK_BYTES: el texto de todas las líneas del bloque
+# en UN string + arrays planos con ts/nivel/offset de cada línea. Buscar es
+# un str.find()/regex sobre el bloque entero (C puro), y sólo las líneas que
+# matchean se convierten en resultados.
+#
+# Memoria acotada por contenedor y global; lo que se desaloja se puede
+# bajar a disco (LOG_INDEX_SPILL_DIR) en un archivo por bloque, y la
+# búsqueda lo sigue leyendo de ahí.
+#
+# Los logs de un contenedor parado se conservan (buscar por qué murió es
+# justamente el caso de uso); sólo se borran cuando el contenedor se borra.
+
+LOG_INDEX_ENABLED = os.getenv("LOG_INDEX_ENABLED", "1") != "0"
+LOG_INDEX_BLOCK_BYTES = 128 * 1024
+LOG_INDEX_MAX_BYTES_PER_CONTAINER = 32 * 1024 ** 2
+LOG_INDEX_MAX_BYTES = 512 * 1024 ** 2            # total en memoria, todos los contenedores
+LOG_INDEX_BACKFILL_LINES = 1000                  # historial que se levanta al empezar a seguir
+LOG_INDEX_SPILL_DIR = os.getenv("LOG_INDEX_SPILL_DIR") or None
+LOG_INDEX_SPILL_MAX_BYTES_PER_CONTAINER = 256 * 1024 ** 2
+
+# Niveles: se detectan una vez al ingerir, no en cada búsqueda
+LEVELS = ("", "debug", "info", "warn", "error")
+_LEVEL_CODES = {name: code for code, name in enumerate(LEVELS) if name}
+_LEVEL_WORDS = {
+    "trace": 1, "debug": 1,
+    "info": 2, "notice": 2,
+    "warn": 3, "warning": 3,
+    "err": 4, "error": 4, "crit": 4, "critical": 4, "fatal": 4, "panic": 4,
+}
+_LEVEL_RE = re.compile(
+    r"\b(trace|debug|info|notice|warn|warning|err|error|crit|critical|fatal|panic)\b",
+    re.IGNORECASE,
+)
+_LEVEL_SCAN_CHARS = 200
+
+
+def detect_level(text: str) -> int:
+    """
+    Primera palabra de nivel en el comienzo de la línea -> código de LEVELS
+    (0 = sin nivel reconocible).
+    """
+    m = _LEVEL_RE.search(text, 0, _LEVEL_SCAN_CHARS)
+    return _LEVEL_WORDS[m.group(1).lower()] if m else 0
+
+
+def format_ts_ns(ts_ns: int) -> str:
+    """
+    nanosegundos desde epoch -> RFC3339Nano como el de Docker.
+    """
+    sec, nanos = divmod(ts_ns, 1_000_000_000)
+    base = datetime.fromtimestamp(sec, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+    return f"{base}.{nanos:09d}Z"
+
+
+# --------------------------------------------------------------------
+# Bloques
+# --------------------------------------------------------------------
+
+class _Block:
+    """
+    Líneas consecutivas de un contenedor. Inmutable una vez armado.
+    `text` es "línea\\nlínea\\n...", `offsets[i]` donde empieza la línea i.
+    La línea i tiene seq = seq0 + i (seq crece por contenedor).
+    """
+
+    __slots__ = ("seq0", "ts", "levels", "offsets", "text", "ts_min", "ts_max", "nbytes")
+
+    def __init__(self, seq0: int, ts: array, levels: bytearray, text: str):
+        self.seq0 = seq0
+        self.ts = ts
+        self.levels = levels
+        self.text = text
+        self.offsets = array("I")
+        pos = 0
+        for line in text.split("\n")[:-1]:
+            self.offsets.append(pos)
+            pos += len(line) + 1
+        self.ts_min = ts[0] if ts else 0
+        self.ts_max = ts[-1] if ts else 0
+        self.nbytes = len(text) + 13 * len(ts)
+
+    @classmethod
+    def from_lines(cls, seq0: int, ts: List[int], levels: List[int], lines: List[str]):
+        return cls(seq0, array("q", ts), bytearray(levels), "\n".join(lines) + "\n")
+
+    def line(self, i: int) -> str:
+        start = self.offsets[i]
+        end = self.offsets[i + 1] - 1 if i + 1 < len(self.offsets) else len(self.text) - 1
+        return self.text[start:end]
+
+
+class _DiskSegment:
+    """
+    Un bloque desalojado a disco. Se guarda lo justo para descartarlo por
+    rango de tiempo sin abrir el archivo.
+    """
+
+    __slots__ = ("path", "seq0", "ts_min", "ts_max", "size")
+
+    def __init__(self, path: str, seq0: int, ts_min: int, ts_max: int, size: int):
+        self.path = path
+        self.seq0 = seq0
+        self.ts_min = ts_min
+        self.ts_max = ts_max
+        self.size = size
+
+
+def _spill_dir_for(container_id: str) -> str:
+    return os.path.join(LOG_INDEX_SPILL_DIR, container_id)
+
+
+def _write_segment(container_id: str, block: _Block) -> Optional[_DiskSegment]:
+    """
+    Formato: una línea JSON de header, ts (int64) y niveles (uint8) crudos,
+    y el texto en utf-8.
+    """
+    path = os.path.join(_spill_dir_for(container_id), f"{block.seq0:020d}.seg")
+    header = json.dumps({"seq0": block.seq0, "n": len(block.ts)}).encode() + b"\n"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(header)
+            f.write(block.ts.tobytes())
+            f.write(bytes(block.levels))
+            f.write(block.text.encode("utf-8"))
+        size = os.path.getsize(path)
+    except OSError as e:
+        log.warning("log index spill failed for %s: %s", container_id[:12], e)
+        return None
+    return _DiskSegment(path, block.seq0, block.ts_min, block.ts_max, size)
+
+
+def _read_segment(seg: _DiskSegment) -> Optional[_Block]:
+    try:
+        with open(seg.path, "rb") as f:
+            header = json.loads(f.readline())
+            n = header["n"]
+            ts = array("q")
+            ts.frombytes(f.read(8 * n))
+            levels = bytearray(f.read(n))
+            text = f.read().decode("utf-8", errors="replace")
+    except (OSError, ValueError, KeyError) as e:
+        log.warning("log index segment unreadable (%s): %s", seg.path, e)
+        return None
+    return _Block(header["seq0"], ts, levels, text)
+
+
+# --------------------------------------------------------------------
+# Estado por contenedor
+# --------------------------------------------------------------------
+
+class _ContainerLogs:
+    __slots__ = (
+        "container_id", "lock", "blocks", "disk",
+        "tail_seq0", "tail_ts", "tail_levels", "tail_lines", "tail_bytes",
+        "mem_bytes", "disk_bytes", "next_seq", "last_ts_ns", "last_raw_ts_ns",
+        "last_raw_ts_lines", "resume_skip", "stop", "stream",
+    )
+
+    def __init__(self, container_id: str):
+        self.container_id = container_id
+        self.lock = threading.Lock()
+        self.blocks: List[_Block] = []          # viejo -> nuevo
+        self.disk: List[_DiskSegment] = []      # viejo -> nuevo
+        # líneas todavía no selladas en un bloque
+        self.tail_seq0 = 0
+        self.tail_ts: List[int] = []
+        self.tail_levels: List[int] = []
+        self.tail_lines: List[str] = []
+        self.tail_bytes = 0
+        self.mem_bytes = 0
+        self.disk_bytes = 0
+        self.next_seq = 1
+        self.last_ts_ns = 0        # ts (ya monotónico) de la última línea
+        self.last_raw_ts_ns = 0    # ts de Docker de la última línea, para retomar sin duplicar
+        # líneas vistas con ese mismo ts (una ráfaga puede compartirlo) y
+        # cuántas de ellas faltan descartar de lo que repite el daemon al retomar
+        self.last_raw_ts_lines = 0
+        self.resume_skip = 0
+        self.stop: Optional[threading.Event] = None
+        self.stream = None
+
+
+# container_id -> logs indexados
+_LOGS: Dict[str, _ContainerLogs] = {}
+_LOCK = threading.Lock()
+_TOTAL_BYTES = 0
+
+
+def _get_or_create(container_id: str) -> _ContainerLogs:
+    with _LOCK:
+        state = _LOGS.get(container_id)
+        if state is None:
+            state = _ContainerLogs(container_id)
+            _LOGS[container_id] = state
+            if LOG_INDEX_SPILL_DIR:
+                # segmentos de una corrida anterior: el backfill los vuelve a traer
+                shutil.rmtree(_spill_dir_for(container_id), ignore_errors=True)
+        return state
+
+
+def _add_total(delta: int):
+    global _TOTAL_BYTES
+    with _LOCK:
+        _TOTAL_BYTES += delta
+
+
+def _evict_oldest(state: _ContainerLogs) -> bool:
+    """
+    Saca el bloque más viejo de memoria (a disco si hay spill). Con state.lock.
+    """
+    if not state.blocks:
+        return False
+    block = state.blocks.pop(0)
+    state.mem_bytes -= block.nbytes
+    _add_total(-block.nbytes)
+
+    if LOG_INDEX_SPILL_DIR:
+        seg = _write_segment(state.container_id, block)
+        if seg is not None:
+            state.disk.append(seg)
+            state.disk_bytes += seg.size
+            while state.disk and state.disk_bytes > LOG_INDEX_SPILL_MAX_BYTES_PER_CONTAINER:
+                old = state.disk.pop(0)
+                state.disk_bytes -= old.size
+                try:
+                    os.remove(old.path)
+                except OSError:
+                    pass
+    return True
+
+
+def _seal_tail(state: _ContainerLogs):
+    """
+    Convierte las líneas pendientes en un bloque y aplica los límites de
+    memoria. Con state.lock.
+    """
+    if not state.tail_lines:
+        return
+    block = _Block.from_lines(state.tail_seq0, state.tail_ts, state.tail_levels, state.tail_lines)
+    state.blocks.append(block)
+    state.mem_bytes += block.nbytes
+    _add_total(block.nbytes)
+    state.tail_ts, state.tail_levels, state.tail_lines = [], [], []
+    state.tail_bytes = 0
+
+    while state.mem_bytes > LOG_INDEX_MAX_BYTES_PER_CONTAINER and _evict_oldest(state):
+        pass
+
+
+def _enforce_global_cap():
+    """
+    Si el total pasa LOG_INDEX_MAX_BYTES, desaloja del contenedor que más
+    ocupa hasta volver al límite.
+    """
+    while _TOTAL_BYTES > LOG_INDEX_MAX_BYTES:
+        with _LOCK:
+            states = list(_LOGS.values())
+        biggest = max(states, key=lambda s: s.mem_bytes, default=None)
+        if biggest is None:
+            return
+        with biggest.lock:
+            if not _evict_oldest(biggest):
+                return
+
+
+def _ingest(state: _ContainerLogs, raw: bytes) -> bool:
+    """
+    Agrega una línea cruda (con timestamp de Docker). Devuelve True si se
+    selló un bloque.
+    """
+    ts, ts_ns, text = split_log_line(raw)
+    if ts_ns is None:
+        ts_ns = time.time_ns()
+    elif ts_ns < state.last_raw_ts_ns:
+        return False  # repetida al retomar con since=
+    elif ts_ns == state.last_raw_ts_ns:
+        # mismo ts que la anterior: al retomar se descartan sólo las que ya
+        # estaban indexadas, el resto de la ráfaga es nueva
+        if state.resume_skip:
+            state.resume_skip -= 1
+            return False
+        state.last_raw_ts_lines += 1
+    else:
+        state.last_raw_ts_ns = ts_ns
+        state.last_raw_ts_lines = 1
+        state.resume_skip = 0
+
+    with state.lock:
+        # el índice necesita ts no decreciente por contenedor (paginación)
+        ts_ns = max(ts_ns, state.last_ts_ns)
+        state.last_ts_ns = ts_ns
+        if not state.tail_lines:
+            state.tail_seq0 = state.next_seq
+        state.next_seq += 1
+        state.tail_ts.append(ts_ns)
+        state.tail_levels.append(detect_level(text))
+        state.tail_lines.append(text.replace("\n", " "))
+        state.tail_bytes += len(text) + 1
+        if state.tail_bytes >= LOG_INDEX_BLOCK_BYTES:
+            _seal_tail(state)
+            return True
+    return False
+
+
+# --------------------------------------------------------------------
+# Followers (un thread por contenedor running)
+# --------------------------------------------------------------------
+
+def _follow_worker(container, state: _ContainerLogs, stop: threading.Event):
+    """
+    Sigue los logs del contenedor hasta que el stream termine (contenedor
+    parado) o se pida stop. Al volver a arrancar retoma desde la última
+    línea vista, sin duplicar.
+    """
+    kwargs = {"stream": True, "follow": True, "timestamps": True}
+    if state.last_raw_ts_ns:
+        # since es un float en segundos: 1µs antes, para que el redondeo no
+        # se saltee la ráfaga del borde (lo anterior lo descarta _ingest)
+        kwargs["since"] = (state.last_raw_ts_ns - 1000) / 1_000_000_000
+        kwargs["tail"] = "all"
+        state.resume_skip = state.last_raw_ts_lines
+    else:
+        kwargs["tail"] = LOG_INDEX_BACKFILL_LINES
+
+    try:
+        stream = container.logs(**kwargs)
+        state.stream = stream
+        for raw in iter_log_lines(stream):
+            if stop.is_set():
+                break
+            if _ingest(state, raw):
+                _enforce_global_cap()
+    except Exception as e:
+        if not stop.is_set():
+            log.debug("log follower for %s ended: %s", container.id[:12], e)
+    finally:
+        with _LOCK:
+            if state.stop is stop:
+                state.stop = None
+                state.stream = None
+
+
+def start_follower(container):
+    """
+    Empieza a indexar los logs de un contenedor si no hay ya un follower.
+    """
+    if not LOG_INDEX_ENABLED:
+        return
+    state = _get_or_create(container.id)
+    with _LOCK:
+        if state.stop is not None:
+            return
+        stop = threading.Event()
+        state.stop = stop
+
+    threading.Thread(
+        target=_follow_worker,
+        args=(container, state, stop),
+        name=f"logs-{container.id[:12]}",
+        daemon=True,
+    ).start()
+
+
+def stop_follower(container_id: str):
+    """
+    Deja de seguir un contenedor (los logs ya indexados se conservan).
+    """
+    with _LOCK:
+        state = _LOGS.get(container_id)
+        if state is None or state.stop is None:
+            return
+        stop, stream = state.stop, state.stream
+        state.stop = state.stream = None
+    stop.set()
+    try:
+        if stream is not None:
+            stream.close()
+    except Exception:
+        pass
+
+
+def drop_logs(container_id: str):
+    """
+    Borra todo lo indexado de un contenedor (destroy).
+    """
+    stop_follower(container_id)
+    with _LOCK:
+        state = _LOGS.pop(container_id, None)
+    if state is None:
+        return
+    with state.lock:
+        _add_total(-state.mem_bytes)
+        state.blocks, state.disk = [], []
+        state.mem_bytes = state.disk_bytes = 0
+    if LOG_INDEX_SPILL_DIR:
+        shutil.rmtree(_spill_dir_for(container_id), ignore_errors=True)
+
+
+def sync_follower(container):
+    """
+    Follower activo si está running, parado si no.
+    """
+    if container.attrs.get("State", {}).get("Running", False):
+        start_follower(container)
+    else:
+        stop_follower(container.id)
+
+
+def sync_followers(containers: Iterable):
+    """
+    Alinea followers e índice con el listado completo (seed / reconcile):
+    sigue a los running y borra lo de contenedores que ya no existen.
+    """
+    known: Set[str] = set()
+    for c in containers:
+        known.add(c.id)
+        sync_follower(c)
+
+    with _LOCK:
+        gone = [cid for cid in _LOGS if cid not in known]
+    for cid in gone:
+        drop_logs(cid)
+
+
+# --------------------------------------------------------------------
+# Búsqueda
+# --------------------------------------------------------------------
+
+class LogQuery:
+    """
+    Filtros de una búsqueda ya validados. `pattern` es None si no hay texto.
+    `before` = (ts_ns, container_id corto, seq): sólo líneas estrictamente
+    anteriores en ese orden (paginación).
+    """
+
+    __slots__ = ("pattern", "literal", "lower", "levels", "since_ns", "until_ns", "before")
+
+    def __init__(
+        self,
+        q: Optional[str] = None,
+        regex: bool = False,
+        case_sensitive: bool = False,
+        levels: Optional[Iterable[str]] = None,
+        since_ns: Optional[int] = None,
+        until_ns: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ):
+        """
+        Levanta ValueError si la regex, algún nivel o el cursor no son válidos.
+        """
+        self.literal = None
+        self.pattern = None
+        self.lower = False
+        if q:
+            if regex:
+                flags = re.MULTILINE | (0 if case_sensitive else re.IGNORECASE)
+                try:
+                    self.pattern = re.compile(q, flags)
+                except re.error as e:
+                    raise ValueError(f"invalid regex: {e}")
+            elif case_sensitive:
+                self.literal = q
+            else:
+                # str.find sobre el bloque en minúsculas es mucho más rápido
+                # que una regex IGNORECASE; la regex queda de respaldo
+                self.literal = q.lower()
+                self.lower = True
+                self.pattern = re.compile(re.escape(q), re.IGNORECASE)
+
+        self.levels = None
+        if levels:
+            try:
+                self.levels = {_LEVEL_CODES[name.strip().lower()] for name in levels}
+            except KeyError as e:
+                raise ValueError(f"unknown level {e.args[0]!r}")
+
+        self.since_ns = since_ns
+        self.until_ns = until_ns
+        self.before = parse_cursor(cursor) if cursor else None
+
+    def block_may_match(self, ts_min: int, ts_max: int) -> bool:
+        if self.since_ns is not None and ts_max < self.since_ns:
+            return False
+        if self.until_ns is not None and ts_min > self.until_ns:
+            return False
+        if self.before is not None and ts_min > self.before[0]:
+            return False
+        return True
+
+
+def make_cursor(ts_ns: int, container_id: str, seq: int) -> str:
+    return f"{ts_ns}-{container_id[:12]}-{seq}"
+
+
+def parse_cursor(cursor: str) -> Tuple[int, str, int]:
+    parts = cursor.split("-")
+    if len(parts) != 3 or not parts[0].isdigit() or not parts[2].isdigit():
+        raise ValueError("invalid cursor")
+    return int(parts[0]), parts[1], int(parts[2])
+
+
+def _candidate_lines(block: _Block, query: LogQuery) -> Iterable[int]:
+    """
+    Índices de línea (ascendentes) que contienen el texto buscado. El scan
+    se hace sobre el texto del bloque entero, no línea por línea.
+    """
+    n = len(block.offsets)
+    if query.pattern is None and query.literal is None:
+        return range(n)
+
+    text, offsets = block.text, block.offsets
+    literal = query.literal
+    if literal is not None and query.lower:
+        text = text.lower()
+        if len(text) != len(block.text):
+            # algún caracter cambia de largo al pasar a minúsculas: los
+            # offsets ya no sirven, se usa la regex IGNORECASE
+            text, literal = block.text, None
+
+    hits = []
+    pos = 0
+    while pos < len(text):
+        if literal is not None:
+            start = text.find(literal, pos)
+            if start < 0:
+                break
+        else:
+            m = query.pattern.search(text, pos)
+            if m is None:
+                break
+            start = m.start()
+        i = bisect.bisect_right(offsets, start) - 1
+        # una regex puede matchear cruzando el \n: se confirma sobre la línea sola
+        if literal is not None or query.pattern.search(block.line(i)):
+            hits.append(i)
+        pos = offsets[i + 1] if i + 1 < n else len(text)
+    return hits
+
+
+def _search_block(block: _Block, query: LogQuery, short_id: str) -> List[Tuple[int, int, int, str]]:
+    """
+    Matches de un bloque, del más nuevo al más viejo: (ts_ns, seq, level, line).
+    """
+    if not block.ts or not query.block_may_match(block.ts_min, block.ts_max):
+        return []
+
+    out = []
+    for i in _candidate_lines(block, query):
+        ts_ns = block.ts[i]
+        if query.since_ns is not None and ts_ns < query.since_ns:
+            continue
+        if query.until_ns is not None and ts_ns > query.until_ns:
+            continue
+        level = block.levels[i]
+        if query.levels is not None and level not in query.levels:
+            continue
+        seq = block.seq0 + i
+        if query.before is not None and (ts_ns, short_id, seq) >= query.before:
+            continue
+        out.append((ts_ns, seq, level, block.line(i)))
+    out.reverse()
+    return out
+
+
+def _iter_container(container_id: str, query: LogQuery) -> Iterator[Tuple[int, int, str, int, str]]:
+    """
+    Matches de un contenedor, del más nuevo al más viejo:
+    (ts_ns, seq, container_id, level, line). Lee la cola sin sellar,
+    los bloques en memoria y después los segmentos en disco.
+    """
+    state = _LOGS.get(container_id)
+    if state is None:
+        return
+    with state.lock:
+        tail = None
+        if state.tail_lines:
+            tail = _Block.from_lines(state.tail_seq0, state.tail_ts, state.tail_levels, state.tail_lines)
+        blocks = list(state.blocks)
+        disk = list(state.disk)
+
+    short_id = container_id[:12]
+    if tail is not None:
+        blocks.append(tail)
+    for block in reversed(blocks):
+        for ts_ns, seq, level, line in _search_block(block, query, short_id):
+            yield ts_ns, seq, container_id, level, line
+
+    for seg in reversed(disk):
+        if not query.block_may_match(seg.ts_min, seg.ts_max):
+            continue
+        block = _read_segment(seg)
+        if block is None:
+            continue
+        for ts_ns, seq, level, line in _search_block(block, query, short_id):
+            yield ts_ns, seq, container_id, level, line
+
+
+def search_logs(container_ids: List[str], query: LogQuery, limit: int) -> Iterator[Dict]:
+    """
+    Hasta `limit` líneas que cumplen `query` en los contenedores dados,
+    del más nuevo al más viejo (varios contenedores se intercalan por ts;
+    empates por id de contenedor y seq, así el orden es total y estable).
+    Es un generador: los resultados salen a medida que se encuentran.
+    El último item es {"next_cursor": ...} (None si no hay más páginas).
+    """
+    merged = heapq.merge(
+        *(_iter_container(cid, query) for cid in container_ids),
+        key=lambda hit: (hit[0], hit[2][:12], hit[1]),
+        reverse=True,
+    )
+    last = None
+    count = 0
+    for ts_ns, seq, cid, level, line in merged:
+        if count >= limit:
+            yield {"next_cursor": make_cursor(*last)}
+            return
+        yield {
+            "container_id": cid[:12],
+            "ts": format_ts_ns(ts_ns),
+            "cursor": make_cursor(ts_ns, cid, seq),
+            "level": LEVELS[level] or None,
+            "line": line,
+        }
+        last = (ts_ns, cid, seq)
+        count += 1
+    yield {"next_cursor": None}
+
+
+def resolve_log_container_id(container_ref: str) -> Optional[str]:
+    """
+    Id completo a partir de un id corto (el que muestra la API).
+    """
+    if container_ref in _LOGS:
+        return container_ref
+    with _LOCK:
+        for cid in _LOGS:
+            if cid.startswith(container_ref):
+                return cid
+    return None
+
+
+def get_index_stats() -> Dict:
+    """
+    Tamaño del índice (para debug).
+    """
+    with _LOCK:
+        states = list(_LOGS.values())
+    return {
+        "containers": len(states),
+        "followers": sum(1 for s in states if s.stop is not None),
+        "memory_bytes": _TOTAL_BYTES,
+        "disk_bytes": sum(s.disk_bytes for s in states),
+    }
@@ -0,0 +1,164 @@
+import asyncio
+import calendar
+import json
+import logging
+import re
+import threading
+from typing import AsyncIterator, Iterable, Iterator, Optional, Tuple
+
+from services.docker_client import put_from_thread, run_docker_io
+from services.perf import count
+
+log = logging.getLogger(__name__)
+
+# --------------------------------------------------------------------
+# Logs en streaming (follow) vía SDK, sin `docker logs` por subprocess
+# --------------------------------------------------------------------
+
+LOG_QUEUE_MAX_LINES = 1000    # backpressure: el thread lector se frena si el cliente no consume
+LOG_BATCH_MAX_LINES = 500     # líneas por chunk HTTP como máximo
+
+_TS_RE = re.compile(r"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.(\d+))?Z$")
+
+_END = object()
+
+
+def parse_docker_ts(ts: str) -> Optional[int]:
+    """
+    RFC3339Nano de Docker ("2024-05-01T10:00:00.123456789Z", los ceros del
+    final pueden no venir) -> nanosegundos desde epoch.
+    Se llama una vez por línea de log: nada de strptime.
+    """
+    m = _TS_RE.match(ts)
+    if not m:
+        return None
+    d = m.group(1)
+    try:
+        secs = calendar.timegm((
+            int(d[0:4]), int(d[5:7]), int(d[8:10]),
+            int(d[11:13]), int(d[14:16]), int(d[17:19]),
+        ))
+    except (ValueError, OverflowError):
+        return None
+    nanos = int((m.group(2) or "0").ljust(9, "0")[:9])
+    return secs * 1_000_000_000 + nanos
+
+
+def split_log_line(raw: bytes) -> Tuple[str, Optional[int], str]:
+    """
+    Línea con timestamps=True -> (ts, ts_ns, texto).
+    """
+    text = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+    ts, sep, rest = text.partition(" ")
+    ts_ns = parse_docker_ts(ts) if sep else None
+    if ts_ns is None:
+        return "", None, text
+    return ts, ts_ns, rest
+
+
+def iter_log_lines(stream: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Re-corta el stream del SDK en líneas completas (con su b"\n").
+    Los items no son líneas: con TTY docker-py lee de a 1 byte, y sin TTY
+    un frame multiplexado puede cortar una línea por la mitad. Lo que quede
+    sin newline al terminar el stream sale como última línea.
+    """
+    buf = bytearray()
+    for chunk in stream:
+        buf += chunk
+        if b"\n" not in chunk:
+            continue
+        start = 0
+        end = buf.find(b"\n") + 1
+        while end:
+            yield bytes(buf[start:end])
+            start = end
+            end = buf.find(b"\n", start) + 1
+        del buf[:start]
+    if buf:
+        yield bytes(buf)
+
+
+def _pump_logs(stream, queue: asyncio.Queue, loop, stop: threading.Event):
+    """
+    Thread: lee el stream bloqueante del SDK y lo pasa a la cola asyncio.
+    Con la cola llena se frena este thread (no el event loop): eso es el
+    backpressure hacia el daemon.
+    """
+    try:
+        for raw in iter_log_lines(stream):
+            if stop.is_set() or not put_from_thread(queue, loop, raw, stop):
+                return
+    except Exception as e:
+        if not stop.is_set():
+            log.debug("log stream ended: %s", e)
+    put_from_thread(queue, loop, _END, stop)
+
+
+async def open_log_stream(container, tail: int, since_ns: Optional[int], follow: bool):
+    """
+    Abre el stream de logs del SDK (en el executor de docker-io) de un
+    contenedor ya resuelto (snapshot.resolve_container, de cualquier host).
+    """
+    kwargs = {
+        "stream": True,
+        "follow": follow,
+        "timestamps": True,
+        "tail": tail if tail >= 0 else "all",
+    }
+    if since_ns is not None:
+        kwargs["since"] = since_ns / 1_000_000_000
+        kwargs["tail"] = "all"
+    return await run_docker_io(container.logs, **kwargs)
+
+
+async def iter_log_ndjson(stream, since_ns: Optional[int]) -> AsyncIterator[bytes]:
+    """
+    NDJSON: una línea {"ts", "cursor", "line"} por línea de log, en chunks
+    de hasta LOG_BATCH_MAX_LINES. `cursor` es el ts en nanosegundos: el
+    cliente lo manda como ?since= para retomar sin repetir líneas.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=LOG_QUEUE_MAX_LINES)
+    stop = threading.Event()
+    threading.Thread(
+        target=_pump_logs,
+        args=(stream, queue, loop, stop),
+        name="logs-follow",
+        daemon=True,
+    ).start()
+
+    try:
+        while True:
+            raws = [await queue.get()]
+            while len(raws) < LOG_BATCH_MAX_LINES and not queue.empty():
+                raws.append(queue.get_nowait())
+
+            out = []
+            ended = False
+            for raw in raws:
+                if raw is _END:
+                    ended = True
+                    break
+                ts, ts_ns, text = split_log_line(raw)
+                if since_ns is not None and ts_ns is not None and ts_ns <= since_ns:
+                    continue  # ya enviada antes del resume
+                out.append(json.dumps({
+                    "ts": ts,
+                    "cursor": str(ts_ns) if ts_ns is not None else None,
+                    "line": text,
+                }))
+            if out:
+                chunk = ("\n".join(out) + "\n").encode()
+                count("logs.stream_lines", len(out))
+                count("logs.stream_bytes", len(chunk))
+                yield chunk
+            if ended:
+                return
+    finally:
+        stop.set()
+        # desbloquea al thread si estaba esperando datos del daemon
+        try:
+            stream.close()
+        except Exception:
+            pass
@@ -0,0 +1,155 @@
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+
+# --------------------------------------------------------------------
+# Métricas numéricas por contenedor
+# --------------------------------------------------------------------
+#
+# Internamente todo es numérico (bytes, fracción de CPU, timestamps).
+# Los strings tipo "41.27MiB / 5.783GiB" se arman sólo en el borde de la
+# API (format_*), así la agregación no tiene que volver a parsearlos.
+
+
+@dataclass(slots=True)
+class ContainerMetrics:
+    ts: float                      # epoch (segundos) del sample
+    cpu: Optional[float] = None    # fracción de UN core: 0.25 -> "25.00%", 2.0 -> "200.00%"
+    mem_used: Optional[int] = None     # bytes
+    mem_limit: Optional[int] = None    # bytes
+    net_rx: Optional[int] = None       # bytes acumulados, todas las interfaces
+    net_tx: Optional[int] = None
+    blk_read: Optional[int] = None     # bytes acumulados de disco, todos los dispositivos
+    blk_write: Optional[int] = None
+
+    @property
+    def cpu_percent(self) -> Optional[float]:
+        if self.cpu is None:
+            return None
+        return self.cpu * 100.0
+
+
+def _sample_ts(stats: Dict) -> float:
+    """
+    "read" del sample ("2024-05-01T10:00:00.123456789Z") -> epoch.
+    Si no viene o no se entiende, ahora.
+    """
+    read = stats.get("read") or ""
+    try:
+        # fromisoformat no acepta nanosegundos: recortamos a microsegundos
+        base, _, frac = read.rstrip("Z").partition(".")
+        dt = datetime.fromisoformat(f"{base}.{(frac + '000000')[:6]}+00:00")
+        if dt.year > 1:
+            return dt.timestamp()
+    except ValueError:
+        pass
+    return time.time()
+
+
+def metrics_from_stats(stats: Dict) -> ContainerMetrics:
+    """
+    Sample crudo de /containers/{id}/stats (one-shot o stream) -> ContainerMetrics.
+    Un campo que no se puede calcular queda en None; nunca levanta.
+    """
+    m = ContainerMetrics(ts=_sample_ts(stats))
+
+    # CPU: fórmula oficial de Docker, como fracción de un core
+    # cpu = (cpu_delta / system_delta) * cpu_count
+    try:
+        cpu_stats = stats["cpu_stats"]
+        precpu_stats = stats["precpu_stats"]
+        cpu_delta = (
+            cpu_stats["cpu_usage"]["total_usage"]
+            - precpu_stats["cpu_usage"]["total_usage"]
+        )
+
+        system_total = cpu_stats.get("system_cpu_usage")
+        system_prev_total = precpu_stats.get("system_cpu_usage")
+        system_delta = (
+            (system_total - system_prev_total)
+            if (system_total is not None and system_prev_total is not None)
+            else 0
+        )
+
+        cpu_count = (
+            cpu_stats.get("online_cpus")  # new docker
+            or len(cpu_stats["cpu_usage"].get("percpu_usage") or [])  # old docker
+            or 1
+        )
+
+        m.cpu = 0.0
+        if system_delta > 0 and cpu_delta > 0:
+            m.cpu = (cpu_delta / system_delta) * cpu_count
+    except (KeyError, TypeError):
+        m.cpu = None
+
+    mem = stats.get("memory_stats") or {}
+    if "usage" in mem and "limit" in mem:
+        m.mem_used = int(mem["usage"])
+        m.mem_limit = int(mem["limit"])
+
+    networks = stats.get("networks")
+    if networks is not None:
+        m.net_rx = sum(int(n.get("rx_bytes", 0)) for n in networks.values())
+        m.net_tx = sum(int(n.get("tx_bytes", 0)) for n in networks.values())
+
+    # blkio: en cgroup v2 Docker sólo llena io_service_bytes_recursive ("read"/"write")
+    blkio = (stats.get("blkio_stats") or {}).get("io_service_bytes_recursive")
+    if blkio is not None:
+        m.blk_read = sum(int(e.get("value", 0)) for e in blkio if (e.get("op") or "").lower() == "read")
+        m.blk_write = sum(int(e.get("value", 0)) for e in blkio if (e.get("op") or "").lower() == "write")
+
+    return m
+
+
+# --------------------------------------------------------------------
+# Formato (sólo en el borde de la API)
+# --------------------------------------------------------------------
+
+def format_mem_bytes(n: int) -> str:
+    """
+    1234 -> "1.21KiB", 43274178 -> "41.27MiB", 6209452032 -> "5.783GiB"
+    """
+    if n >= 1024 ** 3:
+        return f"{n / 1024 ** 3:.3f}GiB"
+    if n >= 1024 ** 2:
+        return f"{n / 1024 ** 2:.2f}MiB"
+    if n >= 1024:
+        return f"{n / 1024:.2f}KiB"
+    return f"{n}B"
+
+
+def _format_net_bytes(n: int) -> str:
+    mb = n / (1024 ** 2)
+    if mb >= 1:
+        return f"{mb:.2f}MB"
+    kb = n / 1024
+    return f"{kb:.2f}kB"
+
+
+def format_cpu(m: Optional[ContainerMetrics]) -> str:
+    """
+    -> "0.04%" / "N/A"
+    """
+    if m is None or m.cpu is None:
+        return "N/A"
+    return f"{m.cpu_percent:.2f}%"
+
+
+def format_mem(m: Optional[ContainerMetrics]) -> str:
+    """
+    -> "41.27MiB / 5.783GiB" / "N/A"
+    """
+    if m is None or m.mem_used is None or m.mem_limit is None:
+        return "N/A"
+    return f"{format_mem_bytes(m.mem_used)} / {format_mem_bytes(m.mem_limit)}"
+
+
+def format_net(m: Optional[ContainerMetrics]) -> str:
+    """
+    -> "3.83MB / 4.22MB" / "N/A"
+    """
+    if m is None or m.net_rx is None or m.net_tx is None:
+        return "N/A"
+    return f"{_format_net_bytes(m.net_rx)} / {_format_net_bytes(m.net_tx)}"
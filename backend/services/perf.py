@@ -0,0 +1,283 @@
+import asyncio
+import bisect
+import functools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# --------------------------------------------------------------------
+# Instrumentación del pipeline (para /api/v2/debug/perf)
+# --------------------------------------------------------------------
+#
+# Timers con histograma de buckets fijos (ms, escala ~logarítmica) y
+# contadores simples, todo en memoria y con un solo lock: medir cuesta un
+# par de perf_counter() y un lock, así que puede quedar siempre prendido.
+#
+# Nombres con puntos, por fase: "docker.list", "summary.build",
+# "detail.collect_stats", "route GET /api/v2/stacks", "cache.detail.stale"...
+#
+# El profiler por muestreo es opt-in (PERF_PROFILER_ENABLED=1): junta stacks
+# de todos los threads cada PERF_PROFILER_INTERVAL_MS durante N segundos y
+# los devuelve en formato "collapsed" (una línea "thread;mod:func;... n"),
+# que flamegraph.pl / speedscope leen directo.
+
+PERF_PROFILER_ENABLED = os.getenv("PERF_PROFILER_ENABLED", "0") != "0"
+PERF_PROFILER_INTERVAL_MS = 5
+PERF_PROFILER_MAX_SEC = 60
+LOOP_LAG_PERIOD_SEC = 0.5
+
+# límites superiores de cada bucket en ms (+Inf implícito al final)
+_BUCKETS_MS = (
+    0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000,
+)
+
+# nombre -> {"count", "sum", "max", "buckets": [n por bucket + Inf]}
+_TIMERS: Dict[str, Dict] = {}
+_COUNTERS: Counter = Counter()
+_LOCK = threading.Lock()
+_STARTED_AT = time.time()
+
+_profiling = threading.Lock()
+_lag_task: Optional[asyncio.Task] = None
+
+
+# --------------------------------------------------------------------
+# Timers y contadores
+# --------------------------------------------------------------------
+
+def observe(name: str, seconds: float):
+    ms = seconds * 1000
+    with _LOCK:
+        t = _TIMERS.get(name)
+        if t is None:
+            t = _TIMERS[name] = {
+                "count": 0,
+                "sum": 0.0,
+                "max": 0.0,
+                "buckets": [0] * (len(_BUCKETS_MS) + 1),
+            }
+        t["count"] += 1
+        t["sum"] += ms
+        if ms > t["max"]:
+            t["max"] = ms
+        t["buckets"][bisect.bisect_left(_BUCKETS_MS, ms)] += 1
+
+
+def count(name: str, n: int = 1):
+    with _LOCK:
+        _COUNTERS[name] += n
+
+
+@contextmanager
+def timed(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def timed_fn(name: str):
+    """
+    Decorador: cada llamada a la función cuenta como una observación de `name`.
+    """
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start)
+        return inner
+    return wrap
+
+
+def _quantile(buckets: List[int], total: int, q: float) -> Optional[float]:
+    """
+    Cota superior (ms) del bucket donde cae el cuantil q.
+    """
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, n in enumerate(buckets):
+        seen += n
+        if seen >= rank:
+            return _BUCKETS_MS[i] if i < len(_BUCKETS_MS) else None
+    return None
+
+
+def get_perf() -> Dict:
+    with _LOCK:
+        timers = {name: dict(t, buckets=list(t["buckets"])) for name, t in _TIMERS.items()}
+        counters = dict(_COUNTERS)
+
+    out = {}
+    for name in sorted(timers):
+        t = timers[name]
+        n = t["count"]
+        out[name] = {
+            "count": n,
+            "sum_ms": round(t["sum"], 3),
+            "avg_ms": round(t["sum"] / n, 4) if n else None,
+            "max_ms": round(t["max"], 3),
+            # cotas de bucket (None = por encima del último)
+            "p50_ms": _quantile(t["buckets"], n, 0.50),
+            "p95_ms": _quantile(t["buckets"], n, 0.95),
+            "p99_ms": _quantile(t["buckets"], n, 0.99),
+            "buckets": {
+                **{f"le_{b}": c for b, c in zip(_BUCKETS_MS, t["buckets"])},
+                "le_inf": t["buckets"][-1],
+            },
+        }
+    return {
+        "since": _STARTED_AT,
+        "timers": out,
+        "counters": dict(sorted(counters.items())),
+        "profiler_enabled": PERF_PROFILER_ENABLED,
+    }
+
+
+def reset_perf():
+    global _STARTED_AT
+    with _LOCK:
+        _TIMERS.clear()
+        _COUNTERS.clear()
+        _STARTED_AT = time.time()
+
+
+# --------------------------------------------------------------------
+# Llamadas al daemon (hook de requests en cada APIClient)
+# --------------------------------------------------------------------
+
+_API_VERSION_RE = re.compile(r"^/v[0-9.]+")
+_ID_RE = re.compile(r"/[0-9a-f]{12,64}(?=/|$)")
+
+
+def _api_call_name(method: str, url: str) -> str:
+    path = url.split("://", 1)[-1]
+    path = "/" + path.split("/", 1)[1] if "/" in path else "/"
+    path = path.split("?", 1)[0]
+    path = _API_VERSION_RE.sub("", path)
+    path = _ID_RE.sub("/{id}", path)
+    return f"{method} {path}"
+
+
+def _on_api_response(response, *args, **kwargs):
+    name = _api_call_name(response.request.method, response.url)
+    observe(f"docker.api {name}", response.elapsed.total_seconds())
+    # los streams (stats, logs, events) no traen Content-Length: no se leen acá
+    size = response.headers.get("Content-Length")
+    with _LOCK:
+        _COUNTERS[f"docker.api.calls {name}"] += 1
+        if size and size.isdigit():
+            _COUNTERS["docker.api.response_bytes"] += int(size)
+
+
+def instrument_docker_client(docker_client):
+    """
+    Cuenta cada request al daemon (por método + ruta, con los ids
+    normalizados), su tiempo hasta headers y los bytes de respuesta.
+    """
+    api = getattr(docker_client, "api", None)
+    hooks = getattr(api, "hooks", None)
+    if isinstance(hooks, dict) and _on_api_response not in hooks.setdefault("response", []):
+        hooks["response"].append(_on_api_response)
+
+
+# --------------------------------------------------------------------
+# Lag del event loop
+# --------------------------------------------------------------------
+
+async def _watch_loop_lag():
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_PERIOD_SEC)
+        observe("loop.lag", max(0.0, time.perf_counter() - start - LOOP_LAG_PERIOD_SEC))
+
+
+def start_loop_lag_monitor():
+    global _lag_task
+    if _lag_task is None:
+        _lag_task = asyncio.create_task(_watch_loop_lag())
+
+
+# --------------------------------------------------------------------
+# Tiempos por route (middleware ASGI)
+# --------------------------------------------------------------------
+
+class PerfMiddleware:
+    """
+    Tiempo hasta el primer byte de cada request HTTP, por route template
+    ("route GET /api/v2/stacks/{stack_id}"), y cuántas respuestas por route
+    y status (ej. 304 vs 200 en los snapshots con ETag).
+    En los streams NDJSON mide hasta que arranca el stream, no su duración.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                path = getattr(route, "path", None) or "unmatched"
+                name = f"{scope['method']} {path}"
+                observe(f"route {name}", time.perf_counter() - start)
+                count(f"route.status {name} {message['status']}")
+            await send(message)
+
+        await self.app(scope, receive, send_timed)
+
+
+# --------------------------------------------------------------------
+# Profiler por muestreo
+# --------------------------------------------------------------------
+
+def _frame_stack(frame) -> List[str]:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", "?")
+        stack.append(f"{module}:{code.co_name}")
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def sample_profile(seconds: float, interval_ms: float = PERF_PROFILER_INTERVAL_MS) -> Optional[str]:
+    """
+    Muestrea los stacks de todos los threads durante `seconds` (bloqueante)
+    y devuelve el formato collapsed. None si ya hay un profile corriendo.
+    """
+    if not _profiling.acquire(blocking=False):
+        return None
+    try:
+        me = threading.get_ident()
+        names = {}
+        stacks: Counter = Counter()
+        interval = max(0.001, interval_ms / 1000)
+        deadline = time.monotonic() + min(seconds, PERF_PROFILER_MAX_SEC)
+        while time.monotonic() < deadline:
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                thread = names.get(ident, str(ident)).replace(";", "_").replace(" ", "_")
+                stacks[";".join([thread] + _frame_stack(frame))] += 1
+            time.sleep(interval)
+        return "".join(f"{stack} {n}\n" for stack, n in stacks.most_common())
+    finally:
+        _profiling.release()
@@ -0,0 +1,237 @@
+import gzip
+import logging
+import os
+import time
+from typing import Dict, List
+
+from auth import get_token_cache_stats
+from services.docker_client import MULTI_HOST, get_hosts_health, host_of
+from services.docker_service_v3 import _classify_state
+from services.log_index import get_index_stats
+from services.perf import count
+from services.scheduler import get_schedule
+from services.snapshot import (
+    _stack_groups,
+    get_refresh_generation,
+    get_stream_state,
+    get_summary_snapshot,
+)
+from services.stats_collector import get_collector_stats, get_latest_stats
+
+log = logging.getLogger(__name__)
+
+# --------------------------------------------------------------------
+# /metrics en formato de texto de Prometheus
+# --------------------------------------------------------------------
+#
+# Se arma desde lo que ya está en memoria (registro, último sample de cada
+# contenedor, summary de stacks) UNA vez por ciclo del loop de refresco
+# (get_refresh_generation) y se sirve cacheado: un scrape entre ciclos
+# devuelve los mismos bytes sin recorrer nada.
+#
+# Cardinalidad por entorno:
+#   METRICS_PER_CONTAINER      "0" -> sólo series por stack y del backend
+#   METRICS_CONTAINER_LABELS   labels de las series por contenedor, de
+#                              name,id,stack,host (default "name,stack";
+#                              host sólo tiene sentido con varios hosts).
+#                              Tienen que identificar al contenedor: si no,
+#                              se agrega name (y host con varios hosts)
+
+METRICS_PER_CONTAINER = os.getenv("METRICS_PER_CONTAINER", "1") != "0"
+_CONTAINER_LABEL_CHOICES = ("name", "id", "stack", "host")
+
+
+def _parse_container_labels(raw: str) -> List[str]:
+    """
+    METRICS_CONTAINER_LABELS -> labels válidos, completados para que dos
+    contenedores nunca den el mismo label set (Prometheus descarta las
+    series duplicadas del scrape).
+    """
+    labels: List[str] = []
+    for label in raw.split(","):
+        label = label.strip()
+        if label in _CONTAINER_LABEL_CHOICES and label not in labels:
+            labels.append(label)
+    if "name" not in labels and "id" not in labels:
+        log.warning("METRICS_CONTAINER_LABELS=%r does not identify a container; adding name", raw)
+        labels.insert(0, "name")
+    # el nombre es único por host: con varios hosts hace falta host o el
+    # stack (que ya viene como "host:stack")
+    if MULTI_HOST and "id" not in labels and "host" not in labels and "stack" not in labels:
+        log.warning("METRICS_CONTAINER_LABELS=%r is ambiguous across hosts; adding host", raw)
+        labels.append("host")
+    return labels
+
+
+METRICS_CONTAINER_LABELS = _parse_container_labels(os.getenv("METRICS_CONTAINER_LABELS", "name,stack"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_PREFIX = "docker_monitor_"
+
+# (nombre, tipo, help) en el orden en que se escriben
+_FAMILIES = (
+    ("container_running", "gauge", "1 if the container is running."),
+    ("container_unhealthy", "gauge", "1 if the container healthcheck reports unhealthy."),
+    ("container_cpu_ratio", "gauge", "CPU usage as a fraction of one core."),
+    ("container_memory_used_bytes", "gauge", "Memory in use."),
+    ("container_memory_limit_bytes", "gauge", "Memory limit (host memory if unlimited)."),
+    ("container_network_receive_bytes_total", "counter", "Bytes received, all interfaces."),
+    ("container_network_transmit_bytes_total", "counter", "Bytes sent, all interfaces."),
+    ("container_blkio_read_bytes_total", "counter", "Bytes read from block devices."),
+    ("container_blkio_write_bytes_total", "counter", "Bytes written to block devices."),
+    ("stack_containers", "gauge", "Containers in the stack."),
+    ("stack_running_containers", "gauge", "Running containers in the stack."),
+    ("stack_status", "gauge", "Stack status (healthy, degraded, stopped); 1 for the current one."),
+    ("stack_cpu_ratio_avg", "gauge", "Average CPU of the stack's containers, fraction of one core."),
+    ("stack_memory_used_bytes", "gauge", "Memory in use by the stack's containers."),
+    ("host_up", "gauge", "1 if the last listing / events stream of the Docker host worked."),
+    ("host_list_latency_seconds", "gauge", "Duration of the last successful container listing."),
+    ("refresh_cycle_seconds", "gauge", "Duration of the last snapshot refresh cycle."),
+    ("refresh_interval_seconds", "gauge", "Current effective summary refresh interval."),
+    ("refresh_stretch_ratio", "gauge", "Load stretch applied to every refresh interval."),
+    ("refresh_generation", "counter", "Snapshot refresh cycles since start."),
+    ("stream_generation", "counter", "Generations pushed to /api/v2/stream."),
+    ("stats_sources", "gauge", "Containers sampled per source (docker stream or cgroup)."),
+    ("log_index_bytes", "gauge", "Log index size per storage tier."),
+    ("auth_token_cache_hits_total", "counter", "Verified-token cache hits."),
+    ("auth_token_cache_misses_total", "counter", "Verified-token cache misses."),
+    ("metrics_render_seconds", "gauge", "Time spent rendering the previous /metrics body."),
+)
+
+# generación -> body por encoding ("identity", "gzip")
+_cache_generation: int = -1
+_cache_body: Dict[str, bytes] = {}
+_last_render_sec: float = 0.0
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _num(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _container_labels(container, stack_id: str) -> str:
+    pairs = []
+    for label in METRICS_CONTAINER_LABELS:
+        if label == "name":
+            pairs.append(("name", container.name))
+        elif label == "id":
+            pairs.append(("id", container.id[:12]))
+        elif label == "stack":
+            pairs.append(("stack", stack_id))
+        elif label == "host" and MULTI_HOST:
+            pairs.append(("host", host_of(container)))
+    return _labels(pairs)
+
+
+def render_metrics() -> bytes:
+    """
+    Arma el texto completo (sin cache).
+    """
+    out: Dict[str, List[str]] = {name: [] for name, _, _ in _FAMILIES}
+
+    def add(name: str, labels: str, value):
+        if value is not None:
+            out[name].append(f"{_PREFIX}{name}{labels} {_num(value)}")
+
+    running_per_stack: Dict[str, int] = {}
+    for stack_id, members in _stack_groups().items():
+        running = 0
+        for c in members:
+            state = _classify_state(c)
+            is_running = state != "stopped"
+            running += is_running
+            if not METRICS_PER_CONTAINER:
+                continue
+            labels = _container_labels(c, stack_id)
+            add("container_running", labels, is_running)
+            add("container_unhealthy", labels, state == "unhealthy")
+            m = get_latest_stats(c.id)
+            if m is None:
+                continue
+            add("container_cpu_ratio", labels, m.cpu)
+            add("container_memory_used_bytes", labels, m.mem_used)
+            add("container_memory_limit_bytes", labels, m.mem_limit)
+            add("container_network_receive_bytes_total", labels, m.net_rx)
+            add("container_network_transmit_bytes_total", labels, m.net_tx)
+            add("container_blkio_read_bytes_total", labels, m.blk_read)
+            add("container_blkio_write_bytes_total", labels, m.blk_write)
+        running_per_stack[stack_id] = running
+
+    for st in get_summary_snapshot():
+        stack_id = st["stack_id"]
+        pairs = [("stack", stack_id)]
+        if MULTI_HOST:
+            pairs.append(("host", st.get("host")))
+        labels = _labels(pairs)
+        add("stack_containers", labels, st["containers_count"])
+        add("stack_running_containers", labels, running_per_stack.get(stack_id, 0))
+        add("stack_status", _labels(pairs + [("status", st["status"])]), 1)
+        cpu = st.get("cpu_avg_percent")
+        add("stack_cpu_ratio_avg", labels, cpu / 100 if cpu is not None else None)
+        add("stack_memory_used_bytes", labels, st.get("ram_used_bytes"))
+
+    for h in get_hosts_health():
+        labels = _labels([("host", h["host"])])
+        add("host_up", labels, bool(h["ok"]))
+        latency = h["latency_ms"]
+        add("host_list_latency_seconds", labels, latency / 1000 if latency is not None else None)
+
+    schedule = get_schedule()
+    add("refresh_cycle_seconds", "", schedule["last_cycle_ms"] / 1000)
+    add("refresh_interval_seconds", "", schedule["summary_interval_sec"])
+    add("refresh_stretch_ratio", "", schedule["stretch"])
+    add("refresh_generation", "", get_refresh_generation())
+    add("stream_generation", "", get_stream_state()[0])
+    for source, n in get_collector_stats().items():
+        add("stats_sources", _labels([("source", source)]), n)
+    index = get_index_stats()
+    add("log_index_bytes", _labels([("tier", "memory")]), index["memory_bytes"])
+    add("log_index_bytes", _labels([("tier", "disk")]), index["disk_bytes"])
+    tokens = get_token_cache_stats()
+    add("auth_token_cache_hits_total", "", tokens["hits"])
+    add("auth_token_cache_misses_total", "", tokens["misses"])
+    add("metrics_render_seconds", "", round(_last_render_sec, 6))
+
+    lines: List[str] = []
+    for name, kind, help_text in _FAMILIES:
+        if not out[name]:
+            continue
+        lines.append(f"# HELP {_PREFIX}{name} {help_text}")
+        lines.append(f"# TYPE {_PREFIX}{name} {kind}")
+        lines.extend(out[name])
+    lines.append("")
+    return "\n".join(lines).encode("utf-8")
+
+
+def get_metrics_body(encoding: str = "identity") -> bytes:
+    """
+    Body de /metrics de la generación actual, cacheado por encoding.
+    """
+    global _cache_generation, _cache_body, _last_render_sec
+
+    generation = get_refresh_generation()
+    if generation != _cache_generation or "identity" not in _cache_body:
+        count("cache.metrics.miss")
+        start = time.perf_counter()
+        body = render_metrics()
+        _last_render_sec = time.perf_counter() - start
+        _cache_generation = generation
+        _cache_body = {"identity": body}
+    else:
+        count("cache.metrics.hit")
+
+    body = _cache_body.get(encoding)
+    if body is None:
+        body = gzip.compress(_cache_body["identity"], compresslevel=5)
+        _cache_body[encoding] = body
+    return body
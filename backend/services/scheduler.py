@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+# --------------------------------------------------------------------
+# Cadencia adaptativa del snapshot según interés y carga
+# --------------------------------------------------------------------
+#
+# Cada lectura del snapshot deja una marca de "interés": el summary (lista de
+# stacks, /api/status) o un stack puntual (su detalle). El detalle de los
+# stacks que alguien miró en los últimos INTEREST_WINDOW_SEC se pre-arma en
+# cada ciclo; el de los demás sólo on-demand. El summary va a cadencia
+# rápida si alguien lo mira y a la lenta si no, igual que el reconcile.
+# Un suscriptor de /api/v2/stream cuenta como interés en todo.
+#
+# Además, si un ciclo de refresco tarda más que CYCLE_BUDGET_FRACTION de su
+# intervalo, todos los intervalos se estiran (x STRETCH_STEP, hasta
+# MAX_STRETCH); cuando los ciclos vuelven a entrar en presupuesto se
+# encogen de a poco hasta 1.
+
+FAST_INTERVAL_SEC = 2             # summary / TTL y pre-armado del detalle de lo que se mira
+SLOW_INTERVAL_SEC = 15            # summary sin nadie mirando (el detalle ni se pre-arma)
+RECONCILE_INTERVAL_SEC = 60       # relistado completo de seguridad con interés
+IDLE_RECONCILE_INTERVAL_SEC = 300 # ...y sin nadie mirando
+INTEREST_WINDOW_SEC = 30          # cuánto dura la marca de interés
+
+CYCLE_BUDGET_FRACTION = 0.5
+STRETCH_STEP = 1.5
+STRETCH_DECAY = 0.9
+MAX_STRETCH = 8.0
+
+# stack_id -> último momento en que alguien lo miró
+_STACK_INTEREST: Dict[str, float] = {}
+_SUMMARY_INTEREST_TS: float = 0.0
+_STREAM_WATCHERS: int = 0
+_LOCK = threading.Lock()
+
+_stretch: float = 1.0
+_last_cycle_sec: float = 0.0
+
+# despierta al loop de refresco cuando alguien empieza a mirar después de
+# un rato sin interés (para no esperar el intervalo lento entero)
+_wakeup: Optional[asyncio.Event] = None
+_wakeup_loop = None
+
+
+def set_wakeup(event: asyncio.Event, loop):
+    global _wakeup, _wakeup_loop
+    _wakeup, _wakeup_loop = event, loop
+
+
+def _wake_if_idle(was_watched: bool):
+    if not was_watched and _wakeup is not None:
+        _wakeup_loop.call_soon_threadsafe(_wakeup.set)
+
+
+# --------------------------------------------------------------------
+# Marcas de interés
+# --------------------------------------------------------------------
+
+def note_summary_interest():
+    global _SUMMARY_INTEREST_TS
+    now = time.time()
+    was_watched = summary_watched(now)
+    _SUMMARY_INTEREST_TS = now
+    _wake_if_idle(was_watched)
+
+
+def note_stack_interest(stack_ids: Iterable[str]):
+    now = time.time()
+    with _LOCK:
+        for stack_id in stack_ids:
+            _STACK_INTEREST[stack_id] = now
+
+
+def set_stream_watchers(count: int):
+    global _STREAM_WATCHERS
+    was_watched = summary_watched()
+    _STREAM_WATCHERS = count
+    _wake_if_idle(was_watched)
+
+
+def summary_watched(now: Optional[float] = None) -> bool:
+    now = time.time() if now is None else now
+    return _STREAM_WATCHERS > 0 or (now - _SUMMARY_INTEREST_TS) < INTEREST_WINDOW_SEC
+
+
+def watched_stacks(now: Optional[float] = None) -> list:
+    """
+    Stacks con interés vigente. De paso olvida las marcas vencidas.
+    """
+    now = time.time() if now is None else now
+    with _LOCK:
+        for stack_id, ts in list(_STACK_INTEREST.items()):
+            if (now - ts) >= INTEREST_WINDOW_SEC:
+                del _STACK_INTEREST[stack_id]
+        return list(_STACK_INTEREST)
+
+
+# --------------------------------------------------------------------
+# Intervalos efectivos
+# --------------------------------------------------------------------
+
+def summary_interval() -> float:
+    base = FAST_INTERVAL_SEC if summary_watched() else SLOW_INTERVAL_SEC
+    return base * _stretch
+
+
+def detail_ttl() -> float:
+    return FAST_INTERVAL_SEC * _stretch
+
+
+def reconcile_interval() -> float:
+    watched = summary_watched() or bool(_STACK_INTEREST)
+    base = RECONCILE_INTERVAL_SEC if watched else IDLE_RECONCILE_INTERVAL_SEC
+    return base * _stretch
+
+
+def record_cycle(elapsed: float, interval: float):
+    """
+    Ajusta el estiramiento según cuánto tardó el último ciclo de refresco
+    respecto de su presupuesto.
+    """
+    global _stretch, _last_cycle_sec
+    _last_cycle_sec = elapsed
+    if elapsed > interval * CYCLE_BUDGET_FRACTION:
+        _stretch = min(MAX_STRETCH, _stretch * STRETCH_STEP)
+    else:
+        _stretch = max(1.0, _stretch * STRETCH_DECAY)
+
+
+def get_schedule() -> Dict:
+    """
+    Intervalos efectivos en este momento (para /api/v2/debug/schedule).
+    """
+    now = time.time()
+    interval = summary_interval()
+    return {
+        "stretch": round(_stretch, 3),
+        "last_cycle_ms": round(_last_cycle_sec * 1000, 1),
+        "cycle_budget_ms": round(interval * CYCLE_BUDGET_FRACTION * 1000, 1),
+        "summary_watched": summary_watched(now),
+        "stream_watchers": _STREAM_WATCHERS,
+        "summary_interval_sec": round(interval, 3),
+        "reconcile_interval_sec": round(reconcile_interval(), 3),
+        "detail_ttl_sec": round(detail_ttl(), 3),
+        # stacks cuyo detalle se pre-arma en cada ciclo -> hace cuánto se miraron
+        "watched_stacks": {
+            stack_id: round(now - _STACK_INTEREST.get(stack_id, now), 1)
+            for stack_id in watched_stacks(now)
+        },
+    }
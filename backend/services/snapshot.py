@@ -1,12 +1,57 @@
 import asyncio
+import gzip
+import hashlib
+import json
+import threading
 import time
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
+import docker
+
+try:  # brotli es opcional: si no está instalado sólo se ofrece gzip
+    import brotli
+except ImportError:
+    brotli = None
+
+from models.v2 import StackDetailResponse, StackListResponse
+from services.docker_client import (
+    DEFAULT_HOST,
+    DOCKER_TIMEOUT_SEC,
+    HOSTS,
+    find_on_hosts,
+    host_healthy,
+    host_of,
+    mark_host,
+    run_docker_io,
+)
 from services.docker_service_v3 import (
+    _stack_name_for_container,
     _build_stack_summaries,
     _build_stack_detail,
+    _build_stack_details,
+)
+from services.log_index import drop_logs, sync_follower, sync_followers
+from services.perf import count, observe, timed
+from services.scheduler import (
+    detail_ttl,
+    note_stack_interest,
+    note_summary_interest,
+    reconcile_interval,
+    record_cycle,
+    set_stream_watchers,
+    set_wakeup,
+    summary_interval,
+    watched_stacks,
 )
+from services.stats_collector import (
+    get_latest_stats,
+    get_stack_aggregate,
+    stop_stream,
+    sync_container,
+    sync_streams,
+)
+from services.timeseries import drop_series, retain_series
 
 log = logging.getLogger(__name__)
 
@@ -14,61 +59,617 @@ log = logging.getLogger(__name__)
 # Config
 # --------------------------------------------------------------------
 
-REFRESH_INTERVAL_SEC = 2          # cada cuánto refrescamos el summary global
-DETAIL_TTL_SEC = 2                # cuánto dura "fresco" el detalle de un stack
+# Las cadencias del summary, del TTL del detalle y del reconcile (relistado
+# completo de seguridad) las decide services.scheduler según quién mira.
+DETAIL_MAX_STALE_SEC = 30         # hasta cuánto se sirve un detalle vencido mientras se rearma
+EVENTS_RETRY_SEC = 5              # espera antes de reconectar al stream de eventos
+HOST_RETRY_SEC = 10               # reintento del listado de un host caído
+
+# Acciones de /events que cambian algo que mostramos. El resto (exec_*, top,
+# attach, resize...) se ignora: los healthchecks generan exec_* todo el tiempo.
+_WATCHED_ACTIONS = {
+    "create",
+    "start",
+    "restart",
+    "stop",
+    "die",
+    "kill",
+    "pause",
+    "unpause",
+    "rename",
+    "update",
+    "health_status",
+    "destroy",
+}
 
 # --------------------------------------------------------------------
 # Estado global en memoria
 # --------------------------------------------------------------------
 
+# Registro de contenedores: container_id -> Container (con attrs ya inspeccionados).
+# Lo escribe el thread de eventos, lo lee el loop de refresco.
+_CONTAINERS: Dict[str, object] = {}
+# Índice por stack, mantenido junto con el registro (mismo lock): armar el
+# detalle de un stack cuesta O(contenedores del stack), no O(host).
+#   stack_id -> {container_id: None} (set ordenado: el orden no cambia entre rebuilds)
+#   container_id -> stack_id (para sacarlo del stack viejo si cambian sus labels)
+_STACK_INDEX: Dict[str, Dict[str, None]] = {}
+_CONTAINER_STACK: Dict[str, str] = {}
+_CONTAINERS_LOCK = threading.Lock()
+_LAST_RECONCILE_TS: float = 0.0       # último listado OK de cualquier host (0 = sin sembrar)
+# host -> último intento de listado / tarea de listado en curso. Cada host se
+# relista por su cuenta: uno lento o caído no frena a los demás.
+_HOST_RECONCILE_TS: Dict[str, float] = {}
+_HOST_RECONCILE_TASKS: Dict[str, asyncio.Task] = {}
+
 # Snapshot liviano (lista de stacks con status, uptime, etc.)
 _STACKS_SUMMARY: List[Dict] = []
+_STACKS_SUMMARY_ETAG: str = ""
+# Body ya serializado por encoding ("identity", "gzip", "br"), de la generación actual
+_STACKS_SUMMARY_BODY: Dict[str, bytes] = {}
 _LAST_REFRESH_TS: float = 0.0
+# Sube en cada ciclo del loop de refresco: lo que se arma "una vez por
+# ciclo" (ej. /metrics) lo usa como clave de cache.
+_REFRESH_GENERATION: int = 0
 
 # Cache de detalle por stack (contiene CPU/RAM/etc.)
 _STACKS_DETAIL: Dict[str, Dict] = {}
 _STACKS_DETAIL_TS: Dict[str, float] = {}
+_STACKS_DETAIL_ETAG: Dict[str, str] = {}
+_STACKS_DETAIL_BODY: Dict[str, Dict[str, bytes]] = {}
+# Builds de detalle en curso (single-flight): stack_id -> Task. Todos los
+# que piden el mismo stack mientras se arma esperan esa misma tarea.
+_DETAIL_INFLIGHT: Dict[str, asyncio.Task] = {}
+# Último invalidate por stack (refresh_containers): un build que empezó
+# antes no puede dejar su resultado como "fresco".
+_STACKS_DETAIL_INVALIDATED: Dict[str, float] = {}
+
+# Estado que se empuja por /api/v2/stream: summaries por stack_id y
+# contenedores (con su stack_id) por id. Sólo se arma si hay suscriptores.
+_STREAM_STATE: Dict[str, Dict[str, Dict]] = {"stacks": {}, "containers": {}}
+_STREAM_GENERATION: int = 0
+_STREAM_SUBSCRIBERS: int = 0
+_stream_changed: Optional[asyncio.Condition] = None
 
 _background_task: Optional[asyncio.Task] = None
+_refresh_wakeup: Optional[asyncio.Event] = None
+# host -> thread de eventos
+_events_threads: Dict[str, threading.Thread] = {}
+
+
+# --------------------------------------------------------------------
+# Helpers
+# --------------------------------------------------------------------
+
+def _etag_for(data) -> str:
+    """
+    Hash de contenido para ETag. Se calcula una vez por generación,
+    no por request.
+    """
+    raw = json.dumps(data, sort_keys=True, separators=(",", ":")).encode()
+    return '"' + hashlib.blake2b(raw, digest_size=12).hexdigest() + '"'
+
+
+def available_encodings() -> List[str]:
+    """
+    Content-Encodings que podemos servir, en orden de preferencia.
+    """
+    if brotli is not None:
+        return ["br", "gzip", "identity"]
+    return ["gzip", "identity"]
+
+
+def _encoded_body(cache: Dict[str, bytes], model, data, encoding: str) -> bytes:
+    """
+    Bytes de la respuesta para una generación, memoizados por encoding en
+    `cache`: la validación Pydantic + JSON se hace una sola vez por
+    generación y cada compresión una sola vez, el primer request que la pide.
+    """
+    body = cache.get(encoding)
+    if body is not None:
+        return body
+
+    raw = cache.get("identity")
+    if raw is None:
+        with timed("encode.json"):
+            raw = model.model_validate(data).model_dump_json().encode()
+        cache["identity"] = raw
+
+    if encoding == "gzip":
+        with timed("encode.gzip"):
+            body = gzip.compress(raw, compresslevel=6)
+    elif encoding == "br" and brotli is not None:
+        with timed("encode.br"):
+            body = brotli.compress(raw, quality=5)
+    else:
+        return raw
+
+    cache[encoding] = body
+    return body
+
+
+# --------------------------------------------------------------------
+# Registro de contenedores (seed + eventos + reconcile)
+# --------------------------------------------------------------------
+
+def _snapshot_containers() -> List:
+    """
+    Copia de los contenedores conocidos, segura para iterar fuera del lock.
+    """
+    with _CONTAINERS_LOCK:
+        return list(_CONTAINERS.values())
+
+
+def _index_put(container):
+    """
+    Alta/actualización en el registro y en el índice (con _CONTAINERS_LOCK
+    tomado). Si el contenedor cambió de stack (relabel), se mueve.
+    """
+    cid = container.id
+    stack_id = _stack_name_for_container(container)
+    old_stack = _CONTAINER_STACK.get(cid)
+    if old_stack is not None and old_stack != stack_id:
+        _index_drop(cid)
+    _CONTAINERS[cid] = container
+    _CONTAINER_STACK[cid] = stack_id
+    _STACK_INDEX.setdefault(stack_id, {})[cid] = None
+
+
+def _index_drop(container_id: str):
+    """
+    Baja del registro y del índice (con _CONTAINERS_LOCK tomado).
+    """
+    _CONTAINERS.pop(container_id, None)
+    stack_id = _CONTAINER_STACK.pop(container_id, None)
+    members = _STACK_INDEX.get(stack_id)
+    if members is not None:
+        members.pop(container_id, None)
+        if not members:
+            del _STACK_INDEX[stack_id]
+            _forget_stack_detail(stack_id)
+
+
+def _forget_stack_detail(stack_id: str):
+    """
+    Saca de los caches de detalle un stack que se quedó sin contenedores
+    (con _CONTAINERS_LOCK tomado): no se sigue sirviendo y los dicts no
+    crecen con cada stack que alguna vez existió.
+    """
+    _STACKS_DETAIL.pop(stack_id, None)
+    _STACKS_DETAIL_TS.pop(stack_id, None)
+    _STACKS_DETAIL_ETAG.pop(stack_id, None)
+    _STACKS_DETAIL_BODY.pop(stack_id, None)
+    _STACKS_DETAIL_INVALIDATED.pop(stack_id, None)
+
+
+def _stack_groups(stack_ids: Optional[List[str]] = None) -> Dict[str, List]:
+    """
+    stack_id -> contenedores, desde el índice (copia segura fuera del lock).
+    Con `stack_ids` sólo esos (los que no existen no aparecen).
+    """
+    with _CONTAINERS_LOCK:
+        wanted = _STACK_INDEX.keys() if stack_ids is None else stack_ids
+        return {
+            stack_id: [_CONTAINERS[cid] for cid in _STACK_INDEX[stack_id]]
+            for stack_id in wanted
+            if stack_id in _STACK_INDEX
+        }
+
+
+def get_running_containers() -> Optional[List]:
+    """
+    Contenedores running del registro, o None si todavía no se sembró
+    (antes del primer reconcile).
+    """
+    if not _LAST_RECONCILE_TS:
+        return None
+    note_summary_interest()
+    return [
+        c for c in _snapshot_containers()
+        if c.attrs.get("State", {}).get("Running", False)
+    ]
+
+
+def get_stack_containers(stack_id: str) -> List:
+    """
+    Contenedores (running o no) de un stack según el registro.
+    """
+    return _stack_groups([stack_id]).get(stack_id, [])
+
+
+def get_stack_container_ids(stack_id: str) -> List[str]:
+    """
+    Ids de los contenedores (running o no) de un stack según el registro.
+    """
+    return [c.id for c in get_stack_containers(stack_id)]
+
+
+def find_container(container_ref: str):
+    """
+    Contenedor del registro por id completo, id corto o nombre (None si no está).
+    """
+    with _CONTAINERS_LOCK:
+        container = _CONTAINERS.get(container_ref)
+        if container is not None:
+            return container
+        for cid, c in _CONTAINERS.items():
+            if cid.startswith(container_ref) or c.name == container_ref:
+                return c
+    return None
+
+
+def _reconcile_host(host: str):
+    """
+    Relistado completo de UN host (containers.list(all=True)). Se usa para
+    sembrar el registro al arrancar y como red de seguridad cada
+    reconcile_interval(). Sólo toca los contenedores de ese host; si el
+    host no responde, los suyos quedan como estaban (y el host, marcado).
+    """
+    global _LAST_RECONCILE_TS
+
+    start = time.time()
+    try:
+        # ignore_removed: un destroy entre el listado y el inspect de ese
+        # contenedor no hace fallar el reconcile (el evento lo saca igual)
+        containers = HOSTS[host].containers.list(all=True, ignore_removed=True)
+    except Exception as e:
+        mark_host(host, False, str(e))
+        raise
+    mark_host(host, True, latency=time.time() - start)
+    observe(f"reconcile.list {host}", time.time() - start)
+
+    listed = {c.id for c in containers}
+    with _CONTAINERS_LOCK:
+        gone = [
+            cid for cid, c in _CONTAINERS.items()
+            if cid not in listed and host_of(c) == host
+        ]
+        for cid in gone:
+            _index_drop(cid)
+        # los que siguen conservan su lugar en el índice (orden estable)
+        for c in containers:
+            _index_put(c)
+        everything = list(_CONTAINERS.values())
+    sync_streams(everything)
+    sync_followers(everything)
+    retain_series(c.id for c in everything)
+    _LAST_RECONCILE_TS = time.time()
+
+
+def _apply_event(event: Dict, host: str = DEFAULT_HOST):
+    """
+    Actualiza SOLO el contenedor afectado por un evento de Docker.
+    destroy -> se borra; cualquier otra acción vigilada -> un inspect puntual.
+    También abre/cierra su stream de stats y su follower de logs según
+    quede running o no.
+    """
+    action = (event.get("Action") or event.get("status") or "").split(":")[0].strip()
+    if action not in _WATCHED_ACTIONS:
+        return
+
+    container_id = event.get("id") or event.get("Actor", {}).get("ID")
+    if not container_id:
+        return
+
+    _refresh_container(container_id, destroyed=(action == "destroy"), host=host)
+
+
+def _refresh_container(container_id: str, destroyed: bool = False, host: Optional[str] = None):
+    """
+    Inspect puntual de un contenedor y alta/baja en el registro, streams de
+    stats, historial y follower de logs. Devuelve el contenedor (None si
+    ya no existe). Sin `host`, el del registro (o el default).
+    """
+    if host is None:
+        with _CONTAINERS_LOCK:
+            known = _CONTAINERS.get(container_id)
+        host = host_of(known) if known is not None else DEFAULT_HOST
+
+    container = None
+    if not destroyed:
+        try:
+            with timed("docker.inspect"):
+                container = HOSTS[host].containers.get(container_id)
+        except docker.errors.NotFound:
+            container = None
+
+    with _CONTAINERS_LOCK:
+        if container is None:
+            _index_drop(container_id)
+        else:
+            _index_put(container)
+
+    if container is None:
+        stop_stream(container_id)
+        drop_series(container_id)
+        drop_logs(container_id)
+    else:
+        sync_container(container)
+        sync_follower(container)
+    return container
+
+
+def refresh_containers(container_ids: List[str]):
+    """
+    Re-inspecciona SOLO los contenedores indicados (después de una acción
+    start/stop/restart) sin esperar al evento, e invalida el detalle
+    cacheado de los stacks a los que pertenecen. Bloqueante: desde el loop
+    va por run_docker_io.
+    """
+    stacks = set()
+    for container_id in container_ids:
+        with _CONTAINERS_LOCK:
+            old_stack = _CONTAINER_STACK.get(container_id)
+        new = _refresh_container(container_id)
+        if old_stack is not None:
+            stacks.add(old_stack)
+        if new is not None:
+            stacks.add(_stack_name_for_container(new))
+
+    now = time.time()
+    for stack_id in stacks:
+        _STACKS_DETAIL_TS.pop(stack_id, None)
+        _STACKS_DETAIL_INVALIDATED[stack_id] = now
+
+
+async def resolve_container(container_ref: str):
+    """
+    Contenedor por id completo, id corto o nombre: primero el registro
+    (cualquier host), si no un get() host por host en el executor.
+    Levanta docker.errors.NotFound si no está en ningún lado.
+    """
+    container = find_container(container_ref)
+    if container is not None:
+        return container
+    return await run_docker_io(find_on_hosts, container_ref)
+
+
+def _events_watcher(host: str, since: float):
+    """
+    Thread que consume events() de un host y aplica cada evento al registro.
+    Si el stream se corta, reconecta con `since` para no perder eventos
+    (los repetidos son idempotentes: solo re-inspeccionan).
+    """
+    while True:
+        try:
+            stream = HOSTS[host].events(
+                decode=True,
+                since=int(since),
+                filters={"type": "container"},
+            )
+            for event in stream:
+                since = event.get("time", since)
+                count("docker.events")
+                try:
+                    _apply_event(event, host)
+                except Exception as e:
+                    log.exception("docker event handling failed: %s", e)
+        except Exception as e:
+            log.warning("docker events stream of host %s interrupted: %s", host, e)
+            mark_host(host, False, str(e))
+        time.sleep(EVENTS_RETRY_SEC)
+
+
+def _start_events_watcher(host: str, since: float):
+    if host not in _events_threads:
+        thread = threading.Thread(
+            target=_events_watcher,
+            args=(host, since),
+            name=f"docker-events-{host}",
+            daemon=True,
+        )
+        _events_threads[host] = thread
+        thread.start()
+
+
+async def _reconcile_host_task(host: str, start: float):
+    try:
+        await asyncio.wait_for(
+            run_docker_io(_reconcile_host, host),
+            timeout=DOCKER_TIMEOUT_SEC,
+        )
+    except Exception as e:
+        log.warning("reconcile of host %s failed: %s", host, e or "timeout")
+        if isinstance(e, asyncio.TimeoutError):
+            mark_host(host, False, "timeout")
+        return
+    # el primer listado OK arranca el watcher; pide eventos desde antes del listado
+    _start_events_watcher(host, since=start)
+
+
+def _schedule_reconciles(now: float) -> List[asyncio.Task]:
+    """
+    Lanza el relistado de cada host al que le toca (reconcile_interval(), o
+    HOST_RETRY_SEC si está caído) y no tiene uno en curso. No se espera acá.
+    """
+    started = []
+    for host in HOSTS:
+        task = _HOST_RECONCILE_TASKS.get(host)
+        if task is not None and not task.done():
+            continue
+        due = reconcile_interval() if host_healthy(host) else HOST_RETRY_SEC
+        if (now - _HOST_RECONCILE_TS.get(host, 0)) >= due:
+            _HOST_RECONCILE_TS[host] = now
+            task = asyncio.create_task(_reconcile_host_task(host, now))
+            _HOST_RECONCILE_TASKS[host] = task
+            started.append(task)
+    return started
 
 
 # --------------------------------------------------------------------
 # Loop background para refrescar el summary
 # --------------------------------------------------------------------
 
+def _prewarm_details(stack_ids: List[str], now: float):
+    """
+    Rearma desde memoria el detalle de los stacks que alguien está mirando,
+    así su próximo request encuentra el cache fresco.
+    """
+    if not stack_ids:
+        return
+    with timed("loop.prewarm"):
+        details = _build_stack_details(
+            stack_ids,
+            stats_lookup=get_latest_stats,
+            groups=_stack_groups(stack_ids),
+        )
+        for detail in details:
+            _store_detail(detail, now)
+
+
 async def _refresh_loop():
     """
-    Loop que mantiene _STACKS_SUMMARY actualizado cada REFRESH_INTERVAL_SEC.
-    IMPORTANTE: esto NO recalcula todos los detalles de todos los stacks,
-    porque eso implicaría pedir stats() de todos los contenedores todo el tiempo.
-    Ese cálculo se hace on-demand con TTL aparte.
+    Loop que mantiene _STACKS_SUMMARY actualizado. La cadencia la pone el
+    scheduler: rápida si alguien mira el summary, lenta si no, y estirada
+    si los ciclos se pasan de presupuesto.
+    El summary se arma desde el registro en memoria (alimentado por eventos),
+    así que en reposo no se le pide nada al daemon. Sólo cada
+    reconcile_interval() se relista cada host, en su propia tarea sobre el
+    executor de docker-io: el loop no espera a ningún host.
+    IMPORTANTE: esto NO recalcula los detalles de todos los stacks: sólo
+    pre-arma los que alguien está mirando (o todos si hay suscriptores al
+    stream); el resto se hace on-demand con TTL, leyendo los stats del collector.
     """
-    global _STACKS_SUMMARY, _LAST_REFRESH_TS
+    global _STACKS_SUMMARY, _STACKS_SUMMARY_ETAG, _STACKS_SUMMARY_BODY, _LAST_REFRESH_TS
+    global _REFRESH_GENERATION
 
     while True:
         start = time.time()
+        interval = summary_interval()
         try:
-            new_summary = _build_stack_summaries()
-            _STACKS_SUMMARY = new_summary
+            started = _schedule_reconciles(start)
+            if started and not _LAST_RECONCILE_TS:
+                # primer seed: se espera al host que conteste primero; el
+                # resto aparece cuando termina su listado
+                await asyncio.wait(started, return_when=asyncio.FIRST_COMPLETED)
+
+            # siempre se rearma (el uptime avanza), pero sin tocar el daemon
+            with timed("loop.summary"):
+                new_summary = _build_stack_summaries(
+                    aggregate_lookup=get_stack_aggregate,
+                    groups=_stack_groups(),
+                )
+            if new_summary != _STACKS_SUMMARY or not _STACKS_SUMMARY_ETAG:
+                _STACKS_SUMMARY = new_summary
+                _STACKS_SUMMARY_ETAG = _etag_for(new_summary)
+                _STACKS_SUMMARY_BODY = {}
             _LAST_REFRESH_TS = time.time()
+            _REFRESH_GENERATION += 1
+
+            if _STREAM_SUBSCRIBERS:
+                with timed("loop.publish"):
+                    await _publish_stream_state()
+            else:
+                _prewarm_details(watched_stacks(start), _LAST_REFRESH_TS)
         except Exception as e:
             # si falla, mantenemos el último snapshot bueno y logeamos
             log.exception("snapshot refresh failed: %s", e)
 
         elapsed = time.time() - start
-        sleep_for = max(0.1, REFRESH_INTERVAL_SEC - elapsed)
-        await asyncio.sleep(sleep_for)
+        record_cycle(elapsed, interval)
+        observe("loop.cycle", elapsed)
+        sleep_for = max(0.1, summary_interval() - elapsed)
+        # alguien que empieza a mirar después de un rato sin interés corta la espera
+        try:
+            await asyncio.wait_for(_refresh_wakeup.wait(), timeout=sleep_for)
+        except asyncio.TimeoutError:
+            pass
+        _refresh_wakeup.clear()
 
 
 async def start_snapshot_loop():
     """
     Llamado en startup de FastAPI. Lanza el refresco continuo del summary.
     """
-    global _background_task
+    global _background_task, _refresh_wakeup
     if _background_task is None:
+        _refresh_wakeup = asyncio.Event()
+        set_wakeup(_refresh_wakeup, asyncio.get_running_loop())
         _background_task = asyncio.create_task(_refresh_loop())
 
 
+# --------------------------------------------------------------------
+# Stream (/api/v2/stream): generaciones + aviso a suscriptores
+# --------------------------------------------------------------------
+
+def _get_stream_changed() -> asyncio.Condition:
+    global _stream_changed
+    if _stream_changed is None:
+        _stream_changed = asyncio.Condition()
+    return _stream_changed
+
+
+async def _publish_stream_state():
+    """
+    Arma el estado completo (summaries + detalle de todos los contenedores)
+    desde memoria y, si cambió, abre una generación nueva y despierta a los
+    suscriptores. Cada suscriptor calcula su propio delta.
+    """
+    global _STREAM_STATE, _STREAM_GENERATION
+
+    details = _build_stack_details(
+        None,
+        stats_lookup=get_latest_stats,
+        groups=_stack_groups(),
+    )
+    now = time.time()
+    containers: Dict[str, Dict] = {}
+    for detail in details:
+        _store_detail(detail, now)
+        for c in detail["containers"]:
+            containers[c["id"]] = {**c, "stack_id": detail["stack_id"]}
+
+    state = {
+        "stacks": {st["stack_id"]: st for st in _STACKS_SUMMARY},
+        "containers": containers,
+    }
+    if state == _STREAM_STATE:
+        return
+
+    cond = _get_stream_changed()
+    async with cond:
+        _STREAM_STATE = state
+        _STREAM_GENERATION += 1
+        cond.notify_all()
+
+
+async def subscribe_stream():
+    """
+    Registra un suscriptor. El primero fuerza a publicar el estado ya,
+    porque sin suscriptores no se mantiene.
+    """
+    global _STREAM_SUBSCRIBERS
+    _STREAM_SUBSCRIBERS += 1
+    set_stream_watchers(_STREAM_SUBSCRIBERS)
+    if _STREAM_SUBSCRIBERS == 1:
+        await _publish_stream_state()
+
+
+def unsubscribe_stream():
+    global _STREAM_SUBSCRIBERS
+    _STREAM_SUBSCRIBERS = max(0, _STREAM_SUBSCRIBERS - 1)
+    set_stream_watchers(_STREAM_SUBSCRIBERS)
+
+
+def get_stream_state():
+    """
+    (generación, estado) actuales. El estado no se muta nunca en el lugar:
+    cada generación es un dict nuevo, así que se puede guardar como "lo último enviado".
+    """
+    return _STREAM_GENERATION, _STREAM_STATE
+
+
+async def wait_for_stream_generation(after: int) -> int:
+    """
+    Espera a que exista una generación posterior a `after` y la devuelve.
+    Si el cliente tardó y se perdió varias, sólo ve la última (coalescing).
+    """
+    cond = _get_stream_changed()
+    async with cond:
+        await cond.wait_for(lambda: _STREAM_GENERATION > after)
+        return _STREAM_GENERATION
+
+
 # --------------------------------------------------------------------
 # Lectura del summary (lista de stacks)
 # --------------------------------------------------------------------
@@ -76,47 +677,193 @@ async def start_snapshot_loop():
 def get_summary_snapshot() -> List[Dict]:
     """
     Devuelve el snapshot más reciente del summary global.
-    Este summary NO tiene CPU/RAM en vivo (va con "N/A"), por diseño.
+    Incluye CPU/RAM por stack: agregados que el collector de stats mantiene
+    incrementalmente a medida que llegan los samples.
     """
     return _STACKS_SUMMARY
 
 
+def get_refresh_generation() -> int:
+    """
+    Número de ciclo del loop de refresco (0 = todavía no corrió).
+    """
+    return _REFRESH_GENERATION
+
+
+def get_summary_etag() -> str:
+    """
+    ETag de la generación actual del summary (cambia sólo si cambia el contenido).
+    Cada request del summary pasa por acá: cuenta como interés.
+    """
+    note_summary_interest()
+    return _STACKS_SUMMARY_ETAG
+
+
+def get_summary_body(encoding: str = "identity") -> bytes:
+    """
+    Body de /api/v2/stacks ya validado y serializado (y comprimido si se pide).
+    """
+    return _encoded_body(
+        _STACKS_SUMMARY_BODY,
+        StackListResponse,
+        {"stacks": _STACKS_SUMMARY},
+        encoding,
+    )
+
+
 # --------------------------------------------------------------------
 # Lectura del detalle de un stack (CPU/RAM vivas)
 # --------------------------------------------------------------------
 
-def get_detail_snapshot(stack_id: str) -> Optional[Dict]:
+def _store_detail(detail: Dict, now: float) -> bool:
     """
-    Devuelve detalle de un stack (incluye CPU%, RAM usada, etc.).
-    Comportamiento:
-      1. Si lo tenemos cacheado y no venció el TTL, lo devolvemos.
-      2. Si no está o está vencido, lo volvemos a construir con _build_stack_detail()
-         (que ya está optimizado: stats() paralelo solo para contenedores running),
-         guardamos cache y timestamp nuevo, y devolvemos eso.
+    Guarda el detalle en cache. El ETag se recalcula sólo si el contenido
+    cambió respecto de lo cacheado. False (y no guarda nada) si el stack ya
+    no está en el registro: se vació mientras se armaba.
+    """
+    stack_id = detail["stack_id"]
+    changed = _STACKS_DETAIL.get(stack_id) != detail or stack_id not in _STACKS_DETAIL_ETAG
+    etag = _etag_for(detail) if changed else None
+    with _CONTAINERS_LOCK:
+        if _LAST_RECONCILE_TS and stack_id not in _STACK_INDEX:
+            return False
+        if changed:
+            _STACKS_DETAIL[stack_id] = detail
+            _STACKS_DETAIL_ETAG[stack_id] = etag
+            _STACKS_DETAIL_BODY[stack_id] = {}
+        _STACKS_DETAIL_TS[stack_id] = now
+    return True
 
-    Esto permite que el frontend haga polling (por ejemplo cada 2-3s),
-    y reciba números "frescos" de CPU/RAM sin recalcular todo el host
-    en cada request.
+
+def get_detail_variant(stack_id: str, encoding: str = "identity") -> Optional[Tuple[str, bytes]]:
+    """
+    (ETag, body ya serializado) del detalle cacheado, de la MISMA generación:
+    se leen juntos bajo el lock, así un refresh o un stack que se vacía entre
+    medio no dejan un ETag de una versión con el body de otra (o sin body).
+    None si el stack ya no está en cache.
     """
-    global _STACKS_DETAIL, _STACKS_DETAIL_TS
+    with _CONTAINERS_LOCK:
+        detail = _STACKS_DETAIL.get(stack_id)
+        etag = _STACKS_DETAIL_ETAG.get(stack_id)
+        if detail is None or etag is None:
+            return None
+        cache = _STACKS_DETAIL_BODY.setdefault(stack_id, {})
+    # el dict de bodies es por generación (_store_detail pone uno nuevo):
+    # se puede llenar fuera del lock
+    return etag, _encoded_body(cache, StackDetailResponse, detail, encoding)
 
-    now = time.time()
-    ts = _STACKS_DETAIL_TS.get(stack_id, 0)
 
-    still_valid = (now - ts) < DETAIL_TTL_SEC
-    if stack_id in _STACKS_DETAIL and still_valid:
-        return _STACKS_DETAIL[stack_id]
+def get_detail_body(stack_id: str, encoding: str = "identity") -> Optional[bytes]:
+    """
+    Body de /api/v2/stacks/{stack_id} ya serializado, para el detalle cacheado.
+    """
+    variant = get_detail_variant(stack_id, encoding)
+    return variant[1] if variant is not None else None
+
 
-    # TTL vencido o nunca calculado: construir de nuevo
+async def _build_detail(stack_id: str) -> Optional[Dict]:
+    """
+    Un build de detalle (el único en curso para ese stack). Los contenedores
+    salen del registro en memoria y los stats del collector de streams, así
+    que no se espera al daemon. Antes del primer seed se cae al build
+    clásico (listado + stats() en paralelo) en el executor de docker-io.
+    """
+    start = time.time()
+    count("cache.detail.build")
     try:
-        detail = _build_stack_detail(stack_id)
+        if _LAST_RECONCILE_TS:
+            detail = _build_stack_detail(
+                stack_id,
+                get_stack_containers(stack_id),
+                stats_lookup=get_latest_stats,
+            )
+        else:
+            detail = await run_docker_io(_build_stack_detail, stack_id)
     except Exception:
         detail = None
 
-    if detail is None:
-        # stack inexistente -> no cacheamos nada nuevo
+    if detail is None or not _store_detail(detail, start):
+        # stack inexistente (o vaciado durante el build) -> no cacheamos nada nuevo
         return None
 
-    _STACKS_DETAIL[stack_id] = detail
-    _STACKS_DETAIL_TS[stack_id] = now
+    if _STACKS_DETAIL_INVALIDATED.get(stack_id, 0) >= start:
+        # hubo una acción mientras armábamos: se sirve, pero no queda fresco
+        _STACKS_DETAIL_TS.pop(stack_id, None)
     return detail
+
+
+def _detail_build_task(stack_id: str) -> asyncio.Task:
+    task = _DETAIL_INFLIGHT.get(stack_id)
+    if task is None:
+        task = asyncio.create_task(_build_detail(stack_id))
+        _DETAIL_INFLIGHT[stack_id] = task
+        task.add_done_callback(lambda _t: _DETAIL_INFLIGHT.pop(stack_id, None))
+    return task
+
+
+async def get_detail_snapshot(stack_id: str) -> Optional[Dict]:
+    """
+    Devuelve detalle de un stack (incluye CPU%, RAM usada, etc.).
+    Comportamiento:
+      1. Si lo tenemos cacheado y no venció el TTL (detail_ttl() del
+         scheduler), lo devolvemos. Mientras alguien lo mire, el loop de
+         refresco lo pre-arma en cada ciclo, así que lo normal es caer acá.
+      2. Si está vencido (hace menos de DETAIL_MAX_STALE_SEC), devolvemos el
+         anterior YA y se rearma en background (stale-while-revalidate).
+      3. Si no está, está muy viejo o se invalidó por una acción, esperamos
+         el build.
+    En 2 y 3 hay a lo sumo un build por stack en curso (single-flight): N
+    requests concurrentes del mismo stack comparten un solo listado + stats.
+
+    Esto permite que el frontend haga polling (por ejemplo cada 2-3s),
+    y reciba números "frescos" de CPU/RAM sin recalcular todo el host
+    en cada request.
+
+    None (-> 404) para un stack que no está en el registro, aunque quede
+    un detalle viejo en cache.
+    """
+    if _LAST_RECONCILE_TS and stack_id not in _STACK_INDEX:
+        return None
+    note_stack_interest((stack_id,))
+    now = time.time()
+    cached = _STACKS_DETAIL.get(stack_id)
+    age = now - _STACKS_DETAIL_TS.get(stack_id, 0)
+    ttl = detail_ttl()
+
+    if cached is not None and age < ttl:
+        count("cache.detail.fresh")
+        return cached
+
+    task = _detail_build_task(stack_id)
+    if cached is not None and age < max(ttl, DETAIL_MAX_STALE_SEC):
+        count("cache.detail.stale")
+        return cached
+
+    count("cache.detail.miss")
+    # shield: si este request se cancela, el build sigue para los demás
+    return await asyncio.shield(task)
+
+
+async def get_details_snapshot(stack_ids: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Detalle de varios stacks (todos si stack_ids es None) en una sola pasada:
+    un recorrido del registro y una lectura de stats para todos, en vez de
+    un get_detail_snapshot() por stack. Refresca también el cache por stack.
+    """
+    if stack_ids is None:
+        note_summary_interest()
+    now = time.time()
+
+    if _LAST_RECONCILE_TS:
+        details = _build_stack_details(
+            stack_ids,
+            stats_lookup=get_latest_stats,
+            groups=_stack_groups(stack_ids),
+        )
+    else:
+        details = await run_docker_io(_build_stack_details, stack_ids)
+
+    for detail in details:
+        _store_detail(detail, now)
+    note_stack_interest(d["stack_id"] for d in details)
+    return details
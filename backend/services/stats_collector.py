@@ -0,0 +1,329 @@
+import threading
+import logging
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from docker.utils.json_stream import json_stream
+
+from services.cgroup_stats import (
+    CGROUP_STATS_ENABLED,
+    CGROUP_SWEEP_SEC,
+    find_cgroup_dir,
+    read_sample,
+)
+from services.docker_service_v3 import _stack_name_for_container
+from services.metrics import ContainerMetrics, metrics_from_stats
+from services.perf import count
+from services.timeseries import record_sample
+
+log = logging.getLogger(__name__)
+
+# --------------------------------------------------------------------
+# Live stats: un stream persistente stats(stream=True) por contenedor running
+# --------------------------------------------------------------------
+#
+# El daemon empuja un sample por segundo en cada stream, así que leer stats
+# pasa a ser un lookup en memoria en vez de un stats(stream=False) que
+# bloquea ~1s esperando dos muestras.
+#
+# Los streams se arrancan/paran desde el snapshot (eventos de ciclo de vida
+# + reconcile). Cuando el contenedor muere el daemon cierra el stream solo;
+# stop_stream() además marca el flag para que el thread salga en el próximo
+# sample y no pise datos de un stream nuevo.
+#
+# Con CGROUP_STATS_ENABLED, los contenedores cuyo cgroup v2 se encuentra no
+# abren stream: un único thread los barre cada CGROUP_SWEEP_SEC leyendo los
+# archivos del cgroup (services.cgroup_stats). Si la lectura falla, ese
+# contenedor vuelve al stream de Docker.
+#
+# Un stream que se corta sin que nadie lo pare (error de red, dockerd que
+# se reinicia) mientras el contenedor sigue running se reabre, con backoff
+# exponencial entre STREAM_RETRY_MIN_SEC y STREAM_RETRY_MAX_SEC.
+
+STREAM_RETRY_MIN_SEC = 1.0
+STREAM_RETRY_MAX_SEC = 30.0
+
+# container_id -> métricas numéricas del último sample
+_LATEST: Dict[str, ContainerMetrics] = {}
+
+# container_id -> flag de stop del thread dueño del stream
+_STREAMS: Dict[str, threading.Event] = {}
+
+# container_id -> {"container", "dir", "pid", "prev", "stop"} de los que se
+# leen por cgroup (su "stream" en _STREAMS no tiene thread propio)
+_CGROUP: Dict[str, Dict] = {}
+_sweeper: Optional[threading.Thread] = None
+
+# container_id -> stack_id (para imputar cada sample a su stack)
+_STACK_OF: Dict[str, str] = {}
+
+# Agregados por stack, mantenidos incrementalmente: cada sample resta el
+# aporte anterior del contenedor y suma el nuevo, así leer el agregado de un
+# stack es O(1) y no hay que recorrer todos sus contenedores.
+# container_id -> (stack_id, cpu | None, mem_used | None, mem_limit | None)
+_CONTRIB: Dict[str, Tuple[str, Optional[float], Optional[int], Optional[int]]] = {}
+# stack_id -> {"cpu_sum", "cpu_n", "mem_used", "mem_limits": {limit: count}}
+_STACK_AGG: Dict[str, Dict] = {}
+
+_LOCK = threading.Lock()
+
+
+def _counted_chunks(chunks):
+    for chunk in chunks:
+        count("docker.stats.stream_bytes", len(chunk))
+        yield chunk
+
+
+def _still_running(container) -> bool:
+    """
+    Inspect directo (sin recargar el objeto del registro): ¿sigue running?
+    """
+    try:
+        attrs = container.client.api.inspect_container(container.id)
+    except Exception:
+        return False
+    return attrs.get("State", {}).get("Running", False)
+
+
+def _stream_worker(container, stop: threading.Event):
+    """
+    Consume container.stats(stream=True) hasta que el stream termine
+    (contenedor parado/borrado) o se pida stop. El JSON se decodifica acá
+    (json_stream, lo mismo que decode=True) para contar los bytes leídos.
+    Si termina por otra cosa y el contenedor sigue running, se reabre.
+    """
+    cid = container.id
+    backoff = STREAM_RETRY_MIN_SEC
+    try:
+        while True:
+            got_sample = False
+            try:
+                for sample in json_stream(_counted_chunks(container.stats(stream=True, decode=False))):
+                    if stop.is_set():
+                        break
+                    if not _store_sample(cid, stop, metrics_from_stats(sample)):
+                        break
+                    got_sample = True
+            except Exception as e:
+                log.debug("stats stream for %s ended: %s", cid[:12], e)
+
+            if stop.is_set() or _STREAMS.get(cid) is not stop or not _still_running(container):
+                break
+            if got_sample:
+                backoff = STREAM_RETRY_MIN_SEC
+            count("docker.stats.stream_retry")
+            if stop.wait(backoff):
+                break
+            backoff = min(backoff * 2, STREAM_RETRY_MAX_SEC)
+    finally:
+        with _LOCK:
+            # sólo limpiamos si seguimos siendo el stream vigente; el stack
+            # se vuelve a anotar (sync_container) si el contenedor revive
+            if _STREAMS.get(cid) is stop:
+                _STREAMS.pop(cid, None)
+                _LATEST.pop(cid, None)
+                _STACK_OF.pop(cid, None)
+                _set_contribution(cid, None)
+
+
+def _store_sample(cid: str, stop: threading.Event, m: ContainerMetrics) -> bool:
+    """
+    Guarda un sample (venga del stream o del cgroup). False si quien lo
+    trae ya no es el dueño vigente del contenedor.
+    """
+    with _LOCK:
+        if _STREAMS.get(cid) is not stop:
+            return False
+        _LATEST[cid] = m
+        _set_contribution(cid, (_STACK_OF.get(cid, ""), m.cpu, m.mem_used, m.mem_limit))
+    record_sample(cid, m)
+    return True
+
+
+def _start_docker_stream(container, stop: threading.Event):
+    threading.Thread(
+        target=_stream_worker,
+        args=(container, stop),
+        name=f"stats-{container.id[:12]}",
+        daemon=True,
+    ).start()
+
+
+# --------------------------------------------------------------------
+# Lectura por cgroup v2 (un thread para todos)
+# --------------------------------------------------------------------
+
+def _cgroup_sweeper():
+    while True:
+        with _LOCK:
+            tracked = list(_CGROUP.items())
+        for cid, entry in tracked:
+            try:
+                m, entry["prev"] = read_sample(entry["dir"], entry["pid"], entry["prev"])
+            except (OSError, ValueError) as e:
+                # sin archivos (o ilegibles): este contenedor vuelve al stream de Docker
+                with _LOCK:
+                    current = _CGROUP.get(cid) is entry and _STREAMS.get(cid) is entry["stop"]
+                    if current:
+                        del _CGROUP[cid]
+                if current:
+                    log.debug("cgroup stats for %s unavailable (%s): using docker stream", cid[:12], e)
+                    _start_docker_stream(entry["container"], entry["stop"])
+                continue
+            _store_sample(cid, entry["stop"], m)
+        time.sleep(CGROUP_SWEEP_SEC)
+
+
+def _track_cgroup(container, stop: threading.Event) -> bool:
+    """
+    Pasa el contenedor al sweeper de cgroup si se encuentra su cgroup v2.
+    """
+    global _sweeper
+    cgroup_dir = find_cgroup_dir(container.id)
+    if cgroup_dir is None:
+        return False
+    with _LOCK:
+        _CGROUP[container.id] = {
+            "container": container,
+            "dir": cgroup_dir,
+            "pid": container.attrs.get("State", {}).get("Pid") or 0,
+            "prev": None,
+            "stop": stop,
+        }
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_cgroup_sweeper, name="cgroup-stats", daemon=True)
+            _sweeper.start()
+    return True
+
+
+# --------------------------------------------------------------------
+# Agregados incrementales por stack (siempre con _LOCK tomado)
+# --------------------------------------------------------------------
+
+def _agg_apply(contrib, sign: int):
+    stack_id, cpu, used_b, limit_b = contrib
+    agg = _STACK_AGG.setdefault(
+        stack_id,
+        {"cpu_sum": 0.0, "cpu_n": 0, "mem_used": 0, "mem_limits": {}},
+    )
+    if cpu is not None:
+        agg["cpu_sum"] += sign * cpu
+        agg["cpu_n"] += sign
+    if used_b is not None:
+        agg["mem_used"] += sign * used_b
+    if limit_b is not None:
+        limits = agg["mem_limits"]
+        limits[limit_b] = limits.get(limit_b, 0) + sign
+        if limits[limit_b] <= 0:
+            del limits[limit_b]
+    if agg["cpu_n"] <= 0 and not agg["mem_limits"] and agg["mem_used"] <= 0:
+        del _STACK_AGG[stack_id]
+
+
+def _set_contribution(container_id: str, contrib):
+    old = _CONTRIB.pop(container_id, None)
+    if old is not None:
+        _agg_apply(old, -1)
+    if contrib is not None:
+        _CONTRIB[container_id] = contrib
+        _agg_apply(contrib, +1)
+
+
+def _set_stack(container_id: str, stack_id: str):
+    with _LOCK:
+        if _STACK_OF.get(container_id) == stack_id:
+            return
+        _STACK_OF[container_id] = stack_id
+        old = _CONTRIB.get(container_id)
+        if old is not None:
+            # cambió de stack: mover su aporte
+            _set_contribution(container_id, (stack_id,) + old[1:])
+
+
+def start_stream(container):
+    """
+    Abre el stream de stats de un contenedor si todavía no hay uno (o lo
+    anota en el sweeper de cgroup, si está habilitado y se encuentra).
+    """
+    cid = container.id
+    with _LOCK:
+        if cid in _STREAMS:
+            return
+        stop = threading.Event()
+        _STREAMS[cid] = stop
+
+    if CGROUP_STATS_ENABLED and _track_cgroup(container, stop):
+        return
+    _start_docker_stream(container, stop)
+
+
+def stop_stream(container_id: str):
+    """
+    Suelta el stream de un contenedor (stop/die/destroy) y su último sample.
+    """
+    with _LOCK:
+        stop = _STREAMS.pop(container_id, None)
+        _CGROUP.pop(container_id, None)
+        _LATEST.pop(container_id, None)
+        _STACK_OF.pop(container_id, None)
+        _set_contribution(container_id, None)
+    if stop is not None:
+        stop.set()
+
+
+def sync_container(container):
+    """
+    Stream abierto si está running (healthy o no), cerrado si no.
+    También actualiza a qué stack se imputan sus samples (rename/relabel).
+    """
+    if container.attrs.get("State", {}).get("Running", False):
+        _set_stack(container.id, _stack_name_for_container(container))
+        start_stream(container)
+    else:
+        stop_stream(container.id)
+
+
+def sync_streams(containers: Iterable):
+    """
+    Alinea los streams con el listado completo (seed / reconcile):
+    abre los que faltan y cierra los de contenedores que ya no existen.
+    """
+    known = set()
+    for c in containers:
+        known.add(c.id)
+        sync_container(c)
+
+    with _LOCK:
+        gone = [cid for cid in _STREAMS if cid not in known]
+    for cid in gone:
+        stop_stream(cid)
+
+
+def get_latest_stats(container_id: str) -> Optional[ContainerMetrics]:
+    """
+    Último sample conocido de un contenedor, o None si todavía no llegó
+    ninguno (o no está running).
+    """
+    return _LATEST.get(container_id)
+
+
+def get_stack_aggregate(stack_id: str) -> Tuple[Optional[float], int, int]:
+    """
+    (cpu promedio como fracción de core | None, RAM usada, RAM host) de un
+    stack según los últimos samples. Es una lectura O(1).
+    """
+    with _LOCK:
+        agg = _STACK_AGG.get(stack_id)
+        if agg is None:
+            return (None, 0, 0)
+        cpu_avg = agg["cpu_sum"] / agg["cpu_n"] if agg["cpu_n"] else None
+        return (cpu_avg, agg["mem_used"], max(agg["mem_limits"], default=0))
+
+
+def get_collector_stats() -> Dict[str, int]:
+    """
+    Cuántos contenedores se leen por stream de Docker y cuántos por cgroup.
+    """
+    with _LOCK:
+        cgroup = len(_CGROUP)
+        return {"docker_streams": len(_STREAMS) - cgroup, "cgroup": cgroup}
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from typing import Dict, List
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from services.snapshot import (
+    get_stream_state,
+    subscribe_stream,
+    unsubscribe_stream,
+    wait_for_stream_generation,
+)
+
+log = logging.getLogger(__name__)
+
+
+# --------------------------------------------------------------------
+# Deltas por cliente
+# --------------------------------------------------------------------
+
+def _diff_section(old: Dict[str, Dict], new: Dict[str, Dict]) -> Dict[str, List]:
+    """
+    {"changed": [items nuevos o modificados], "removed": [ids que ya no están]}
+    """
+    changed = [item for key, item in new.items() if old.get(key) != item]
+    removed = [key for key in old if key not in new]
+    return {"changed": changed, "removed": removed}
+
+
+def build_delta(old_state: Dict, new_state: Dict, generation: int) -> Dict:
+    """
+    Mensaje delta entre lo último que recibió un cliente y el estado actual.
+    """
+    return {
+        "type": "delta",
+        "generation": generation,
+        "stacks": _diff_section(old_state["stacks"], new_state["stacks"]),
+        "containers": _diff_section(old_state["containers"], new_state["containers"]),
+    }
+
+
+def _delta_is_empty(delta: Dict) -> bool:
+    return not any(
+        delta[section]["changed"] or delta[section]["removed"]
+        for section in ("stacks", "containers")
+    )
+
+
+async def _wait_disconnect(websocket: WebSocket):
+    """
+    El cliente no manda nada útil; leemos sólo para enterarnos del cierre.
+    """
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        return
+
+
+async def serve_stream(websocket: WebSocket):
+    """
+    Manda un snapshot completo y después sólo deltas cuando cambia la
+    generación. No hay cola por cliente: si el cliente es lento, al
+    terminar de enviar se compara contra la generación más reciente y las
+    intermedias se pierden (coalescing), así la memoria no crece.
+    """
+    await subscribe_stream()
+    disconnect = asyncio.create_task(_wait_disconnect(websocket))
+    try:
+        generation, sent_state = get_stream_state()
+        await websocket.send_json({
+            "type": "snapshot",
+            "generation": generation,
+            "stacks": list(sent_state["stacks"].values()),
+            "containers": list(sent_state["containers"].values()),
+        })
+
+        while True:
+            waiter = asyncio.create_task(wait_for_stream_generation(generation))
+            done, _ = await asyncio.wait(
+                {waiter, disconnect},
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnect in done:
+                waiter.cancel()
+                return
+
+            generation, state = get_stream_state()
+            delta = build_delta(sent_state, state, generation)
+            if not _delta_is_empty(delta):
+                await websocket.send_json(delta)
+            sent_state = state
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        log.warning("stack stream closed: %s", e)
+    finally:
+        disconnect.cancel()
+        unsubscribe_stream()
@@ -0,0 +1,231 @@
+import math
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from services.metrics import ContainerMetrics
+
+# --------------------------------------------------------------------
+# Historial en memoria de CPU/RAM/red por contenedor
+# --------------------------------------------------------------------
+#
+# Cada contenedor tiene un ring buffer de tamaño fijo por resolución
+# (float32, arrays planos: ~50KB por contenedor con la config de abajo,
+# ~25MB para 500 contenedores, sin importar cuánto tiempo corra).
+# Cada sample se acumula en el bucket actual de TODAS las resoluciones
+# (promedio corrido), así el downsampling es automático y append es O(1).
+
+# (segundos por bucket, cantidad de buckets)
+RESOLUTIONS: List[Tuple[int, int]] = [
+    (2, 450),       # 2s  x 15 min
+    (30, 720),      # 30s x 6 h
+    (300, 2016),    # 5m  x 7 d
+]
+
+FIELDS = ("cpu_percent", "mem_used_bytes", "net_rx_rate", "net_tx_rate")
+
+_NAN = float("nan")
+
+
+class _Ring:
+    """
+    Un ring de buckets de `step` segundos. El bucket absoluto b vive en el
+    slot b % size; `head` es el bucket más nuevo escrito.
+    """
+
+    __slots__ = ("step", "size", "head", "first", "values", "_acc", "_count")
+
+    def __init__(self, step: int, size: int):
+        self.step = step
+        self.size = size
+        self.head = -1
+        self.first = -1     # primer bucket escrito (para no devolver ring vacío)
+        self.values = {f: array("f", [_NAN]) * size for f in FIELDS}
+        self._acc = dict.fromkeys(FIELDS, 0.0)
+        self._count = dict.fromkeys(FIELDS, 0)
+
+    def add(self, ts: float, sample: Dict[str, Optional[float]]):
+        bucket = int(ts // self.step)
+        if bucket < self.head:
+            return  # sample viejo fuera de orden: se descarta
+
+        if bucket > self.head:
+            # limpiar los buckets salteados (gap) y arrancar uno nuevo
+            first = max(self.head + 1, bucket - self.size + 1)
+            for b in range(first, bucket + 1):
+                slot = b % self.size
+                for f in FIELDS:
+                    self.values[f][slot] = _NAN
+            self.head = bucket
+            if self.first < 0:
+                self.first = bucket
+            for f in FIELDS:
+                self._acc[f] = 0.0
+                self._count[f] = 0
+
+        slot = bucket % self.size
+        for f in FIELDS:
+            v = sample.get(f)
+            if v is None:
+                continue
+            self._acc[f] += v
+            self._count[f] += 1
+            self.values[f][slot] = self._acc[f] / self._count[f]
+
+    def read(self, since_bucket: int) -> Tuple[List[int], Dict[str, List[Optional[float]]]]:
+        """
+        Buckets desde `since_bucket` hasta head (los que siguen en el ring).
+        """
+        if self.head < 0:
+            return [], {f: [] for f in FIELDS}
+        first = max(since_bucket, self.first, self.head - self.size + 1)
+        buckets = list(range(first, self.head + 1))
+        cols: Dict[str, List[Optional[float]]] = {}
+        for f in FIELDS:
+            arr = self.values[f]
+            col: List[Optional[float]] = []
+            for b in buckets:
+                v = arr[b % self.size]
+                col.append(None if math.isnan(v) else float(v))
+            cols[f] = col
+        return buckets, cols
+
+
+class _ContainerSeries:
+    __slots__ = ("rings", "last_net")
+
+    def __init__(self):
+        self.rings = [_Ring(step, size) for step, size in RESOLUTIONS]
+        # (ts, rx, tx) del sample anterior, para pasar contadores a bytes/s
+        self.last_net: Optional[Tuple[float, int, int]] = None
+
+
+# container_id (completo) -> series
+_SERIES: Dict[str, _ContainerSeries] = {}
+# Ids ya borrados (set ordenado, los más viejos se olvidan): un sample que
+# llega tarde de un stream que todavía no salió no vuelve a crear la serie.
+_DROPPED: Dict[str, None] = {}
+_DROPPED_MAX = 10000
+_LOCK = threading.Lock()
+
+
+def _forget(container_id: str):
+    """
+    Borra la serie y deja la marca de borrado (con _LOCK tomado).
+    """
+    _SERIES.pop(container_id, None)
+    _DROPPED[container_id] = None
+    if len(_DROPPED) > _DROPPED_MAX:
+        del _DROPPED[next(iter(_DROPPED))]
+
+
+def record_sample(container_id: str, m: ContainerMetrics):
+    """
+    Agrega un sample al historial del contenedor. O(cantidad de resoluciones).
+    """
+    series = _SERIES.get(container_id)
+    if series is None:
+        with _LOCK:
+            if container_id in _DROPPED:
+                return
+            series = _SERIES.setdefault(container_id, _ContainerSeries())
+
+    rx_rate = tx_rate = None
+    if m.net_rx is not None and m.net_tx is not None:
+        prev = series.last_net
+        if prev is not None and m.ts > prev[0]:
+            dt = m.ts - prev[0]
+            # un contador que baja = contenedor reiniciado: no hay tasa
+            if m.net_rx >= prev[1] and m.net_tx >= prev[2]:
+                rx_rate = (m.net_rx - prev[1]) / dt
+                tx_rate = (m.net_tx - prev[2]) / dt
+        series.last_net = (m.ts, m.net_rx, m.net_tx)
+
+    sample = {
+        "cpu_percent": m.cpu_percent,
+        "mem_used_bytes": m.mem_used,
+        "net_rx_rate": rx_rate,
+        "net_tx_rate": tx_rate,
+    }
+    for ring in series.rings:
+        ring.add(m.ts, sample)
+
+
+def drop_series(container_id: str):
+    """
+    Borra el historial de un contenedor que ya no existe (destroy).
+    """
+    with _LOCK:
+        _forget(container_id)
+
+
+def retain_series(container_ids):
+    """
+    Deja sólo el historial de los contenedores indicados (reconcile).
+    """
+    keep = set(container_ids)
+    with _LOCK:
+        for cid in [cid for cid in _SERIES if cid not in keep]:
+            _forget(cid)
+
+
+def resolve_series_id(container_ref: str) -> Optional[str]:
+    """
+    Id completo a partir de un id corto (el que muestra la API).
+    """
+    if container_ref in _SERIES:
+        return container_ref
+    with _LOCK:
+        for cid in _SERIES:
+            if cid.startswith(container_ref):
+                return cid
+    return None
+
+
+def query_series(container_id: str, range_sec: int, step_sec: int, now: float) -> Optional[Dict]:
+    """
+    Historial de los últimos `range_sec` segundos con puntos cada `step_sec`.
+    Usa la resolución más fina que cubre el rango; si el step pedido es más
+    grueso, promedia buckets. Devuelve columnas ({"ts": [...], "cpu_percent": [...]}).
+    """
+    series = _SERIES.get(container_id)
+    if series is None:
+        return None
+
+    # la resolución más fina que cubre el rango (o la más larga si ninguna)
+    ring = series.rings[-1]
+    for r in series.rings:
+        if r.step * r.size >= range_sec:
+            ring = r
+            break
+
+    # step efectivo: múltiplo del step del ring, nunca más fino que él
+    group = max(1, step_sec // ring.step)
+    step = group * ring.step
+
+    since_bucket = int((now - range_sec) // ring.step) + 1
+    buckets, cols = ring.read(since_bucket)
+
+    out: Dict[str, List] = {"ts": []}
+    for f in FIELDS:
+        out[f] = []
+
+    # agrupar de a `group` buckets alineados a `step`
+    i = 0
+    while i < len(buckets):
+        start_b = buckets[i] - (buckets[i] % group)
+        j = i
+        while j < len(buckets) and buckets[j] < start_b + group:
+            j += 1
+        out["ts"].append(start_b * ring.step)
+        for f in FIELDS:
+            vals = [v for v in cols[f][i:j] if v is not None]
+            out[f].append(sum(vals) / len(vals) if vals else None)
+        i = j
+
+    return {
+        "container_id": container_id,
+        "range": range_sec,
+        "step": step,
+        **out,
+    }
@@ -0,0 +1,71 @@
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from bench.fake_engine import FakeEngine  # noqa: E402
+
+# --------------------------------------------------------------------
+# Daemons fake para toda la sesión
+# --------------------------------------------------------------------
+#
+# services.docker_client arma sus clientes al importarse, así que los fakes
+# tienen que estar escuchando y DOCKER_HOSTS apuntándolos ANTES del primer
+# import de services.* (por eso esto corre al cargar el conftest, no en un
+# fixture). Tres hosts: "a" (200 contenedores) y "b" con stacks homónimos
+# (stack0..2) y "down", un socket que no existe.
+
+ENGINES = {
+    "a": FakeEngine(n_containers=200, n_stacks=3).start(),
+    "b": FakeEngine(n_containers=8, n_stacks=3).start(),
+}
+DOWN_SOCKET = os.path.join(os.path.dirname(ENGINES["a"].socket_path), "down.sock")
+
+os.environ["DOCKER_HOSTS"] = ",".join(
+    [f"{name}={engine.url}" for name, engine in ENGINES.items()] + [f"down=unix://{DOWN_SOCKET}"]
+)
+os.environ["DOCKER_TIMEOUT_SEC"] = "5"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("ADMIN_USER", "admin")
+os.environ.setdefault("ADMIN_PASSWORD", "admin")
+os.environ["LOG_INDEX_SPILL_DIR"] = ""
+
+
+@pytest.fixture(scope="session")
+def engines():
+    return ENGINES
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """
+    Registro y caches de detalle de services.snapshot vacíos y propios del
+    test, marcado como sembrado.
+    """
+    from services import snapshot
+
+    for name in (
+        "_CONTAINERS", "_STACK_INDEX", "_CONTAINER_STACK",
+        "_STACKS_DETAIL", "_STACKS_DETAIL_TS", "_STACKS_DETAIL_ETAG",
+        "_STACKS_DETAIL_BODY", "_STACKS_DETAIL_INVALIDATED",
+    ):
+        monkeypatch.setattr(snapshot, name, {})
+    monkeypatch.setattr(snapshot, "_LAST_RECONCILE_TS", 1.0)
+    return snapshot
+
+
+@pytest.fixture
+def collector(monkeypatch):
+    """
+    Estado del collector de stats vacío y propio del test: los streams que
+    quedaron de otros tests dejan de ser "vigentes" y salen solos.
+    """
+    from services import stats_collector
+
+    for name in ("_LATEST", "_STREAMS", "_CGROUP", "_STACK_OF", "_CONTRIB", "_STACK_AGG"):
+        monkeypatch.setattr(stats_collector, name, {})
+    return stats_collector
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services import actions
+
+
+class _FakeContainer(SimpleNamespace):
+    """
+    Lo que plan_levels / _run_one usan de un Container de docker-py, con una
+    acción que tarda y cuenta cuántas corren a la vez.
+    """
+
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def __init__(self, service, depends_on="", project="app", delay=0.0):
+        labels = {
+            "com.docker.compose.project": project,
+            "com.docker.compose.service": service,
+        }
+        if depends_on:
+            labels["com.docker.compose.depends_on"] = depends_on
+        super().__init__(
+            id=f"{project}-{service}", short_id=service, name=service,
+            attrs={"Config": {"Labels": labels}}, delay=delay,
+        )
+
+    def stop(self):
+        cls = type(self)
+        with cls.lock:
+            cls.running += 1
+            cls.peak = max(cls.peak, cls.running)
+        time.sleep(self.delay)
+        with cls.lock:
+            cls.running -= 1
+
+
+def _names(levels):
+    return [sorted(c.name for c in level) for level in levels]
+
+
+def test_depends_on_orders_start_and_reverses_stop():
+    db = _FakeContainer("db")
+    cache = _FakeContainer("cache")
+    api = _FakeContainer("api", "db:service_healthy:false,cache:service_started:false")
+    web = _FakeContainer("web", "api:service_started:false")
+    containers = [web, api, cache, db]
+
+    assert _names(actions.plan_levels(containers, "start", ordered=True)) == [
+        ["cache", "db"], ["api"], ["web"],
+    ]
+    assert _names(actions.plan_levels(containers, "stop", ordered=True)) == [
+        ["web"], ["api"], ["cache", "db"],
+    ]
+    assert _names(actions.plan_levels(containers, "start", ordered=False)) == [
+        ["api", "cache", "db", "web"],
+    ]
+
+
+def test_cycle_goes_to_the_last_level():
+    a = _FakeContainer("a", "b:service_started:false")
+    b = _FakeContainer("b", "a:service_started:false")
+    base = _FakeContainer("base")
+
+    assert _names(actions.plan_levels([a, b, base], "start", ordered=True)) == [
+        ["base"], ["a", "b"],
+    ]
+
+
+def test_unknown_or_foreign_dependencies_are_ignored():
+    # "db" no está en el pedido; el "api" del otro proyecto tampoco cuenta
+    api = _FakeContainer("api", "db:service_healthy:false")
+    other = _FakeContainer("api", project="other")
+    worker = _FakeContainer("worker", "api:service_started:false", project="other")
+
+    assert _names(actions.plan_levels([api, worker, other], "start", ordered=True)) == [
+        ["api", "api"], ["worker"],
+    ]
+
+
+def test_concurrency_is_bounded_by_the_semaphore(monkeypatch):
+    monkeypatch.setattr(actions, "refresh_containers", lambda ids: None)
+    monkeypatch.setattr(_FakeContainer, "peak", 0)
+    containers = [_FakeContainer(f"svc{i}", delay=0.1) for i in range(actions.ACTION_CONCURRENCY * 3)]
+
+    async def run():
+        return [e async for e in actions.stream_action(containers, "stop", ordered=False)]
+
+    events = asyncio.run(run())
+
+    assert _FakeContainer.peak == actions.ACTION_CONCURRENCY
+    assert events[-1] == {**events[-1], "type": "summary", "ok": len(containers), "failed": 0}
+    assert sum(e["type"] == "done" for e in events) == len(containers)
+
+
+@pytest.mark.parametrize("ordered", [False, True])
+def test_empty_and_single_requests(ordered):
+    assert actions.plan_levels([], "start", ordered) == []
+    one = _FakeContainer("db")
+    assert actions.plan_levels([one], "start", ordered) == [[one]]
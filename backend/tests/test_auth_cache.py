@@ -0,0 +1,88 @@
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import auth
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(auth, "_token_cache", OrderedDict())
+    decodes = []
+    decode = auth.jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        decodes.append(args[0])
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(auth.jwt, "decode", counting_decode)
+    return decodes
+
+
+def _token(**delta):
+    return auth.create_access_token({"sub": auth.ADMIN_USER}, timedelta(**delta))
+
+
+def test_cached_token_is_not_decoded_again(cache):
+    token = _token(minutes=10)
+    assert auth.verify_token(token) == auth.ADMIN_USER
+    assert auth.verify_token(token) == auth.ADMIN_USER
+    assert auth.verify_token(token) == auth.ADMIN_USER
+    assert cache == [token]
+
+
+def test_entry_expires_at_the_earlier_of_ttl_and_exp(cache):
+    now = time.time()
+    short = _token(seconds=60)
+    long = _token(hours=1)
+    auth.verify_token(short)
+    auth.verify_token(long)
+
+    expires = [entry[1] for entry in auth._token_cache.values()]
+    assert expires[0] == pytest.approx(now + 60, abs=2)
+    assert expires[1] == pytest.approx(now + auth.TOKEN_CACHE_TTL_SEC, abs=2)
+
+
+def test_lru_eviction_at_capacity(cache, monkeypatch):
+    monkeypatch.setattr(auth, "TOKEN_CACHE_MAX_ENTRIES", 2)
+    first, second, third = (_token(minutes=m) for m in (10, 11, 12))
+    auth.verify_token(first)
+    auth.verify_token(second)
+    auth.verify_token(first)  # ahora second es el menos usado
+    auth.verify_token(third)
+
+    assert list(auth._token_cache) == [auth._token_key(first), auth._token_key(third)]
+    del cache[:]
+    auth.verify_token(second)
+    assert cache == [second]
+
+
+def test_expired_token_is_rejected_even_if_cached(cache):
+    token = _token(seconds=1)
+    auth.verify_token(token)
+    # exp es en segundos enteros: se espera a pasarlo seguro
+    time.sleep(2.1)
+    with pytest.raises(HTTPException) as exc:
+        auth.verify_token(token)
+    assert exc.value.status_code == 401
+
+
+def test_revoked_token_is_rejected_even_if_cached(cache, monkeypatch):
+    token = _token(minutes=10)
+    auth.verify_token(token)
+    secret = auth.SECRET_KEY
+
+    # otra SECRET_KEY: las firmas viejas dejan de valer
+    monkeypatch.setattr(auth, "SECRET_KEY", "rotated")
+    with pytest.raises(HTTPException):
+        auth.verify_token(token)
+
+    monkeypatch.setattr(auth, "SECRET_KEY", secret)
+    assert auth.verify_token(token) == auth.ADMIN_USER
+    # el usuario del token dejó de ser el admin
+    monkeypatch.setattr(auth, "ADMIN_USER", "someone-else")
+    with pytest.raises(HTTPException):
+        auth.verify_token(token)
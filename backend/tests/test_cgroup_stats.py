@@ -0,0 +1,160 @@
+import os
+import shutil
+import time
+
+import pytest
+
+from services import cgroup_stats, stats_collector
+from services.cgroup_stats import _CGROUP_LAYOUTS, find_cgroup_dir, read_sample
+from services.docker_client import HOSTS
+
+CID = "c0ffee" + "0" * 58
+PID = 4242
+
+NET_DEV = """Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo:  999999      10    0    0    0     0          0         0   999999      10    0    0    0     0       0          0
+  eth0:    1000      10    0    0    0     0          0         0     300       3    0    0    0     0       0          0
+  eth1:      24       1    0    0    0     0          0         0      76       1    0    0    0     0       0          0
+"""
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def _make_tree(tmp_path, layout, container_id=CID, usage_usec=1_000_000, memory_max="max"):
+    """
+    cgroup v2 + /proc fake de un contenedor: -> (cgroup_root, proc_root, dir).
+    """
+    cgroup_root = str(tmp_path / "cgroup")
+    proc_root = str(tmp_path / "proc")
+    cgroup_dir = os.path.join(cgroup_root, layout.format(id=container_id))
+    _write(os.path.join(cgroup_dir, "cpu.stat"), f"usage_usec {usage_usec}\nuser_usec 1\nsystem_usec 2\n")
+    _write(os.path.join(cgroup_dir, "memory.current"), "52428800\n")
+    _write(os.path.join(cgroup_dir, "memory.max"), memory_max + "\n")
+    _write(
+        os.path.join(cgroup_dir, "io.stat"),
+        "8:0 rbytes=4096 wbytes=1024 rios=1 wios=1 dbytes=0 dios=0\n"
+        "259:0 rbytes=100 wbytes=20 rios=2 wios=3 dbytes=0 dios=0\n",
+    )
+    _write(os.path.join(proc_root, "meminfo"), "MemTotal:       16384000 kB\nMemFree: 1 kB\n")
+    _write(os.path.join(proc_root, str(PID), "net", "dev"), NET_DEV)
+    return cgroup_root, proc_root, cgroup_dir
+
+
+@pytest.mark.parametrize("layout", _CGROUP_LAYOUTS)
+def test_sample_from_each_layout(tmp_path, monkeypatch, layout):
+    cgroup_root, proc_root, cgroup_dir = _make_tree(tmp_path, layout, usage_usec=2_500_000)
+    assert find_cgroup_dir(CID, root=cgroup_root) == cgroup_dir
+
+    monkeypatch.setattr(cgroup_stats.time, "time", lambda: 101.0)
+    m, prev = read_sample(cgroup_dir, PID, prev=(100.0, 2_000_000), proc_root=proc_root)
+
+    assert prev == (101.0, 2_500_000)
+    # 0.5 s de CPU en 1 s de reloj -> medio core
+    assert m.cpu == pytest.approx(0.5)
+    assert m.mem_used == 50 * 1024 ** 2
+    # memory.max = "max": sin límite -> RAM del host
+    assert m.mem_limit == 16384000 * 1024
+    # io.stat sumado entre dispositivos
+    assert (m.blk_read, m.blk_write) == (4196, 1044)
+    # net/dev sin "lo"
+    assert (m.net_rx, m.net_tx) == (1024, 376)
+
+
+def test_first_sample_has_no_cpu_and_a_set_memory_limit(tmp_path):
+    _, proc_root, cgroup_dir = _make_tree(tmp_path, _CGROUP_LAYOUTS[1], memory_max="536870912")
+
+    m, prev = read_sample(cgroup_dir, 0, proc_root=proc_root)
+
+    assert m.cpu is None
+    assert prev[1] == 1_000_000
+    assert m.mem_limit == 512 * 1024 ** 2
+    assert (m.net_rx, m.net_tx) == (None, None)
+
+
+def test_unknown_layout_or_missing_files(tmp_path):
+    cgroup_root, proc_root, cgroup_dir = _make_tree(tmp_path, "kubepods/{id}")
+
+    assert find_cgroup_dir(CID, root=cgroup_root) is None
+    os.remove(os.path.join(cgroup_dir, "memory.current"))
+    with pytest.raises(OSError):
+        read_sample(cgroup_dir, PID, proc_root=proc_root)
+
+
+def _wait_until(pred, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if pred():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture
+def cgroup_enabled(tmp_path, monkeypatch):
+    monkeypatch.setattr(stats_collector, "CGROUP_STATS_ENABLED", True)
+    monkeypatch.setattr(stats_collector, "CGROUP_SWEEP_SEC", 0.05)
+    monkeypatch.setattr(cgroup_stats, "CGROUP_ROOT", str(tmp_path / "cgroup"))
+    monkeypatch.setattr(cgroup_stats, "CGROUP_PROC_ROOT", str(tmp_path / "proc"))
+    container = HOSTS["a"].containers.list()[0]
+    yield container
+    stats_collector.stop_stream(container.id)
+
+
+def _source(cid):
+    return "cgroup" if cid in stats_collector._CGROUP else "docker"
+
+
+def test_without_cgroup_dir_the_docker_stream_is_used(cgroup_enabled):
+    container = cgroup_enabled
+    stats_collector.start_stream(container)
+
+    assert _source(container.id) == "docker"
+    assert _wait_until(lambda: stats_collector.get_latest_stats(container.id) is not None)
+    # el límite del fake de Docker, no el del cgroup
+    assert stats_collector.get_latest_stats(container.id).mem_limit == 8 << 30
+
+
+def test_cgroup_dir_that_disappears_falls_back_to_docker(tmp_path, cgroup_enabled):
+    container = cgroup_enabled
+    _, _, cgroup_dir = _make_tree(tmp_path, _CGROUP_LAYOUTS[0], container_id=container.id, memory_max="536870912")
+    stats_collector.start_stream(container)
+
+    assert _source(container.id) == "cgroup"
+    assert _wait_until(lambda: getattr(stats_collector.get_latest_stats(container.id), "mem_limit", None) == 512 << 20)
+
+    shutil.rmtree(cgroup_dir)
+    assert _wait_until(lambda: _source(container.id) == "docker")
+    assert _wait_until(lambda: getattr(stats_collector.get_latest_stats(container.id), "mem_limit", None) == 8 << 30)
+
+
+def test_sweeper_reads_samples_without_asking_the_daemon(tmp_path, cgroup_enabled, collector, engines):
+    container = cgroup_enabled
+    stack_id = stats_collector._stack_name_for_container(container)
+    _, _, cgroup_dir = _make_tree(tmp_path, _CGROUP_LAYOUTS[0], container_id=container.id)
+    stats_before = engines["a"].calls_snapshot().get("GET /containers/{id}/stats", 0)
+
+    stats_collector.sync_container(container)
+    assert _source(container.id) == "cgroup"
+    assert _wait_until(lambda: stats_collector.get_latest_stats(container.id) is not None)
+    first = stats_collector.get_latest_stats(container.id)
+    assert first.mem_used == 50 * 1024 ** 2
+
+    # el contador de CPU avanza entre pasadas -> el sample trae CPU
+    _write(os.path.join(cgroup_dir, "cpu.stat"), "usage_usec 900000000\n")
+    assert _wait_until(lambda: (stats_collector.get_latest_stats(container.id).cpu or 0) > 0)
+    cpu, used, _ = stats_collector.get_stack_aggregate(stack_id)
+    assert cpu == stats_collector.get_latest_stats(container.id).cpu
+    assert used == 50 * 1024 ** 2
+    assert engines["a"].calls_snapshot().get("GET /containers/{id}/stats", 0) == stats_before
+
+    # parado: sale del sweeper y no vuelve a aparecer
+    stats_collector.stop_stream(container.id)
+    assert container.id not in stats_collector._CGROUP
+    time.sleep(0.2)
+    assert stats_collector.get_latest_stats(container.id) is None
+    assert stats_collector.get_stack_aggregate(stack_id) == (None, 0, 0)
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import time
+
+from services import docker_client, snapshot
+from services.docker_client import DOCKER_IO_WORKERS, HOSTS, run_docker_io
+
+
+def test_blocking_calls_are_bounded_and_do_not_block_the_loop():
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0, "threads": set()}
+
+    def blocking_call():
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+            state["threads"].add(threading.current_thread().name)
+        time.sleep(0.1)
+        with lock:
+            state["running"] -= 1
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        tick_task = asyncio.create_task(ticker())
+        start = time.monotonic()
+        await asyncio.gather(*(run_docker_io(blocking_call) for _ in range(DOCKER_IO_WORKERS * 3)))
+        elapsed = time.monotonic() - start
+        tick_task.cancel()
+        return elapsed, ticks
+
+    elapsed, ticks = asyncio.run(run())
+
+    assert state["peak"] == DOCKER_IO_WORKERS
+    assert all(name.startswith("docker-io") for name in state["threads"])
+    # tres tandas de 0.1 s; mientras tanto el loop siguió atendiendo
+    assert elapsed >= 0.3
+    assert ticks >= 10
+
+
+def test_clients_use_the_configured_request_timeout():
+    for host_client in HOSTS.values():
+        assert host_client.api.timeout == docker_client.DOCKER_TIMEOUT_SEC == 5
+
+
+def test_hung_reconcile_times_out_and_marks_the_host(monkeypatch):
+    release = threading.Event()
+    started = []
+    monkeypatch.setattr(snapshot, "DOCKER_TIMEOUT_SEC", 0.2)
+    monkeypatch.setattr(snapshot, "_reconcile_host", lambda host: release.wait(5))
+    monkeypatch.setattr(snapshot, "_start_events_watcher", lambda host, since: started.append(host))
+
+    async def run():
+        start = time.monotonic()
+        await snapshot._reconcile_host_task("b", time.time())
+        return time.monotonic() - start
+
+    try:
+        elapsed = asyncio.run(run())
+        health = {h["host"]: h for h in docker_client.get_hosts_health()}["b"]
+        assert elapsed < 1
+        assert health["ok"] is False and health["error"] == "timeout"
+        assert started == []
+    finally:
+        release.set()
+        docker_client.mark_host("b", True)
@@ -0,0 +1,69 @@
+import gzip
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from auth import create_access_token
+from services import snapshot
+
+
+def _stack(name, cpu):
+    return {
+        "stack_id": name, "display_name": name, "containers_count": 1, "status": "healthy",
+        "longest_uptime": "1h", "cpu_avg": f"{cpu}%", "ram_total_used": "1 MiB",
+        "ram_host_total": "1 GiB",
+    }
+
+
+def _publish(summary):
+    # lo que hace el loop de refresco al cambiar el contenido
+    snapshot._STACKS_SUMMARY = summary
+    snapshot._STACKS_SUMMARY_ETAG = snapshot._etag_for(summary)
+    snapshot._STACKS_SUMMARY_BODY = {}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    for name in ("_STACKS_SUMMARY", "_STACKS_SUMMARY_ETAG", "_STACKS_SUMMARY_BODY"):
+        monkeypatch.setattr(snapshot, name, getattr(snapshot, name))
+    _publish([_stack("web", 1.0)])
+    headers = {"Authorization": "Bearer " + create_access_token({"sub": "admin"})}
+    # sin `with`: sin loop de refresco, las generaciones las publica el test
+    return TestClient(app, headers=headers)
+
+
+@pytest.mark.parametrize("encoding", ["identity", "gzip"])
+def test_conditional_get_of_the_summary(client, encoding):
+    headers = {"Accept-Encoding": encoding}
+    first = client.get("/api/v2/stacks", headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert first.headers["Vary"] == "Accept-Encoding"
+
+    again = client.get("/api/v2/stacks", headers={**headers, "If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+    assert again.content == b""
+
+    _publish([_stack("web", 2.0)])
+    bumped = client.get("/api/v2/stacks", headers={**headers, "If-None-Match": etag})
+    assert bumped.status_code == 200
+    assert bumped.headers["ETag"] != etag
+    assert bumped.json()["stacks"][0]["cpu_avg"] == "2.0%"
+
+
+def test_each_encoding_has_its_own_etag(client):
+    identity = client.get("/api/v2/stacks", headers={"Accept-Encoding": "identity"})
+    gzipped = client.get("/api/v2/stacks", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert identity.headers["ETag"] != gzipped.headers["ETag"]
+    assert gzipped.headers["ETag"] == identity.headers["ETag"][:-1] + '-gz"'
+
+    # el tag de una variante no valida el body de otra
+    cross = client.get(
+        "/api/v2/stacks",
+        headers={"Accept-Encoding": "identity", "If-None-Match": gzipped.headers["ETag"]},
+    )
+    assert cross.status_code == 200
+    assert cross.content == gzip.decompress(snapshot.get_summary_body("gzip"))
@@ -0,0 +1,28 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from app import app
+from auth import create_access_token
+from services.docker_client import HOSTS
+
+
+def _exec_url(container):
+    token = create_access_token({"sub": "admin"})
+    return f"/api/v2/containers/{container.id[:12]}/exec?token={token}&cols=80&rows=24"
+
+
+def test_idle_session_outlives_the_client_read_timeout(monkeypatch):
+    host_client = HOSTS["b"]
+    container = host_client.containers.list()[0]
+    # el timeout de lectura del SDK, bajado para no esperar DOCKER_TIMEOUT_SEC
+    monkeypatch.setattr(host_client.api, "timeout", 1)
+
+    with TestClient(app).websocket_connect(_exec_url(container)) as ws:
+        time.sleep(2.5)
+        ws.send_json({"type": "input", "data": "echo hi\n"})
+        assert ws.receive_json() == {"type": "output", "data": "echo hi\n"}
+
+        ws.send_json({"type": "input", "data": "exit\n"})
+        assert ws.receive_json() == {"type": "output", "data": "exit\n"}
+        assert ws.receive_json() == {"type": "exit", "code": 0}
@@ -0,0 +1,48 @@
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app import app
+from services import snapshot
+
+# Un build de detalle en frío (antes del primer seed: listado + inspect de
+# cada contenedor + stats() one-shot) contra un daemon lento no puede
+# frenar el event loop: /healthz tiene que seguir contestando al toque.
+
+HEALTHZ_P99_MAX_MS = 50
+COLD_STACK = "a:stack0"   # 67 de los 200 contenedores del host "a"
+
+
+def test_healthz_p99_stays_flat_during_cold_detail_build(engines, monkeypatch):
+    engine = engines["a"]
+    monkeypatch.setattr(engine, "inspect_latency", 0.002)
+    monkeypatch.setattr(engine, "stats_latency", 0.1)
+    # forzar el camino frío aunque otro test ya haya sembrado el registro
+    monkeypatch.setattr(snapshot, "_LAST_RECONCILE_TS", 0.0)
+    snapshot._STACKS_DETAIL.pop(COLD_STACK, None)
+    snapshot._STACKS_DETAIL_TS.pop(COLD_STACK, None)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.get("/healthz")  # warmup
+            start = time.perf_counter()
+            build = asyncio.create_task(snapshot.get_detail_snapshot(COLD_STACK))
+            samples = []
+            while not build.done():
+                t0 = time.perf_counter()
+                response = await client.get("/healthz")
+                samples.append((time.perf_counter() - t0) * 1000)
+                assert response.status_code == 200
+            return await build, time.perf_counter() - start, samples
+
+    detail, build_sec, samples = asyncio.run(run())
+
+    assert detail is not None and len(detail["containers"]) == 67
+    # el build tiene que haber durado de verdad, con muchos /healthz en el medio
+    assert build_sec > 0.5
+    assert len(samples) >= 100
+    p99 = statistics.quantiles(samples, n=100)[98]
+    assert p99 < HEALTHZ_P99_MAX_MS, f"/healthz p99 {p99:.1f} ms during a {build_sec:.2f}s build"
@@ -0,0 +1,143 @@
+import threading
+import time
+
+from services import log_index
+from services.log_index import LogQuery, search_logs
+
+RAW = (
+    b"2024-05-01T10:00:00.000000001Z ERROR db connection refused\n"
+    b"2024-05-01T10:00:01Z INFO retrying\n"
+)
+
+
+class _TTYContainer:
+    """
+    Contenedor con TTY: el SDK entrega los logs de a un byte.
+    """
+
+    def __init__(self, container_id: str, raw: bytes):
+        self.id = container_id
+        self._raw = raw
+
+    def logs(self, **kwargs):
+        return iter([bytes([b]) for b in self._raw])
+
+
+def test_follower_indexes_whole_lines_from_a_byte_stream():
+    container = _TTYContainer("f" * 64, RAW)
+    state = log_index._get_or_create(container.id)
+    try:
+        log_index._follow_worker(container, state, threading.Event())
+
+        assert state.tail_lines == ["ERROR db connection refused", "INFO retrying"]
+        assert state.tail_ts == [1714557600000000001, 1714557601000000000]
+        assert state.tail_bytes == len("ERROR db connection refused") + len("INFO retrying") + 2
+
+        hits = list(search_logs([container.id], LogQuery(q="refused"), limit=10))
+        assert [h["line"] for h in hits[:-1]] == ["ERROR db connection refused"]
+        assert hits[0]["level"] == "error"
+    finally:
+        log_index.drop_logs(container.id)
+
+
+def _line(ts: str, text: str) -> bytes:
+    return f"2024-05-01T10:00:{ts}Z {text}\n".encode()
+
+
+class _ResumableContainer:
+    """
+    Devuelve de a una tanda por logs(); guarda los kwargs de cada llamada.
+    """
+
+    def __init__(self, container_id: str, *batches: bytes):
+        self.id = container_id
+        self._batches = list(batches)
+        self.calls = []
+
+    def logs(self, **kwargs):
+        self.calls.append(kwargs)
+        return iter([self._batches.pop(0)])
+
+
+def test_burst_lines_sharing_a_timestamp_are_all_kept_and_not_duplicated_on_resume():
+    container = _ResumableContainer(
+        "e" * 64,
+        _line("00", "a") + _line("01", "b") + _line("01", "c"),
+        # el daemon repite desde since: a (anterior), b y c (el borde), y sigue la ráfaga
+        _line("00", "a") + _line("01", "b") + _line("01", "c") + _line("01", "d") + _line("02", "e"),
+    )
+    state = log_index._get_or_create(container.id)
+    try:
+        log_index._follow_worker(container, state, threading.Event())
+        assert state.tail_lines == ["a", "b", "c"]
+
+        log_index._follow_worker(container, state, threading.Event())
+        assert state.tail_lines == ["a", "b", "c", "d", "e"]
+        assert container.calls[1]["since"] < 1714557601
+        # una ráfaga nueva con el mismo ts que la anterior, sin retomar
+        log_index._ingest(state, _line("02", "f"))
+        assert state.tail_lines[-1] == "f"
+    finally:
+        log_index.drop_logs(container.id)
+
+
+def test_search_reaches_blocks_spilled_to_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_index, "LOG_INDEX_SPILL_DIR", str(tmp_path))
+    monkeypatch.setattr(log_index, "LOG_INDEX_BLOCK_BYTES", 64)
+    monkeypatch.setattr(log_index, "LOG_INDEX_MAX_BYTES_PER_CONTAINER", 256)
+    container_id = "d" * 64
+    state = log_index._get_or_create(container_id)
+    try:
+        for i in range(40):
+            level = "ERROR" if i % 10 == 0 else "INFO"
+            log_index._ingest(state, _line(f"{i:02d}", f"{level} request {i:02d} served"))
+        assert state.disk and state.blocks
+        assert len(list(tmp_path.joinpath(container_id).iterdir())) == len(state.disk)
+
+        hits = list(search_logs([container_id], LogQuery(levels=["error"]), limit=10))
+        # del más nuevo al más viejo, pasando de memoria a los segmentos en disco
+        assert [h["line"] for h in hits[:-1]] == [f"ERROR request {i:02d} served" for i in (30, 20, 10, 0)]
+        assert hits[-1] == {"next_cursor": None}
+
+        page = list(search_logs([container_id], LogQuery(q="request 0"), limit=3))
+        assert [h["line"][-9:] for h in page[:-1]] == ["09 served", "08 served", "07 served"]
+        rest = list(search_logs([container_id], LogQuery(q="request 0", cursor=page[-1]["next_cursor"]), limit=10))
+        assert len(rest) - 1 == 7
+    finally:
+        log_index.drop_logs(container_id)
+    assert not tmp_path.joinpath(container_id).exists()
+
+
+def test_relabel_and_rename_keep_the_indexed_lines(registry, engines):
+    from services import snapshot
+    from services.docker_client import HOSTS
+    from services.stats_collector import stop_stream
+
+    container = HOSTS["b"].containers.list()[0]
+    fake = engines["b"].find(container.id)
+    old_stack, old_name = fake.stack, fake.name
+    snapshot._refresh_container(container.id, host="b")
+    state = log_index._LOGS[container.id]
+    try:
+        deadline = time.monotonic() + 10
+        while len(state.tail_lines) < 20 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        indexed = list(state.tail_lines)
+        assert len(indexed) == 20
+
+        # compose lo pasa a otro proyecto y le cambia el nombre
+        fake.stack, fake.name = "moved", "moved-svc0-1"
+        snapshot._refresh_container(container.id, host="b")
+
+        assert log_index._LOGS[container.id] is state
+        assert state.tail_lines == indexed  # el follower no se reabrió
+        assert snapshot.get_stack_container_ids(f"b:{old_stack}") == []
+        moved = snapshot.get_stack_container_ids("b:moved")
+        assert moved == [container.id]
+        hits = list(search_logs(moved, LogQuery(levels=["error"]), limit=100))
+        assert len(hits) - 1 == 4
+        assert log_index.resolve_log_container_id(container.short_id) == container.id
+    finally:
+        fake.stack, fake.name = old_stack, old_name
+        log_index.drop_logs(container.id)
+        stop_stream(container.id)
@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+from services.docker_client import HOSTS
+from services.logs import iter_log_lines, iter_log_ndjson
+
+TS1 = "2024-05-01T10:00:00.000000001Z"
+TS2 = "2024-05-01T10:00:01.5Z"
+RAW = f"{TS1} first line\n{TS2} second line\n".encode()
+
+
+class _Stream:
+    """
+    Como el generador del SDK: iterable y con close().
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+
+    def __iter__(self):
+        return self._chunks
+
+    def close(self):
+        pass
+
+
+def _ndjson(chunks, since_ns=None):
+    async def collect():
+        out = b""
+        async for chunk in iter_log_ndjson(_Stream(chunks), since_ns):
+            out += chunk
+        return [json.loads(line) for line in out.decode().splitlines()]
+    return asyncio.run(collect())
+
+
+def test_iter_log_lines_joins_bytes_and_splits_on_newline():
+    chunks = [bytes([b]) for b in b"a\r\nbc\n\nd"]
+    assert list(iter_log_lines(chunks)) == [b"a\r\n", b"bc\n", b"\n", b"d"]
+
+
+def test_ndjson_from_tty_stream_one_byte_per_item():
+    records = _ndjson([bytes([b]) for b in RAW])
+
+    assert records == [
+        {"ts": TS1, "cursor": "1714557600000000001", "line": "first line"},
+        {"ts": TS2, "cursor": "1714557601500000000", "line": "second line"},
+    ]
+
+
+def test_ndjson_from_frames_split_mid_line():
+    # frames multiplexados ya demultiplexados por el SDK: cortan donde quieren
+    frames = [RAW[:7], RAW[7:40], RAW[40:], b"no newline at the end"]
+    records = _ndjson(frames)
+
+    assert [r["line"] for r in records] == ["first line", "second line", "no newline at the end"]
+    assert records[-1]["cursor"] is None
+
+
+def test_ndjson_resume_skips_already_sent_lines():
+    records = _ndjson([RAW], since_ns=1714557600000000001)
+
+    assert [r["line"] for r in records] == ["second line"]
+
+
+def test_fake_engine_log_frames_are_lines(engines):
+    # con el daemon fake: frames reales, un item del SDK por frame
+    container = HOSTS["a"].containers.list()[0]
+    lines = list(iter_log_lines(container.logs(stream=True, follow=False, timestamps=True, tail=3)))
+
+    assert len(lines) == 3
+    assert all(line.endswith(b"\n") for line in lines)
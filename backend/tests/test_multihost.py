@@ -0,0 +1,95 @@
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from auth import create_access_token
+from services.docker_client import HOSTS
+
+# Los tres hosts del conftest: "a" (200 contenedores), "b" (8) y "down".
+
+
+@pytest.fixture(scope="module")
+def client(engines):
+    headers = {"Authorization": "Bearer " + create_access_token({"sub": "admin"})}
+    with TestClient(app, headers=headers) as c:
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            # los tres hosts contactados y un summary armado con los dos vivos
+            hosts = {h["host"]: h["ok"] for h in c.get("/api/v2/hosts").json()["hosts"]}
+            summary_hosts = {s["host"] for s in c.get("/api/v2/stacks").json()["stacks"]}
+            if hosts == {"a": True, "b": True, "down": False} and summary_hosts == {"a", "b"}:
+                break
+            time.sleep(0.1)
+        else:
+            pytest.fail(f"hosts never settled: {hosts}, summary of {summary_hosts}")
+        yield c
+
+
+def _short_ids(host, stack):
+    return {
+        c.id[:12] for c in HOSTS[host].containers.list(all=True)
+        if c.labels["com.docker.compose.project"] == stack
+    }
+
+
+def _calls(engine, key):
+    return engine.calls_snapshot().get(key, 0)
+
+
+def test_same_stack_name_on_two_hosts_stays_separate(client):
+    stacks = {s["stack_id"]: s for s in client.get("/api/v2/stacks").json()["stacks"]}
+
+    assert stacks["a:stack0"]["host"] == "a"
+    assert stacks["b:stack0"]["host"] == "b"
+    assert stacks["a:stack0"]["containers_count"] == 67
+    assert stacks["b:stack0"]["containers_count"] == 3
+    assert "stack0" not in stacks
+
+    for host in ("a", "b"):
+        detail = client.get(f"/api/v2/stacks/{host}:stack0").json()
+        assert {c["id"] for c in detail["containers"]} == _short_ids(host, "stack0")
+
+
+def test_down_host_is_reported_and_does_not_hide_the_others(client):
+    hosts = {h["host"]: h for h in client.get("/api/v2/hosts").json()["hosts"]}
+    assert hosts["down"]["ok"] is False
+    assert hosts["down"]["error"]
+    assert hosts["a"]["ok"] and hosts["b"]["ok"]
+
+    stack_ids = [s["stack_id"] for s in client.get("/api/v2/stacks").json()["stacks"]]
+    assert {sid.split(":")[0] for sid in stack_ids} == {"a", "b"}
+    assert client.get("/api/v2/stacks/down:stack0").status_code == 404
+
+
+def test_actions_go_to_the_container_host(client, engines):
+    b_container = HOSTS["b"].containers.list()[0]
+    key = "POST /containers/{id}/restart"
+    before = {name: _calls(engine, key) for name, engine in engines.items()}
+
+    response = client.post(
+        "/api/v2/containers/actions/restart",
+        json={"container_ids": [b_container.id[:12]]},
+    )
+
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert events[-1]["type"] == "summary"
+    assert _calls(engines["b"], key) == before["b"] + 1
+    assert _calls(engines["a"], key) == before["a"]
+
+
+def test_logs_come_from_the_container_host(client, engines):
+    a_container = HOSTS["a"].containers.list()[0]
+    key = "GET /containers/{id}/logs"
+    before = {name: _calls(engine, key) for name, engine in engines.items()}
+
+    response = client.get(f"/api/v2/containers/{a_container.id[:12]}/logs/stream?follow=false&tail=5")
+
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 5 and all(line["cursor"] for line in lines)
+    assert _calls(engines["a"], key) == before["a"] + 1
+    assert _calls(engines["b"], key) == before["b"]
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import Counter
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from auth import create_access_token
+from routers import v2
+from services import perf
+from services.docker_client import HOSTS
+
+
+@pytest.fixture
+def fresh_perf(monkeypatch):
+    monkeypatch.setattr(perf, "_TIMERS", {})
+    monkeypatch.setattr(perf, "_COUNTERS", Counter())
+    return perf
+
+
+@pytest.fixture
+def client():
+    headers = {"Authorization": "Bearer " + create_access_token({"sub": "admin"})}
+    return TestClient(app, headers=headers)
+
+
+def test_timer_histogram_and_bucket_quantiles(fresh_perf):
+    for ms in [1] * 90 + [40] * 9 + [20000]:
+        perf.observe("phase", ms / 1000)
+
+    t = perf.get_perf()["timers"]["phase"]
+    assert t["count"] == 100
+    assert t["max_ms"] == 20000
+    assert t["avg_ms"] == pytest.approx((90 + 360 + 20000) / 100)
+    # cotas superiores del bucket, no valores exactos
+    assert (t["p50_ms"], t["p95_ms"]) == (1, 50)
+    assert t["p99_ms"] == 50
+    assert t["buckets"]["le_inf"] == 1
+
+
+def test_daemon_calls_are_counted_with_normalized_paths(fresh_perf):
+    container = HOSTS["b"].containers.list()[0]
+    HOSTS["b"].containers.get(container.id)
+
+    counters = perf.get_perf()["counters"]
+    assert counters["docker.api.calls GET /containers/json"] == 1
+    # list() de docker-py hace un inspect por contenedor, más el get()
+    assert counters["docker.api.calls GET /containers/{id}/json"] >= 2
+    assert "docker.api GET /containers/{id}/json" in perf.get_perf()["timers"]
+    assert perf._api_call_name("GET", "http+docker://localhost/v1.44/exec/" + "ab" * 32 + "/json") == (
+        "GET /exec/{id}/json"
+    )
+
+
+def test_perf_endpoint_reports_routes_and_resets(fresh_perf, client):
+    assert TestClient(app).get("/api/v2/debug/perf").status_code == 401
+
+    client.get("/api/v2/debug/schedule")
+    body = client.get("/api/v2/debug/perf").json()
+    assert body["timers"]["route GET /api/v2/debug/schedule"]["count"] == 1
+    assert body["counters"]["route.status GET /api/v2/debug/schedule 200"] == 1
+    assert "hit_rate" in body["auth_cache"]
+
+    client.get("/api/v2/debug/perf", params={"reset": True})
+    body = client.get("/api/v2/debug/perf").json()
+    assert "route GET /api/v2/debug/schedule" not in body["timers"]
+
+
+def test_profiler_is_opt_in(client):
+    assert client.post("/api/v2/debug/perf/profile", params={"seconds": 0.1}).status_code == 404
+
+
+def _busy_worker(stop):
+    while not stop.is_set():
+        time.sleep(0.001)
+
+
+def test_profiler_returns_collapsed_stacks_one_at_a_time(client, monkeypatch):
+    monkeypatch.setattr(v2, "PERF_PROFILER_ENABLED", True)
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_worker, args=(stop,), name="busy worker", daemon=True)
+    worker.start()
+    try:
+        r = client.post("/api/v2/debug/perf/profile", params={"seconds": 0.2, "interval_ms": 5})
+        assert r.status_code == 200
+        lines = r.text.splitlines()
+        mine = [line for line in lines if line.startswith("busy_worker;")]
+        assert mine and mine[0].split(" ")[0].endswith(f"{__name__}:_busy_worker")
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+        with perf._profiling:
+            busy = client.post("/api/v2/debug/perf/profile", params={"seconds": 0.1})
+        assert busy.status_code == 409
+    finally:
+        stop.set()
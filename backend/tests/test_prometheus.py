@@ -0,0 +1,35 @@
+import re
+
+import pytest
+
+from services import prometheus
+from services.docker_client import HOSTS
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("name,stack", ["name", "stack"]),
+    ("id", ["id"]),
+    ("stack", ["name", "stack"]),
+    ("host", ["name", "host"]),
+    ("stack,host", ["name", "stack", "host"]),
+    ("bogus", ["name", "host"]),
+    ("name", ["name", "host"]),
+])
+def test_container_labels_always_identify_a_container(raw, expected):
+    # los tests corren con varios hosts (conftest)
+    assert prometheus._parse_container_labels(raw) == expected
+
+
+@pytest.mark.parametrize("raw", ["stack", "host", "stack,host", "name"])
+def test_rendered_container_series_are_unique(registry, monkeypatch, raw):
+    monkeypatch.setattr(prometheus, "METRICS_CONTAINER_LABELS", prometheus._parse_container_labels(raw))
+    with registry._CONTAINERS_LOCK:
+        for host in ("a", "b"):
+            for c in HOSTS[host].containers.list(all=True):
+                registry._index_put(c)
+
+    body = prometheus.render_metrics().decode()
+    series = re.findall(r"^docker_monitor_container_running(\{.*\}) ", body, re.M)
+
+    assert len(series) == len(registry._CONTAINERS)
+    assert len(set(series)) == len(series)
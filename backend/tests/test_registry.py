@@ -0,0 +1,80 @@
+import pytest
+
+from services import snapshot
+
+# El registro en memoria: un listado por host al sembrar y después sólo
+# eventos, cada uno con a lo sumo un inspect del contenedor afectado.
+
+LIST = "GET /containers/json"
+INSPECT = "GET /containers/{id}/json"
+
+
+@pytest.fixture
+def seeded(registry, engines, monkeypatch):
+    # sólo el registro: sin streams de stats, followers ni series
+    for name in ("sync_streams", "sync_followers", "sync_container", "sync_follower"):
+        monkeypatch.setattr(snapshot, name, lambda *args: None)
+    for name in ("retain_series", "drop_series", "drop_logs", "stop_stream"):
+        monkeypatch.setattr(snapshot, name, lambda *args: None)
+    snapshot._reconcile_host("b")
+    return engines["b"]
+
+
+def _calls(engine):
+    calls = engine.calls_snapshot()
+    return calls.get(LIST, 0), calls.get(INSPECT, 0)
+
+
+def _running(container_id):
+    return snapshot.find_container(container_id).attrs["State"]["Running"]
+
+
+def test_seed_builds_the_registry_and_the_stack_index(seeded):
+    fakes = list(seeded.containers.values())
+    assert {c.id for c in snapshot._snapshot_containers()} == {c.id for c in fakes}
+    for stack in {c.stack for c in fakes}:
+        assert sorted(snapshot.get_stack_container_ids(f"b:{stack}")) == sorted(
+            c.id for c in fakes if c.stack == stack
+        )
+    assert snapshot._LAST_RECONCILE_TS > 1.0
+
+
+def test_lifecycle_event_reinspects_only_that_container(seeded):
+    fake = next(c for c in seeded.containers.values() if c.running)
+    before = _calls(seeded)
+    try:
+        seeded.set_running(fake, False)
+        snapshot._apply_event({"Action": "die", "id": fake.id}, "b")
+
+        assert _running(fake.id) is False
+        assert _calls(seeded) == (before[0], before[1] + 1)
+
+        seeded.set_running(fake, True)
+        snapshot._apply_event({"status": "start", "Actor": {"ID": fake.id}}, "b")
+        assert _running(fake.id) is True
+    finally:
+        seeded.set_running(fake, True)
+
+
+def test_unwatched_actions_are_ignored(seeded):
+    fake = next(iter(seeded.containers.values()))
+    before = _calls(seeded)
+    snapshot._apply_event({"Action": "exec_start: sh -c true", "id": fake.id}, "b")
+    snapshot._apply_event({"Action": "die"}, "b")  # sin id
+    assert _calls(seeded) == before
+
+
+def test_destroy_drops_the_container_without_asking_the_daemon(seeded):
+    fake = next(iter(seeded.containers.values()))
+    stack_id = f"b:{fake.stack}"
+    before = _calls(seeded)
+
+    snapshot._apply_event({"Action": "destroy", "id": fake.id}, "b")
+
+    assert snapshot.find_container(fake.id) is None
+    assert fake.id not in snapshot.get_stack_container_ids(stack_id)
+    assert _calls(seeded) == before
+
+    # un "create"/"start" de un contenedor que el registro no conoce lo agrega
+    snapshot._apply_event({"Action": "start", "id": fake.id}, "b")
+    assert fake.id in snapshot.get_stack_container_ids(stack_id)
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import pytest
+
+from services import scheduler
+
+
+@pytest.fixture
+def sched(monkeypatch):
+    monkeypatch.setattr(scheduler, "_STACK_INTEREST", {})
+    monkeypatch.setattr(scheduler, "_SUMMARY_INTEREST_TS", 0.0)
+    monkeypatch.setattr(scheduler, "_STREAM_WATCHERS", 0)
+    monkeypatch.setattr(scheduler, "_stretch", 1.0)
+    monkeypatch.setattr(scheduler, "_wakeup", None)
+    monkeypatch.setattr(scheduler, "_wakeup_loop", None)
+    return scheduler
+
+
+def _slow_cycle(interval):
+    scheduler.record_cycle(interval * scheduler.CYCLE_BUDGET_FRACTION * 2, interval)
+
+
+def _fast_cycle(interval):
+    scheduler.record_cycle(0.0, interval)
+
+
+def test_nobody_watching_uses_the_slow_intervals(sched):
+    assert sched.summary_interval() == sched.SLOW_INTERVAL_SEC
+    assert sched.reconcile_interval() == sched.IDLE_RECONCILE_INTERVAL_SEC
+    assert sched.watched_stacks() == []
+
+
+def test_interest_snaps_back_to_the_fast_intervals(sched):
+    sched.note_summary_interest()
+    assert sched.summary_interval() == sched.FAST_INTERVAL_SEC
+    assert sched.reconcile_interval() == sched.RECONCILE_INTERVAL_SEC
+
+
+def test_watched_stack_keeps_its_detail_prewarmed_until_the_window_ends(sched):
+    sched.note_stack_interest(["web"])
+    now = time.time()
+    assert sched.watched_stacks(now) == ["web"]
+    assert sched.reconcile_interval() == sched.RECONCILE_INTERVAL_SEC
+    # el summary sigue lento: sólo se mira un detalle
+    assert sched.summary_interval() == sched.SLOW_INTERVAL_SEC
+
+    assert sched.watched_stacks(now + sched.INTEREST_WINDOW_SEC) == []
+    assert sched.reconcile_interval() == sched.IDLE_RECONCILE_INTERVAL_SEC
+
+
+def test_stream_watcher_counts_as_summary_interest(sched):
+    sched.set_stream_watchers(1)
+    assert sched.summary_watched(time.time() + 10 * sched.INTEREST_WINDOW_SEC)
+    sched.set_stream_watchers(0)
+    assert not sched.summary_watched()
+
+
+def test_slow_refresh_stretches_every_interval_up_to_the_cap(sched):
+    sched.note_summary_interest()
+    _slow_cycle(sched.summary_interval())
+    assert sched.summary_interval() == pytest.approx(sched.FAST_INTERVAL_SEC * sched.STRETCH_STEP)
+    assert sched.detail_ttl() == pytest.approx(sched.FAST_INTERVAL_SEC * sched.STRETCH_STEP)
+    assert sched.reconcile_interval() == pytest.approx(sched.RECONCILE_INTERVAL_SEC * sched.STRETCH_STEP)
+
+    for _ in range(50):
+        _slow_cycle(sched.summary_interval())
+    assert sched.get_schedule()["stretch"] == sched.MAX_STRETCH
+    assert sched.summary_interval() == pytest.approx(sched.FAST_INTERVAL_SEC * sched.MAX_STRETCH)
+
+
+def test_cycles_within_budget_shrink_back_to_the_base_interval(sched):
+    for _ in range(10):
+        _slow_cycle(sched.summary_interval())
+    stretched = sched.summary_interval()
+
+    _fast_cycle(sched.summary_interval())
+    assert sched.summary_interval() == pytest.approx(stretched * sched.STRETCH_DECAY)
+
+    for _ in range(200):
+        _fast_cycle(sched.summary_interval())
+    # nunca por debajo de la base
+    assert sched.summary_interval() == sched.SLOW_INTERVAL_SEC
+
+
+def test_first_interest_after_idle_wakes_the_refresh_loop(sched):
+    async def run():
+        wakeup = asyncio.Event()
+        sched.set_wakeup(wakeup, asyncio.get_running_loop())
+
+        sched.note_summary_interest()
+        await asyncio.wait_for(wakeup.wait(), timeout=1)
+
+        # ya estaba mirado: no hace falta despertar otra vez
+        wakeup.clear()
+        sched.note_summary_interest()
+        await asyncio.sleep(0.05)
+        return wakeup.is_set()
+
+    assert asyncio.run(run()) is False
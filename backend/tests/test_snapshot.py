@@ -0,0 +1,80 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app import app
+from auth import create_access_token
+from routers import v2
+from services import snapshot
+from services.docker_client import HOSTS
+
+
+def _detail_caches(stack_id):
+    return [
+        stack_id in cache for cache in (
+            snapshot._STACKS_DETAIL, snapshot._STACKS_DETAIL_TS, snapshot._STACKS_DETAIL_ETAG,
+            snapshot._STACKS_DETAIL_BODY, snapshot._STACKS_DETAIL_INVALIDATED,
+        )
+    ]
+
+
+def test_stack_without_containers_leaves_the_detail_caches(registry):
+    containers = [
+        c for c in HOSTS["b"].containers.list(all=True)
+        if c.labels["com.docker.compose.project"] == "stack1"
+    ]
+    with snapshot._CONTAINERS_LOCK:
+        for c in containers:
+            snapshot._index_put(c)
+
+    detail = asyncio.run(snapshot.get_detail_snapshot("b:stack1"))
+    assert len(detail["containers"]) == len(containers)
+    assert snapshot.get_detail_body("b:stack1")
+    snapshot._STACKS_DETAIL_INVALIDATED["b:stack1"] = 1.0
+
+    with snapshot._CONTAINERS_LOCK:
+        for c in containers[:-1]:
+            snapshot._index_drop(c.id)
+    assert all(_detail_caches("b:stack1"))
+
+    with snapshot._CONTAINERS_LOCK:
+        snapshot._index_drop(containers[-1].id)
+    assert not any(_detail_caches("b:stack1"))
+    assert asyncio.run(snapshot.get_detail_snapshot("b:stack1")) is None
+
+
+def test_detail_of_unknown_stack_is_none_even_if_cached(registry):
+    snapshot._STACKS_DETAIL["b:gone"] = {"stack_id": "b:gone", "containers": []}
+    snapshot._STACKS_DETAIL_TS["b:gone"] = 1e12
+
+    assert asyncio.run(snapshot.get_detail_snapshot("b:gone")) is None
+
+
+def test_detail_built_for_a_stack_emptied_meanwhile_is_not_cached(registry):
+    assert snapshot._store_detail({"stack_id": "b:stack2", "containers": []}, 1.0) is False
+    assert not any(_detail_caches("b:stack2"))
+
+
+def test_stack_emptied_right_after_the_build_is_a_404(registry, monkeypatch):
+    containers = [
+        c for c in HOSTS["b"].containers.list(all=True)
+        if c.labels["com.docker.compose.project"] == "stack1"
+    ]
+    with snapshot._CONTAINERS_LOCK:
+        for c in containers:
+            snapshot._index_put(c)
+    build = snapshot.get_detail_snapshot
+
+    async def build_then_empty(stack_id):
+        detail = await build(stack_id)
+        # los contenedores se borran entre el build y la lectura del body
+        with snapshot._CONTAINERS_LOCK:
+            for c in containers:
+                snapshot._index_drop(c.id)
+        return detail
+
+    monkeypatch.setattr(v2, "get_detail_snapshot", build_then_empty)
+    client = TestClient(app, headers={"Authorization": "Bearer " + create_access_token({"sub": "admin"})})
+
+    r = client.get("/api/v2/stacks/b:stack1")
+    assert r.status_code == 404
@@ -0,0 +1,109 @@
+import random
+import threading
+
+import pytest
+
+from services.metrics import ContainerMetrics
+
+GIB = 1024 ** 3
+
+
+@pytest.fixture
+def agg(collector, monkeypatch):
+    monkeypatch.setattr(collector, "record_sample", lambda cid, m: None)
+    return collector
+
+
+def _own(agg, cid, stack_id):
+    """
+    Registra un stream "vigente" (sin thread) para poder guardar samples.
+    """
+    stop = threading.Event()
+    agg._STREAMS[cid] = stop
+    agg._set_stack(cid, stack_id)
+    return stop
+
+
+def _sample(cpu=None, used=None, limit=None):
+    return ContainerMetrics(ts=0.0, cpu=cpu, mem_used=used, mem_limit=limit)
+
+
+def _recomputed(agg, stack_id):
+    """
+    El agregado recorriendo los últimos samples, como se hacía antes.
+    """
+    latest = [m for cid, m in agg._LATEST.items() if agg._STACK_OF.get(cid) == stack_id]
+    cpus = [m.cpu for m in latest if m.cpu is not None]
+    if not latest:
+        return (None, 0, 0)
+    return (
+        sum(cpus) / len(cpus) if cpus else None,
+        sum(m.mem_used or 0 for m in latest),
+        max((m.mem_limit or 0 for m in latest), default=0),
+    )
+
+
+def test_aggregate_of_the_latest_samples(agg):
+    a, b = _own(agg, "a", "web"), _own(agg, "b", "web")
+    agg._store_sample("a", a, _sample(0.5, 100, 2 * GIB))
+    agg._store_sample("b", b, _sample(None, 50, 2 * GIB))  # primer sample: sin CPU todavía
+
+    assert agg.get_stack_aggregate("web") == (0.5, 150, 2 * GIB)
+
+    # un sample nuevo reemplaza el aporte anterior, no se suma
+    agg._store_sample("a", a, _sample(0.25, 80, 2 * GIB))
+    agg._store_sample("b", b, _sample(0.75, 60, 4 * GIB))
+    assert agg.get_stack_aggregate("web") == (0.5, 140, 4 * GIB)
+
+
+def test_relabel_moves_the_contribution(agg):
+    a, b = _own(agg, "a", "web"), _own(agg, "b", "web")
+    agg._store_sample("a", a, _sample(0.5, 100, GIB))
+    agg._store_sample("b", b, _sample(0.1, 10, GIB))
+
+    agg._set_stack("b", "worker")
+
+    assert agg.get_stack_aggregate("web") == (0.5, 100, GIB)
+    assert agg.get_stack_aggregate("worker") == (0.1, 10, GIB)
+
+
+def test_stopping_the_last_container_forgets_the_stack(agg):
+    a = _own(agg, "a", "web")
+    agg._store_sample("a", a, _sample(0.5, 100, GIB))
+
+    agg.stop_stream("a")
+
+    assert agg.get_stack_aggregate("web") == (None, 0, 0)
+    assert "web" not in agg._STACK_AGG
+    # un sample tardío del stream ya parado no vuelve a sumar
+    assert agg._store_sample("a", a, _sample(0.5, 100, GIB)) is False
+    assert agg.get_stack_aggregate("web") == (None, 0, 0)
+
+
+def test_incremental_aggregate_matches_a_full_recompute(agg):
+    rand = random.Random(7)
+    stacks = ["web", "db", "jobs"]
+    owners = {}
+    for _ in range(2000):
+        cid = f"c{rand.randrange(30)}"
+        op = rand.random()
+        if op < 0.7:
+            if cid not in owners:
+                owners[cid] = _own(agg, cid, rand.choice(stacks))
+            agg._store_sample(cid, owners[cid], _sample(
+                rand.choice([None, rand.random() * 2]),
+                rand.randrange(1, 1 << 30),
+                rand.choice([GIB, 2 * GIB, 8 * GIB]),
+            ))
+        elif op < 0.85:
+            if cid in owners:
+                agg._set_stack(cid, rand.choice(stacks))
+        else:
+            agg.stop_stream(cid)
+            owners.pop(cid, None)
+
+    for stack_id in stacks:
+        cpu, used, limit = agg.get_stack_aggregate(stack_id)
+        expected = _recomputed(agg, stack_id)
+        assert (used, limit) == expected[1:]
+        assert cpu == pytest.approx(expected[0])
@@ -0,0 +1,61 @@
+import time
+
+from services import stats_collector
+from services.docker_client import HOSTS
+
+
+def _wait_until(pred, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if pred():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_stream_that_ends_on_its_own_leaves_no_stack_contribution(engines, collector):
+    container = HOSTS["b"].containers.list()[0]
+    fake = engines["b"].find(container.id)
+    stack_id = "b:" + fake.stack
+    stats_collector.sync_container(container)
+    try:
+        assert _wait_until(lambda: container.id in stats_collector._CONTRIB)
+        assert stats_collector._STACK_OF[container.id] == stack_id
+        assert stats_collector.get_stack_aggregate(stack_id)[1] > 0
+
+        # el contenedor para: el daemon cierra el stream, nadie llama stop_stream
+        engines["b"].set_running(fake, False)
+        assert _wait_until(lambda: container.id not in stats_collector._STREAMS)
+
+        assert container.id not in stats_collector._STACK_OF
+        assert container.id not in stats_collector._CONTRIB
+        assert stats_collector.get_stack_aggregate(stack_id) == (None, 0, 0)
+    finally:
+        engines["b"].set_running(fake, True)
+        stats_collector.stop_stream(container.id)
+
+
+def test_stream_cut_while_running_is_reopened(engines, collector, monkeypatch):
+    from services.perf import get_perf
+
+    monkeypatch.setattr(stats_collector, "STREAM_RETRY_MIN_SEC", 0.05)
+    container = HOSTS["b"].containers.list()[0]
+    stats_collector.sync_container(container)
+    try:
+        assert _wait_until(lambda: container.id in stats_collector._LATEST)
+        stop = stats_collector._STREAMS[container.id]
+        retries = get_perf()["counters"].get("docker.stats.stream_retry", 0)
+
+        # el daemon corta el stream pero el contenedor sigue running
+        engines["b"].cut_stats_streams([container.id])
+        assert _wait_until(
+            lambda: get_perf()["counters"].get("docker.stats.stream_retry", 0) > retries
+        )
+        last = stats_collector._LATEST[container.id]
+        assert _wait_until(lambda: stats_collector._LATEST.get(container.id) is not last)
+
+        # mismo dueño, sin pasar por stop_stream / sync_container
+        assert stats_collector._STREAMS[container.id] is stop
+        assert container.id in stats_collector._CONTRIB
+    finally:
+        stats_collector.stop_stream(container.id)
@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+from fastapi import WebSocketDisconnect
+
+from services import snapshot
+from services.stream import serve_stream
+
+
+class _FakeWebSocket:
+    """
+    Lo que serve_stream usa de un WebSocket. Con `gate` cerrado, send_json
+    se queda esperando: un cliente lento.
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self._closed = asyncio.Event()
+
+    async def send_json(self, data):
+        await self.gate.wait()
+        self.sent.append(data)
+
+    async def receive_text(self):
+        await self._closed.wait()
+        raise WebSocketDisconnect()
+
+    def close(self):
+        self._closed.set()
+
+
+def _stack(name, cpu="1.0%"):
+    return {"stack_id": name, "cpu_avg": cpu}
+
+
+def _container(cid, stack, status="running"):
+    return {"id": cid, "stack_id": stack, "status": status}
+
+
+def _state(stacks, containers=()):
+    return {
+        "stacks": {s["stack_id"]: s for s in stacks},
+        "containers": {c["id"]: c for c in containers},
+    }
+
+
+async def _publish(state):
+    # lo que hace _publish_stream_state con un estado ya armado
+    cond = snapshot._get_stream_changed()
+    async with cond:
+        snapshot._STREAM_STATE = state
+        snapshot._STREAM_GENERATION += 1
+        cond.notify_all()
+
+
+async def _until(pred, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not pred():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def stream_state(monkeypatch):
+    monkeypatch.setattr(snapshot, "_STREAM_STATE", _state([]))
+    monkeypatch.setattr(snapshot, "_STREAM_GENERATION", 0)
+    monkeypatch.setattr(snapshot, "_STREAM_SUBSCRIBERS", 0)
+    # la Condition se ata al loop: una nueva por test
+    monkeypatch.setattr(snapshot, "_stream_changed", None)
+
+    async def publish_nothing():
+        pass
+
+    # el estado lo publica el test, no el registro
+    monkeypatch.setattr(snapshot, "_publish_stream_state", publish_nothing)
+
+
+def test_first_message_is_the_full_snapshot(stream_state):
+    async def run():
+        await _publish(_state([_stack("a"), _stack("b")], [_container("c1", "a")]))
+        ws = _FakeWebSocket()
+        task = asyncio.create_task(serve_stream(ws))
+        await _until(lambda: ws.sent)
+        ws.close()
+        await task
+        return ws.sent
+
+    sent = asyncio.run(run())
+    assert sent == [{
+        "type": "snapshot",
+        "generation": 1,
+        "stacks": [_stack("a"), _stack("b")],
+        "containers": [_container("c1", "a")],
+    }]
+
+
+def test_later_messages_only_carry_changes(stream_state):
+    async def run():
+        await _publish(_state(
+            [_stack("a"), _stack("b"), _stack("c")],
+            [_container("c1", "a"), _container("c2", "b")],
+        ))
+        ws = _FakeWebSocket()
+        task = asyncio.create_task(serve_stream(ws))
+        await _until(lambda: ws.sent)
+
+        await _publish(_state(
+            [_stack("a", cpu="9.0%"), _stack("c")],
+            [_container("c1", "a", status="exited")],
+        ))
+        await _until(lambda: len(ws.sent) == 2)
+        # una generación sin cambios no manda nada
+        await _publish(_state(
+            [_stack("a", cpu="9.0%"), _stack("c")],
+            [_container("c1", "a", status="exited")],
+        ))
+        await asyncio.sleep(0.05)
+        ws.close()
+        await task
+        return ws.sent
+
+    sent = asyncio.run(run())
+    assert len(sent) == 2
+    assert sent[1] == {
+        "type": "delta",
+        "generation": 2,
+        "stacks": {"changed": [_stack("a", cpu="9.0%")], "removed": ["b"]},
+        "containers": {"changed": [_container("c1", "a", status="exited")], "removed": ["c2"]},
+    }
+
+
+def test_slow_client_gets_one_coalesced_delta(stream_state):
+    async def run():
+        await _publish(_state([_stack("a"), _stack("b")]))
+        ws = _FakeWebSocket()
+        ws.gate.clear()
+        task = asyncio.create_task(serve_stream(ws))
+        await asyncio.sleep(0.05)  # bloqueado mandando el snapshot
+
+        await _publish(_state([_stack("a", cpu="5.0%"), _stack("b"), _stack("tmp")]))
+        await _publish(_state([_stack("a", cpu="7.0%"), _stack("b"), _stack("tmp")]))
+        await _publish(_state([_stack("a", cpu="7.0%"), _stack("b")]))
+
+        ws.gate.set()
+        await _until(lambda: len(ws.sent) == 2)
+        await asyncio.sleep(0.05)
+        ws.close()
+        await task
+        return ws.sent
+
+    sent = asyncio.run(run())
+    assert [m["type"] for m in sent] == ["snapshot", "delta"]
+    assert sent[0]["generation"] == 1
+    # sólo el neto entre lo enviado y la última generación: "tmp" nunca aparece
+    assert sent[1] == {
+        "type": "delta",
+        "generation": 4,
+        "stacks": {"changed": [_stack("a", cpu="7.0%")], "removed": []},
+        "containers": {"changed": [], "removed": []},
+    }
@@ -0,0 +1,122 @@
+import time
+
+import pytest
+
+from services import timeseries
+from services.metrics import ContainerMetrics
+
+
+def _sample(ts):
+    return ContainerMetrics(ts=ts, cpu=0.5, mem_used=1024, net_rx=10, net_tx=20)
+
+
+def test_late_sample_after_drop_does_not_recreate_the_series():
+    cid = "d" * 64
+    now = time.time()
+    timeseries.record_sample(cid, _sample(now))
+    assert timeseries.query_series(cid, 60, 0, now) is not None
+
+    timeseries.drop_series(cid)
+    # el stream todavía no vio su stop: un último sample
+    timeseries.record_sample(cid, _sample(now + 1))
+
+    assert cid not in timeseries._SERIES
+    assert timeseries.query_series(cid, 60, 0, now + 1) is None
+
+
+def test_retain_forgets_the_others_for_good():
+    keep, gone = "e" * 64, "f" * 64
+    now = time.time()
+    for cid in (keep, gone):
+        timeseries.record_sample(cid, _sample(now))
+
+    timeseries.retain_series([keep] + [cid for cid in timeseries._SERIES if cid != gone])
+    timeseries.record_sample(gone, _sample(now + 1))
+    timeseries.record_sample(keep, _sample(now + 1))
+
+    assert gone not in timeseries._SERIES
+    assert keep in timeseries._SERIES
+
+
+def test_tombstones_are_bounded(monkeypatch):
+    monkeypatch.setattr(timeseries, "_DROPPED", {})
+    monkeypatch.setattr(timeseries, "_DROPPED_MAX", 3)
+    for i in range(5):
+        timeseries.drop_series(f"{i:064x}")
+
+    assert list(timeseries._DROPPED) == [f"{i:064x}" for i in (2, 3, 4)]
+
+
+def test_ring_averages_within_a_bucket_and_leaves_gaps_empty():
+    ring = timeseries._Ring(step=2, size=5)
+    ring.add(100.0, {"cpu_percent": 10.0})
+    ring.add(101.5, {"cpu_percent": 30.0, "mem_used_bytes": 7.0})
+    ring.add(106.0, {"cpu_percent": 50.0})   # buckets 51 y 52 sin samples
+    ring.add(99.0, {"cpu_percent": 90.0})    # fuera de orden: se descarta
+
+    buckets, cols = ring.read(0)
+    assert buckets == [50, 51, 52, 53]
+    assert cols["cpu_percent"] == [20.0, None, None, 50.0]
+    assert cols["mem_used_bytes"] == [7.0, None, None, None]
+
+
+def test_ring_wraps_and_keeps_only_the_last_size_buckets():
+    ring = timeseries._Ring(step=1, size=4)
+    for t in range(10):
+        ring.add(float(t), {"cpu_percent": float(t)})
+
+    buckets, cols = ring.read(0)
+    assert buckets == [6, 7, 8, 9]
+    assert cols["cpu_percent"] == [6.0, 7.0, 8.0, 9.0]
+
+    # un salto más largo que el ring lo vacía entero salvo el bucket nuevo
+    ring.add(100.0, {"cpu_percent": 1.0})
+    assert ring.read(0) == ([97, 98, 99, 100], {
+        "cpu_percent": [None, None, None, 1.0],
+        "mem_used_bytes": [None] * 4, "net_rx_rate": [None] * 4, "net_tx_rate": [None] * 4,
+    })
+
+
+def test_query_uses_the_finest_resolution_that_covers_the_range():
+    cid = "a1" * 32
+    start = 1_699_999_920.0  # alineado a 120 s
+    # 2 horas de samples cada 2 s: CPU = minuto del sample
+    for i in range(3600):
+        ts = start + 2 * i
+        timeseries.record_sample(cid, ContainerMetrics(ts=ts, cpu=((ts - start) // 60) / 100))
+    now = start + 2 * 3599
+
+    try:
+        fine = timeseries.query_series(cid, 600, 0, now)
+        assert fine["step"] == 2 and len(fine["ts"]) == 300
+
+        hour = timeseries.query_series(cid, 3600, 0, now)
+        assert hour["step"] == 30 and len(hour["ts"]) == 120
+        # un bucket de 30 s promedia sus 15 samples de 2 s
+        assert hour["cpu_percent"][-1] == 119.0
+
+        week = timeseries.query_series(cid, 2 * 86400, 0, now)
+        assert week["step"] == 300
+        assert week["ts"][0] % 300 == 0
+
+        # step más grueso que el ring: se promedian grupos alineados
+        coarse = timeseries.query_series(cid, 3600, 120, now)
+        assert coarse["step"] == 120
+        assert all(ts % 120 == 0 for ts in coarse["ts"])
+        assert coarse["cpu_percent"][-1] == pytest.approx(sum(hour["cpu_percent"][-4:]) / 4)
+        assert len(coarse["ts"]) == 30
+    finally:
+        timeseries.drop_series(cid)
+
+
+def test_network_counters_become_rates_and_a_reset_has_none():
+    cid = "b2" * 32
+    base = 1_700_000_000.0
+    try:
+        for ts, rx in ((base, 1000), (base + 2, 3000), (base + 4, 10)):
+            timeseries.record_sample(cid, ContainerMetrics(ts=ts, net_rx=rx, net_tx=0))
+        out = timeseries.query_series(cid, 60, 0, base + 4)
+        # primer sample sin tasa, después 1000 B/s, y el contador que baja (reinicio) sin tasa
+        assert out["net_rx_rate"][-3:] == [None, 1000.0, None]
+    finally:
+        timeseries.drop_series(cid)
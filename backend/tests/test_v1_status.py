@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import app as app_module
+
+
+def _created(ago: timedelta) -> SimpleNamespace:
+    ts = (datetime.now(timezone.utc) - ago).strftime("%Y-%m-%dT%H:%M:%S.%f") + "123Z"
+    return SimpleNamespace(attrs={"Created": ts})
+
+
+@pytest.mark.parametrize("ago, expected", [
+    (timedelta(seconds=30), "30 seconds ago"),
+    (timedelta(minutes=1, seconds=10), "About a minute ago"),
+    (timedelta(minutes=5), "5 minutes ago"),
+    (timedelta(minutes=50), "50 minutes ago"),
+    (timedelta(hours=1, minutes=10), "About an hour ago"),
+    (timedelta(hours=2, minutes=40), "3 hours ago"),
+    (timedelta(days=3), "3 days ago"),
+    (timedelta(days=20), "2 weeks ago"),
+    (timedelta(days=100), "3 months ago"),
+])
+def test_uptime_keeps_the_docker_ps_running_for_text(ago, expected):
+    assert app_module._v1_running_for(_created(ago)) == expected
+
+
+def test_uptime_without_created_is_na():
+    assert app_module._v1_running_for(SimpleNamespace(attrs={})) == "N/A"
+
+
+@pytest.mark.parametrize("error", [
+    requests.exceptions.ConnectionError("daemon unreachable"),
+    requests.exceptions.ReadTimeout("read timed out"),
+])
+def test_unreachable_daemon_falls_back_to_the_mock(monkeypatch, error):
+    def fail(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(app_module, "docker_client", SimpleNamespace(containers=SimpleNamespace(list=fail)))
+
+    statuses = app_module.get_docker_statuses()
+
+    assert [s["id"] for s in statuses] == ["mock1", "mock2", "mock3", "mock4"]
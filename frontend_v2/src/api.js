@@ -95,6 +95,81 @@ export const restartContainer = (containerId) =>
 export const getContainerLogs = (containerId, lines) =>
   apiClient.get(`/api/containers/${containerId}/logs?lines=${lines}`);
 
+// GET /api/v2/containers/:id/logs/stream -> NDJSON {ts, cursor, line} per line.
+// With follow the response stays open; onLines gets each batch as it
+// arrives. Pass the last entry's cursor as `since` to resume a dropped
+// stream without repeating lines. Abort through `signal`.
+export const streamContainerLogs = async (
+  containerId,
+  { tail = 100, since, follow = true, signal, onLines }
+) => {
+  const params = new URLSearchParams({ tail: String(tail), follow: String(follow) });
+  if (since) params.set("since", since);
+  const res = await fetch(
+    `/api/v2/containers/${encodeURIComponent(containerId)}/logs/stream?${params}`,
+    { headers: authHeaders(), signal }
+  );
+  if (res.status === 401 || res.status === 403) {
+    localStorage.removeItem("token");
+    notifyAuthError();
+  }
+  if (!res.ok) {
+    throw new Error(`logs stream failed: ${res.status}`);
+  }
+
+  await readNdjson(res, onLines);
+};
+
+// Reads an NDJSON response body, calling onBatch with the entries parsed
+// from each chunk as it arrives.
+async function readNdjson(res, onBatch) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffered += decoder.decode(value, { stream: true });
+    const parts = buffered.split("\n");
+    buffered = parts.pop();
+    const entries = [];
+    for (const part of parts) {
+      if (!part) continue;
+      try {
+        entries.push(JSON.parse(part));
+      } catch (_) {
+        // ignore malformed lines
+      }
+    }
+    if (entries.length) onBatch(entries);
+  }
+}
+
+// POST /api/v2/stacks/:id/actions/:action -> NDJSON progress
+// ({type:"plan"}, {type:"started"}, {type:"done"} per container, {type:"summary"}).
+// onEvent gets each event; resolves with the summary.
+export const runStackAction = async (stackId, action, onEvent) => {
+  const res = await fetch(
+    `/api/v2/stacks/${encodeURIComponent(stackId)}/actions/${action}`,
+    { method: "POST", headers: authHeaders() }
+  );
+  if (res.status === 401 || res.status === 403) {
+    localStorage.removeItem("token");
+    notifyAuthError();
+  }
+  if (!res.ok) {
+    throw new Error(`${action} failed: ${res.status}`);
+  }
+  let summary = null;
+  await readNdjson(res, (events) => {
+    events.forEach((ev) => {
+      if (ev.type === "summary") summary = ev;
+      if (onEvent) onEvent(ev);
+    });
+  });
+  return summary;
+};
+
 export const runContainerCommand = (containerId, command) =>
   apiClient.post(`/api/containers/${containerId}/exec`, { command });
 
@@ -113,4 +188,52 @@ export const getStackDetail = async (stackId) => {
   return res.data;
 };
 
+// GET /api/v2/stack-details[?stacks=a,b] -> { stacks: [detail, ...] }
+// One request for every stack's detail (instead of one per stack).
+export const listStackDetails = async (stackIds) => {
+  const query =
+    stackIds && stackIds.length
+      ? `?stacks=${stackIds.map(encodeURIComponent).join(",")}`
+      : "";
+  const res = await apiClient.get(`/api/v2/stack-details${query}`);
+  return res.data.stacks || [];
+};
+
+// WS /api/v2/stream?token=... -> one {type:"snapshot"} then {type:"delta"}
+// messages with only changed/removed stacks and containers.
+// (browsers can't send an Authorization header on a WebSocket)
+export const openStackStream = (onMessage) => {
+  const token = localStorage.getItem("token") || "";
+  const proto = window.location.protocol === "https:" ? "wss" : "ws";
+  const ws = new WebSocket(
+    `${proto}://${window.location.host}/api/v2/stream?token=${encodeURIComponent(token)}`
+  );
+  ws.onmessage = (ev) => {
+    try {
+      onMessage(JSON.parse(ev.data));
+    } catch (_) {
+      // ignore malformed frames
+    }
+  };
+  return ws;
+};
+
+// WS /api/v2/containers/:id/exec?token=... -> interactive TTY session.
+// Send {type:"input", data} / {type:"resize", cols, rows}; receive
+// {type:"output", data}, {type:"exit", code} and {type:"error", message}.
+export const openExecSession = (containerId, { cols, rows } = {}) => {
+  const token = localStorage.getItem("token") || "";
+  const proto = window.location.protocol === "https:" ? "wss" : "ws";
+  const params = new URLSearchParams({ token });
+  if (cols && rows) {
+    params.set("cols", String(cols));
+    params.set("rows", String(rows));
+  }
+  return new WebSocket(
+    `${proto}://${window.location.host}/api/v2/containers/${encodeURIComponent(
+      containerId
+    )}/exec?${params}`
+  );
+};
+
 export default apiClient;
@@ -3,7 +3,10 @@ import React, { useEffect, useState, useCallback } from "react";
 import {
   listStacks,
   getStackDetail,
+  listStackDetails,
+  openStackStream,
   restartContainer,
+  runStackAction,
   startContainer,
   stopContainer,
   registerAuthErrorCallback, // <-- new import
@@ -37,6 +40,12 @@ export default function DashboardV2() {
   // runtime info: how many containers are running / stopped per stack
   const [stackRuntimeMap, setStackRuntimeMap] = useState({});
 
+  // live state pushed by /api/v2/stream: { stacks: {id: summary}, containers: {id: container} }
+  const [live, setLive] = useState(null);
+
+  // stack-wide action in progress: { action, done, total, failed } | null
+  const [stackAction, setStackAction] = useState(null);
+
   /**
    * Centralized logout logic.
    * We use this both when the user clicks "Logout" AND when the backend
@@ -81,18 +90,14 @@ export default function DashboardV2() {
         setStacks(stacksArr);
         setSelectedStackId((prev) => prev || stacksArr[0]?.stack_id || null);
 
-        // 2. for each stack, also fetch detail so we can count running/stopped
-        const detailsArr = await Promise.all(
-          stacksArr.map((st) =>
-            getStackDetail(st.stack_id).catch(() => null)
-          )
-        );
+        // 2. fetch every stack's detail in ONE request so we can count running/stopped
+        const detailsArr = await listStackDetails().catch(() => []);
 
         // 3. build a runtime map { stackId: { runCount, stopCount } }
         const map = {};
-        detailsArr.forEach((detail, idx) => {
+        detailsArr.forEach((detail) => {
           if (!detail) return;
-          const sid = stacksArr[idx].stack_id;
+          const sid = detail.stack_id;
           const containers = detail.containers || [];
 
           let runCount = 0;
@@ -183,6 +188,102 @@ export default function DashboardV2() {
 
 
 
+  // LIVE UPDATES over /api/v2/stream: full snapshot once, then deltas.
+  // Falls back silently to the REST loads above if the socket can't connect.
+  useEffect(() => {
+    if (!token) return;
+    let closed = false;
+    let ws = null;
+    let retryTimer = null;
+    let current = { stacks: {}, containers: {} };
+
+    function applySection(prevMap, section, key) {
+      const next = { ...prevMap };
+      (section?.removed || []).forEach((id) => {
+        delete next[id];
+      });
+      (section?.changed || []).forEach((item) => {
+        next[item[key]] = item;
+      });
+      return next;
+    }
+
+    function onMessage(msg) {
+      if (msg.type === "snapshot") {
+        const stacksMap = {};
+        (msg.stacks || []).forEach((st) => {
+          stacksMap[st.stack_id] = st;
+        });
+        const containersMap = {};
+        (msg.containers || []).forEach((c) => {
+          containersMap[c.id] = c;
+        });
+        current = { stacks: stacksMap, containers: containersMap };
+      } else if (msg.type === "delta") {
+        current = {
+          stacks: applySection(current.stacks, msg.stacks, "stack_id"),
+          containers: applySection(current.containers, msg.containers, "id"),
+        };
+      } else {
+        return;
+      }
+      setLive(current);
+    }
+
+    function connect() {
+      if (closed) return;
+      ws = openStackStream(onMessage);
+      ws.onclose = () => {
+        if (!closed) retryTimer = setTimeout(connect, 3000);
+      };
+    }
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      if (ws) ws.close();
+    };
+  }, [token]);
+
+  // derive stacks list + runtime counts from the live state
+  useEffect(() => {
+    if (!live) return;
+    setStacks(Object.values(live.stacks));
+
+    const map = {};
+    Object.values(live.containers).forEach((c) => {
+      const entry = map[c.stack_id] || { runCount: 0, stopCount: 0 };
+      if ((c.state || "").toLowerCase() === "running") {
+        entry.runCount += 1;
+      } else {
+        entry.stopCount += 1;
+      }
+      map[c.stack_id] = entry;
+    });
+    setStackRuntimeMap(map);
+  }, [live]);
+
+  // derive the selected stack's detail from the live state
+  useEffect(() => {
+    if (!live || !selectedStackId) return;
+    const st = live.stacks[selectedStackId];
+    if (!st) return;
+    setStackDetail({
+      stack_id: st.stack_id,
+      display_name: st.display_name,
+      summary: {
+        containers_count: st.containers_count,
+        cpu_avg: st.cpu_avg,
+        ram_total_used: st.ram_total_used,
+        ram_host_total: st.ram_host_total,
+      },
+      containers: Object.values(live.containers).filter(
+        (c) => c.stack_id === selectedStackId
+      ),
+    });
+  }, [live, selectedStackId]);
+
   // modal helpers
   const openLogs = useCallback((cid) => setSelectedContainerId(cid), []);
   const openShell = useCallback((cid) => setTerminalContainerId(cid), []);
@@ -231,6 +332,38 @@ export default function DashboardV2() {
     [selectedStackId]
   );
 
+  // restart the whole stack (dependencies first), with per-container progress
+  const doStackRestart = useCallback(async () => {
+    if (!selectedStackId || stackAction) return;
+    setStackAction({ action: "restart", done: 0, total: 0, failed: 0 });
+    try {
+      const summary = await runStackAction(selectedStackId, "restart", (ev) => {
+        if (ev.type === "plan") {
+          const total = ev.levels.reduce((n, level) => n + level.length, 0);
+          setStackAction((prev) => prev && { ...prev, total });
+        } else if (ev.type === "done") {
+          setStackAction(
+            (prev) =>
+              prev && {
+                ...prev,
+                done: prev.done + 1,
+                failed: prev.failed + (ev.ok ? 0 : 1),
+              }
+          );
+        }
+      });
+      if (summary && summary.failed) {
+        setError(`${summary.failed} container(s) failed to restart`);
+      }
+      const data = await getStackDetail(selectedStackId);
+      setStackDetail(data);
+    } catch (e) {
+      alert(e?.message || String(e));
+    } finally {
+      setStackAction(null);
+    }
+  }, [selectedStackId, stackAction]);
+
   /**
    * If there is no token, we don't render the dashboard at all.
    * We render the LoginForm instead.
@@ -320,8 +453,12 @@ export default function DashboardV2() {
                   padding: "6px 8px",
                   fontSize: 11,
                 }}
+                onClick={doStackRestart}
+                disabled={!selectedStackId || !!stackAction}
               >
-                🔄 Restart stack
+                {stackAction
+                  ? `🔄 Restarting ${stackAction.done}/${stackAction.total || "…"}`
+                  : "🔄 Restart stack"}
               </button>
               <button
                 style={{
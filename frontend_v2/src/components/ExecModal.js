@@ -7,7 +7,7 @@ import React, {
   useCallback,
   useMemo,
 } from "react";
-import { runContainerCommand } from "../api";
+import { openExecSession } from "../api";
 import { FaTerminal, FaSearch, FaCopy } from "react-icons/fa";
 
 // escapa texto para regex segura
@@ -15,11 +15,41 @@ function escapeRegex(str) {
   return str.replace(/[.*+?^${}()|[\]\\]/g, "\\$&");
 }
 
+// salida de un TTY -> texto plano: sin secuencias ANSI (colores, cursor,
+// títulos), \r\n como salto de línea, \r suelto pisa la línea y \b borra
+// eslint-disable-next-line no-control-regex
+const ANSI_RE = /\x1b\[[0-9;?]*[ -/]*[@-~]|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)|\x1b[()][0-9A-Za-z]|\x1b[=>78]/g;
+
+function ttyToText(raw) {
+  return raw
+    .replace(ANSI_RE, "")
+    .replace(/\r+\n/g, "\n")
+    .split("\n")
+    .map((line) => {
+      const afterCr = line.slice(line.lastIndexOf("\r") + 1);
+      if (afterCr.indexOf("\b") === -1) return afterCr;
+      const out = [];
+      for (const ch of afterCr) {
+        if (ch === "\b") out.pop();
+        else out.push(ch);
+      }
+      return out.join("");
+    })
+    .join("\n");
+}
+
+// cuánto de la salida cruda se conserva en memoria
+const MAX_OUTPUT_CHARS = 200000;
+
 export default function ExecModal({ containerId, onClose }) {
   // ===== estado terminal =====
-  const [history, setHistory] = useState([]);
+  // una sesión exec (shell con TTY) por WebSocket mientras el modal esté abierto
+  const [output, setOutput] = useState("");
+  const [session, setSession] = useState("connecting"); // connecting | open | closed
+  const [sessionNonce, setSessionNonce] = useState(0);
   const [currentCmd, setCurrentCmd] = useState("");
   const [error, setError] = useState("");
+  const wsRef = useRef(null);
 
   // flash al copiar todo el buffer
   const [flashCopy, setFlashCopy] = useState(false);
@@ -178,48 +208,22 @@ export default function ExecModal({ containerId, onClose }) {
   }, [onClose]);
 
   // ===== buffer terminal renderizable =====
-  // history: [{ command, stdout, stderr, returncode }]
+  // output: salida cruda del TTY (el shell ya hace eco de lo que se tipea)
   // terminalLines: [{ text, color, small }]
   const terminalLines = useMemo(() => {
-    const lines = [];
+    const lines = ttyToText(output)
+      .split("\n")
+      .map((text) => ({ text, color: "#0f0", small: false }));
 
-    history.forEach((item) => {
-      // comando
+    if (session === "connecting") {
+      lines.push({ text: "connecting…", color: "#888", small: true });
+    } else if (session === "closed") {
       lines.push({
-        text: `$ ${item.command}`,
-        color: "#0ff", // cyan
-        small: false,
-      });
-
-      // stdout
-      if (item.stdout) {
-        item.stdout.split("\n").forEach((l) => {
-          lines.push({
-            text: l,
-            color: "#0f0",
-            small: false,
-          });
-        });
-      }
-
-      // stderr
-      if (item.stderr) {
-        item.stderr.split("\n").forEach((l) => {
-          lines.push({
-            text: l,
-            color: "#f00",
-            small: false,
-          });
-        });
-      }
-
-      // exit code
-      lines.push({
-        text: `exit code: ${item.returncode}`,
+        text: "[session closed — press Enter to open a new one]",
         color: "#888",
         small: true,
       });
-    });
+    }
 
     if (error) {
       lines.push({
@@ -230,7 +234,7 @@ export default function ExecModal({ containerId, onClose }) {
     }
 
     return lines;
-  }, [history, error]);
+  }, [output, session, error]);
 
   // texto plano completo (para copiar)
   const fullPlainText = useMemo(
@@ -251,14 +255,84 @@ export default function ExecModal({ containerId, onClose }) {
     }
   };
 
-  // ejecutar comando dentro del contenedor
-  const executeCommand = useCallback(async () => {
-    const cmd = currentCmd.trim();
-    if (!cmd) return;
+  // tamaño del área de salida en celdas (para el resize del TTY)
+  const terminalSize = useCallback(() => {
+    const el = outputRef.current;
+    if (!el) return {};
+    return {
+      cols: Math.max(20, Math.floor(el.clientWidth / (fontMetrics.normal * 0.6))),
+      rows: Math.max(5, Math.floor(el.clientHeight / fontMetrics.lh)),
+    };
+  }, [fontMetrics]);
+
+  // ===== sesión exec =====
+  useEffect(() => {
+    setSession("connecting");
+    setError("");
 
-    // comando local especial: clear
-    if (cmd === "clear") {
-      setHistory([]);
+    const ws = openExecSession(containerId, terminalSize());
+    wsRef.current = ws;
+
+    ws.onopen = () => setSession("open");
+    ws.onmessage = (ev) => {
+      let msg;
+      try {
+        msg = JSON.parse(ev.data);
+      } catch (_) {
+        return;
+      }
+      stickToBottomRef.current = true;
+      if (msg.type === "output") {
+        setOutput((prev) => {
+          const next = prev + msg.data;
+          return next.length > MAX_OUTPUT_CHARS
+            ? next.slice(next.length - MAX_OUTPUT_CHARS)
+            : next;
+        });
+      } else if (msg.type === "exit") {
+        setOutput((prev) => `${prev}\nexit code: ${msg.code}\n`);
+      } else if (msg.type === "error") {
+        setError(msg.message || "Exec session failed");
+      }
+    };
+    ws.onerror = () => setError("Exec session failed");
+    ws.onclose = () => {
+      stickToBottomRef.current = true;
+      setSession("closed");
+    };
+
+    return () => {
+      ws.onclose = null;
+      ws.close();
+      wsRef.current = null;
+    };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [containerId, sessionNonce]);
+
+  // avisar al TTY cuando cambia el tamaño de la ventana o de la fuente
+  useEffect(() => {
+    const ws = wsRef.current;
+    if (session !== "open" || !ws) return;
+    const { cols, rows } = terminalSize();
+    if (cols && rows) {
+      ws.send(JSON.stringify({ type: "resize", cols, rows }));
+    }
+  }, [session, size, terminalSize]);
+
+  const sendInput = useCallback((data) => {
+    const ws = wsRef.current;
+    if (ws && ws.readyState === WebSocket.OPEN) {
+      ws.send(JSON.stringify({ type: "input", data }));
+    }
+  }, []);
+
+  // mandar la línea tipeada al shell
+  const executeCommand = useCallback(() => {
+    const cmd = currentCmd;
+
+    // comando local especial: clear (limpia sólo la vista)
+    if (cmd.trim() === "clear") {
+      setOutput("");
       setCurrentCmd("");
       setError("");
       setSearchTerm("");
@@ -269,37 +343,27 @@ export default function ExecModal({ containerId, onClose }) {
       return;
     }
 
-    try {
-      setError("");
-      const response = await runContainerCommand(containerId, cmd);
-      // backend: { stdout, stderr, returncode }
-      const { stdout, stderr, returncode } = response.data;
-
-      // luego de ejecutar queremos scrollear abajo
-      stickToBottomRef.current = true;
-
-      setHistory((prev) => [
-        ...prev,
-        {
-          command: cmd,
-          stdout: stdout || "",
-          stderr: stderr || "",
-          returncode,
-        },
-      ]);
-
-      setCurrentCmd("");
-    } catch (err) {
-      setError("Failed to execute command");
-      stickToBottomRef.current = true;
+    if (session === "closed") {
+      setSessionNonce((n) => n + 1);
+      return;
     }
-  }, [containerId, currentCmd]);
 
-  // Enter ejecuta, Shift+Enter = newline
+    stickToBottomRef.current = true;
+    sendInput(cmd + "\n");
+    setCurrentCmd("");
+  }, [currentCmd, session, sendInput]);
+
+  // Enter manda la línea, Shift+Enter = newline, Ctrl+C (sin texto) = interrumpir
   const handleKeyDown = (e) => {
     if (e.key === "Enter" && !e.shiftKey) {
       e.preventDefault();
       executeCommand();
+    } else if (e.ctrlKey && e.key === "c" && !currentCmd) {
+      e.preventDefault();
+      sendInput("\x03");
+    } else if (e.ctrlKey && e.key === "d" && !currentCmd) {
+      e.preventDefault();
+      sendInput("\x04");
     }
   };
 
@@ -529,7 +593,7 @@ export default function ExecModal({ containerId, onClose }) {
 
   // ===== limpiar buffer =====
   const clearBuffer = () => {
-    setHistory([]);
+    setOutput("");
     setError("");
     setSearchTerm("");
     setMatches([]);
@@ -877,7 +941,7 @@ export default function ExecModal({ containerId, onClose }) {
             value={currentCmd}
             onChange={(e) => setCurrentCmd(e.target.value)}
             onKeyDown={handleKeyDown}
-            placeholder="Type a command and press Enter… (use 'clear' to clear)"
+            placeholder="Type a command and press Enter… (Ctrl+C interrupts, 'clear' clears)"
             style={{
               flex: "1 1 auto",
               minHeight: "2.2rem",
@@ -6,7 +6,7 @@ import React, {
   useRef,
   useLayoutEffect,
 } from "react";
-import { getContainerLogs } from "../api";
+import { streamContainerLogs } from "../api";
 import { FaSync, FaCopy, FaDownload, FaSearch } from "react-icons/fa";
 
 // escapador para la regex del buscador
@@ -150,26 +150,50 @@ export default function LogsModal({ containerId, onClose }) {
     startH: 0,
   });
 
-  // ===== API: traer logs =====
-  const fetchLogs = useCallback(async () => {
-    try {
-      setError("");
-      const response = await getContainerLogs(containerId, lines);
-      const newText = response.data.logs || "";
+  // ===== API: traer logs (follow) =====
+  // Al cambiar containerId / lines (o con refresh) se abre un stream nuevo:
+  // primero llegan las últimas `lines` líneas y después las nuevas a medida
+  // que el contenedor las escribe.
+  const [streamNonce, setStreamNonce] = useState(0);
 
-      // luego de renderizar estos logs queremos scrollear al fondo
-      stickToBottomRef.current = true;
+  useEffect(() => {
+    const controller = new AbortController();
+    const maxLines = Math.max(lines, 2000);
+    let first = true;
+
+    setError("");
+    streamContainerLogs(containerId, {
+      tail: lines,
+      signal: controller.signal,
+      onLines: (entries) => {
+        const chunk = entries.map((e) => e.line + "\n").join("");
+        const el = logsContainerRef.current;
+        // seguir pegado al fondo sólo si el usuario no scrolleó hacia arriba
+        if (first || !el || el.scrollHeight - el.scrollTop - el.clientHeight < 40) {
+          stickToBottomRef.current = true;
+        }
+        const reset = first;
+        first = false;
+        setLogs((prev) => {
+          const text = (reset ? "" : prev) + chunk;
+          const all = text.split("\n");
+          // all termina en "" (la última línea trae \n)
+          return all.length - 1 > maxLines
+            ? all.slice(all.length - 1 - maxLines).join("\n")
+            : text;
+        });
+      },
+    }).catch((err) => {
+      if (err.name !== "AbortError") setError("Failed to fetch logs");
+    });
 
-      setLogs(newText);
-    } catch (err) {
-      setError("Failed to fetch logs");
-    }
-  }, [containerId, lines]);
+    return () => controller.abort();
+  }, [containerId, lines, streamNonce]);
 
-  // cargar logs al montar y cuando cambian containerId / lines
-  useEffect(() => {
-    fetchLogs();
-  }, [fetchLogs]);
+  const fetchLogs = useCallback(() => {
+    setLogs("");
+    setStreamNonce((n) => n + 1);
+  }, []);
 
   // cerrar con ESC
   useEffect(() => {